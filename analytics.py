@@ -0,0 +1,188 @@
+"""Response-time analytics maintained as trips progress.
+
+Every time a request is picked up or arrives, the elapsed minutes are added
+to a few summary rows: overall, per ambulance type and per area (a grid cell
+of the pickup point), both for all time and for the day it happened. Each
+summary keeps count/sum/min/max plus a log-bucket histogram (a DDSketch), so
+any percentile can be read back within ALPHA relative error. Updates are
+single-row upserts done in the caller's transaction, and reading a report
+touches only the summary rows of the requested days, never the trip history.
+"""
+import math
+
+import timeutil
+
+REQUEST_TO_PICKUP = 'request_to_pickup'
+PICKUP_TO_ARRIVAL = 'pickup_to_arrival'
+METRICS = (REQUEST_TO_PICKUP, PICKUP_TO_ARRIVAL)
+DIMENSIONS = ('all', 'ambulance_type', 'area')
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+ALPHA = 0.02  # relative error of the percentiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+MIN_MINUTES = 0.01  # smaller durations share the lowest bucket
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analytics_summary (
+        metric TEXT NOT NULL,
+        period TEXT NOT NULL,      -- 'all' or a day, YYYY-MM-DD
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total REAL NOT NULL,
+        minimum REAL NOT NULL,
+        maximum REAL NOT NULL,
+        PRIMARY KEY (metric, period, dimension, value)
+    );
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS analytics_buckets (
+        metric TEXT NOT NULL,
+        period TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (metric, period, dimension, value, bucket)
+    );
+    ''')
+
+
+def bucket_of(minutes):
+    return math.ceil(math.log(max(minutes, MIN_MINUTES), GAMMA))
+
+
+def bucket_value(bucket):
+    # Midpoint of the bucket's range, within ALPHA of every value in it
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def area_of(lat, lng, cell_deg):
+    if lat is None or lng is None:
+        return 'unknown'
+    return f"{math.floor(lat / cell_deg) * cell_deg:.3f},{math.floor(lng / cell_deg) * cell_deg:.3f}"
+
+
+def observe(cursor, metric, minutes, at_ms, groups):
+    """Add one duration to the summaries of every (dimension, value) group, for all time and its day."""
+    bucket = bucket_of(minutes)
+    for period in ('all', timeutil.from_ms(at_ms).strftime('%Y-%m-%d')):
+        for dimension, value in groups:
+            key = (metric, period, dimension, value)
+            cursor.execute('''INSERT INTO analytics_summary (metric, period, dimension, value, count, total, minimum, maximum)
+                              VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+                              ON CONFLICT(metric, period, dimension, value) DO UPDATE SET
+                                  count = count + 1, total = total + excluded.total,
+                                  minimum = MIN(minimum, excluded.minimum), maximum = MAX(maximum, excluded.maximum)''',
+                           (*key, minutes, minutes, minutes))
+            cursor.execute('''INSERT INTO analytics_buckets (metric, period, dimension, value, bucket, count)
+                              VALUES (?, ?, ?, ?, ?, 1)
+                              ON CONFLICT(metric, period, dimension, value, bucket) DO UPDATE SET count = count + 1''',
+                           (*key, bucket))
+
+
+def record_transition(cursor, request_id, status, area_deg, at=None):
+    """Stamp pickup/arrival times on a status change and feed the new durations to the summaries.
+
+    Safe to call on every status update: each timestamp is only set once, and
+    a duration is only counted when its end timestamp is set here.
+    """
+    if status == 'Patient Received':
+        column, metric, start_column = 'pickup_time', REQUEST_TO_PICKUP, 'request_time_ms'
+    elif status == 'Patient Reached':
+        column, metric, start_column = 'arrival_time', PICKUP_TO_ARRIVAL, 'pickup_time_ms'
+    else:
+        return None
+
+    at_ms = timeutil.to_ms(at) if at else timeutil.now_ms()
+    cursor.execute(f'UPDATE ambulance_requests SET {column} = ?, {column}_ms = ? WHERE id = ? AND {column} IS NULL',
+                   (timeutil.iso(at_ms), at_ms, request_id))
+    if cursor.rowcount == 0:
+        return None
+
+    cursor.execute(f'SELECT {start_column}, ambulance_type, origin_lat, origin_lng FROM ambulance_requests WHERE id = ?',
+                   (request_id,))
+    start_ms, ambulance_type, lat, lng = cursor.fetchone()
+    minutes = timeutil.minutes_between(start_ms, at_ms)
+    if minutes is None or minutes < 0:
+        return None
+    observe(cursor, metric, minutes, at_ms, [('all', 'all'),
+                                          ('ambulance_type', ambulance_type or 'unknown'),
+                                          ('area', area_of(lat, lng, area_deg))])
+    return minutes
+
+
+def report(cursor, dimension='all', periods=None):
+    """Summaries per metric and group value; `periods` is a list of days, or None for all time.
+
+    Reads at most len(periods) summary rows and their buckets per group, so the
+    cost depends on the number of groups and days asked for, not on history.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension!r}")
+    periods = periods or ['all']
+    placeholders = ', '.join('?' for _ in periods)
+
+    result = {metric: {} for metric in METRICS}
+    cursor.execute(f'''SELECT metric, value, SUM(count), SUM(total), MIN(minimum), MAX(maximum)
+                       FROM analytics_summary WHERE dimension = ? AND period IN ({placeholders})
+                       GROUP BY metric, value''', (dimension, *periods))
+    for metric, value, count, total, minimum, maximum in cursor.fetchall():
+        result[metric][value] = {'count': count, 'mean': round(total / count, 2),
+                                 'min': round(minimum, 2), 'max': round(maximum, 2)}
+
+    cursor.execute(f'''SELECT metric, value, bucket, SUM(count) FROM analytics_buckets
+                       WHERE dimension = ? AND period IN ({placeholders})
+                       GROUP BY metric, value, bucket ORDER BY metric, value, bucket''', (dimension, *periods))
+    histograms = {}
+    for metric, value, bucket, count in cursor.fetchall():
+        histograms.setdefault((metric, value), []).append((bucket, count))
+    for (metric, value), buckets in histograms.items():
+        summary = result[metric].get(value)
+        if summary:
+            summary.update(quantiles(buckets, summary['count'], summary['min'], summary['max']))
+    return result
+
+
+def quantiles(buckets, count, minimum, maximum):
+    # Percentiles from sorted (bucket, count) pairs, clamped to the exact min/max
+    values = {}
+    for q in QUANTILES:
+        rank = q * (count - 1)
+        seen = 0
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            if seen > rank:
+                values[f"p{round(q * 100)}"] = round(min(max(bucket_value(bucket), minimum), maximum), 2)
+                break
+    return values
+
+
+def rebuild(conn, source='ambulance_requests', area_deg=0.05):
+    """Recompute all summaries from the stored pickup/arrival times (one full scan, for backfills)."""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM analytics_summary')
+    cursor.execute('DELETE FROM analytics_buckets')
+    rows = conn.execute(f'''SELECT request_time_ms, pickup_time_ms, arrival_time_ms, ambulance_type, origin_lat, origin_lng
+                            FROM {source}''').fetchall()
+    for request_time_ms, pickup_time_ms, arrival_time_ms, ambulance_type, lat, lng in rows:
+        groups = [('all', 'all'), ('ambulance_type', ambulance_type or 'unknown'), ('area', area_of(lat, lng, area_deg))]
+        for metric, start_ms, end_ms in ((REQUEST_TO_PICKUP, request_time_ms, pickup_time_ms),
+                                         (PICKUP_TO_ARRIVAL, pickup_time_ms, arrival_time_ms)):
+            minutes = timeutil.minutes_between(start_ms, end_ms)
+            if minutes is not None and minutes >= 0:
+                observe(cursor, metric, minutes, end_ms, groups)
+    conn.commit()
+    return len(rows)
+
+
+if __name__ == '__main__':
+    # Backfill: python analytics.py
+    import config
+    import shards
+
+    conn = shards.ShardMap('users.db', config.SHARD_REGIONS).connect_all(config.ARCHIVE_DB)
+    print(f"Rebuilt analytics from {rebuild(conn, 'all_requests', config.ANALYTICS_AREA_DEG)} requests.")
+    conn.close()
@@ -1,30 +1,43 @@
 import os
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, session, has_request_context
 from werkzeug.security import check_password_hash, generate_password_hash
-from flask_mail import Mail
-from flask_mail import Message
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import math
 from math import radians, sin, cos, sqrt, atan2
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 import requests
-import googlemaps
 import threading
 import time
-import io
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.units import inch
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
-from functools import wraps
+from functools import lru_cache, wraps
+import click
+import config
+from dispatch import DispatchEngine
+from geofence import GeofenceEngine, PICKUP, DESTINATION
+from spatial import haversine_km
+from scaleout import LeaderLease, socketio_options
+import assets
+from response_cache import TTLCache, conditional_json, make_etag
+from fragment_cache import FragmentCache
+from gps_filter import FixFilter
+import wire
+from trajectory import TrajectoryStore
+import routing
+import locations
+import report_jobs
+import timeutil
+import archive
+import backup
+import shards
+import export
+import analytics
+import heatmap
+import dashboard_feed
+import hospital_grid
+from markupsafe import Markup
 
 app = Flask(__name__)
 CORS(app)
@@ -34,11 +47,18 @@ load_dotenv()
 
 app.secret_key = os.getenv('SECRET_KEY')
 api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-socketio = SocketIO(app)
+# Bound to the app (and its message queue) in create_app()
+socketio = SocketIO()
 
 
-# Initialize Google Maps API client
-gmaps = googlemaps.Client(key=api_key)
+# Google Maps API client, created on first use
+@lru_cache(maxsize=None)
+def get_gmaps():
+    import googlemaps
+    return googlemaps.Client(key=api_key)
+
+# Requests and their GPS history are split by region across shard files (see shards.py)
+shard_map = shards.ShardMap('users.db', config.SHARD_REGIONS)
 
 # Database initialization
 
@@ -106,6 +126,9 @@ def init_db():
     conn = sqlite3.connect('users.db')
     cursor = conn.cursor()
 
+    # WAL lets long readers (exports, reports) run without blocking writes; the setting is stored in the file
+    cursor.execute('PRAGMA journal_mode=WAL')
+
     # Check if the new columns are present
     cursor.execute("PRAGMA table_info(ambulance_requests);")
     columns = [column[1] for column in cursor.fetchall()]
@@ -131,12 +154,181 @@ def init_db():
         cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN status TEXT;')
         print("Added status column.")
 
+    if 'assigned_unit_id' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN assigned_unit_id INTEGER;')
+        print("Added assigned_unit_id column.")
+
+    if 'arrival_time' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN arrival_time TEXT;')
+        print("Added arrival_time column.")
+
+    if 'pickup_time' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN pickup_time TEXT;')
+        print("Added pickup_time column.")
+
+    # Trip fields worked out once at booking so tracking needs no external calls
+    if 'destination_address' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN destination_address TEXT;')
+        print("Added destination_address column.")
+
+    if 'route_distance_km' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN route_distance_km REAL;')
+        print("Added route_distance_km column.")
+
+    # Road route to the destination as an encoded polyline, fetched once per trip (see routing.py)
+    if 'route_polyline' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN route_polyline TEXT;')
+        print("Added route_polyline column.")
+
+    if 'route_duration_seconds' not in columns:
+        cursor.execute('ALTER TABLE ambulance_requests ADD COLUMN route_duration_seconds REAL;')
+        print("Added route_duration_seconds column.")
+
+    # Indexing 'patient_name' for tracking and dashboard lookups by name
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_patient_name ON ambulance_requests(patient_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON ambulance_requests(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_ambulance ON ambulance_locations(ambulance_id)')
+
+    # Response-time summaries, updated as trips are picked up and completed
+    analytics.create_tables(cursor)
+
+    # Request origin counts per map-tile cell for the demand heatmap
+    heatmap.create_tables(cursor)
+
+    # Sequenced deltas pushed to open dashboards
+    dashboard_feed.create_tables(cursor)
+
+    # PDF report jobs and their results, shared by all workers
+    report_jobs.create_tables(cursor)
+
+    # Hospital list of the service area and each grid cell's ranked nearest hospitals
+    hospital_grid.create_tables(cursor)
+
+    # Fixes stored by gateway.py, waiting to be tracked like the app's own
+    locations.create_tables(cursor)
+
+    # Requests moved to the archive database, per status, so totals stay complete
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_counts (
+        status TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    ''')
+
+    # Read model with the latest fix of every ambulance, maintained on write
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'ambulance_latest';")
+    if cursor.fetchone() is None:
+        cursor.execute('''
+        CREATE TABLE ambulance_latest (
+            ambulance_id INTEGER PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            timestamp TEXT,
+            status TEXT,
+            patient_name TEXT,
+            pickup_lat REAL,
+            pickup_lng REAL,
+            destination_lat REAL,
+            destination_lng REAL,
+            request_time TEXT,
+            estimated_time_minutes INTEGER,
+            pickup_address TEXT,
+            destination_address TEXT,
+            route_distance_km REAL
+        );
+        ''')
+        # Backfill from the newest history row of every ambulance
+        cursor.execute('''
+        INSERT INTO ambulance_latest (ambulance_id, latitude, longitude, timestamp, status,
+                                      patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng,
+                                      request_time, estimated_time_minutes,
+                                      pickup_address, destination_address, route_distance_km)
+        SELECT al.ambulance_id, al.latitude, al.longitude, al.timestamp, al.status,
+               ar.patient_name, ar.pickup_lat, ar.pickup_lng, ar.destination_lat, ar.destination_lng,
+               ar.request_time, ar.estimated_time_minutes,
+               ar.pickup_location, ar.destination_address, ar.route_distance_km
+        FROM ambulance_locations al
+        LEFT JOIN ambulance_requests ar ON al.ambulance_id = ar.id
+        WHERE al.id IN (SELECT MAX(id) FROM ambulance_locations GROUP BY ambulance_id);
+        ''')
+        print("Created ambulance_latest table.")
+
+    cursor.execute("PRAGMA table_info(ambulance_latest);")
+    latest_columns = [column[1] for column in cursor.fetchall()]
+    for column, column_type in (('pickup_address', 'TEXT'), ('destination_address', 'TEXT'), ('route_distance_km', 'REAL')):
+        if column not in latest_columns:
+            cursor.execute(f'ALTER TABLE ambulance_latest ADD COLUMN {column} {column_type};')
+            print(f"Added {column} column to ambulance_latest.")
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_latest_patient_name ON ambulance_latest(patient_name)')
+
+    # Integer epoch-millisecond copies of the timestamps (see timeutil.py); existing rows are converted once
+    for table, text_column, ms_column in TIMESTAMP_COLUMNS:
+        cursor.execute(f"PRAGMA table_info({table});")
+        if ms_column not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {ms_column} INTEGER;')
+            print(f"Added {ms_column} column to {table}; converted {backfill_ms(cursor, table, text_column, ms_column)} rows.")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_ambulance_time ON ambulance_locations(ambulance_id, timestamp_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_time ON ambulance_locations(timestamp_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_request_time ON ambulance_requests(request_time_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_status_completion ON ambulance_requests(status, estimated_completion_ms)')
+
+    # Version counter per block of DASHBOARD_BUCKET_SIZE request ids; a change to a
+    # request bumps its block so the dashboard re-renders only that block
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dashboard_versions (
+        bucket INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO dashboard_versions (bucket, version) SELECT DISTINCT id / ?, 1 FROM ambulance_requests',
+                   (DASHBOARD_BUCKET_SIZE,))
+    # Triggers catch every writer (booking, status updates, deletes, dispatch, geofences, other workers)
+    bump = f'''INSERT INTO dashboard_versions (bucket, version) VALUES ({{row}}.id / {DASHBOARD_BUCKET_SIZE}, 1)
+               ON CONFLICT(bucket) DO UPDATE SET version = version + 1;'''
+    for name, event, row in (('insert', 'INSERT', 'NEW'),
+                             ('update', 'UPDATE OF patient_name, pickup_location, destination, status, contact, '
+                                        'estimated_arrival_time, estimated_completion_time', 'NEW'),
+                             ('delete', 'DELETE', 'OLD')):
+        cursor.execute(f'DROP TRIGGER IF EXISTS dashboard_version_{name}')
+        cursor.execute(f'CREATE TRIGGER dashboard_version_{name} AFTER {event} ON ambulance_requests BEGIN {bump.format(row=row)} END')
+
     conn.commit()
     conn.close()
+
+    # Region shards get the same request and location tables, indexes and triggers
+    shard_map.create_tables()
     print("Database schema updated successfully.")
 
-# Call the function to initialize the database when the app starts
-init_db()
+# Request ids per cached block of dashboard rows (baked into the version triggers)
+DASHBOARD_BUCKET_SIZE = 100
+
+# (table, legacy text column, epoch-millisecond column)
+TIMESTAMP_COLUMNS = (
+    ('ambulance_locations', 'timestamp', 'timestamp_ms'),
+    ('ambulance_latest', 'timestamp', 'timestamp_ms'),
+    ('ambulance_latest', 'request_time', 'request_time_ms'),
+    ('ambulance_requests', 'request_time', 'request_time_ms'),
+    ('ambulance_requests', 'pickup_time', 'pickup_time_ms'),
+    ('ambulance_requests', 'arrival_time', 'arrival_time_ms'),
+    ('ambulance_requests', 'estimated_arrival_time', 'estimated_arrival_ms'),
+    ('ambulance_requests', 'estimated_completion_time', 'estimated_completion_ms'),
+)
+
+def backfill_ms(cursor, table, text_column, ms_column, batch_size=5000):
+    # Parse the legacy values once, in rowid order and in batches
+    converted, last_rowid = 0, 0
+    while True:
+        cursor.execute(f'''SELECT rowid, {text_column} FROM {table}
+                           WHERE rowid > ? AND {text_column} IS NOT NULL ORDER BY rowid LIMIT ?''', (last_rowid, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return converted
+        last_rowid = rows[-1][0]
+        cursor.executemany(f'UPDATE {table} SET {ms_column} = ? WHERE rowid = ?',
+                           [(timeutil.to_ms(value), rowid) for rowid, value in rows])
+        converted += len(rows)
+
 
 # Register the datetime adapter for SQLite
 def adapt_datetime(dt):
@@ -149,6 +341,33 @@ sqlite3.register_adapter(datetime, adapt_datetime)  # Register the adapter
 sqlite3.register_converter("datetime", convert_datetime)  # Register the converter
 
 
+def load_trajectory(ambulance_id, limit):
+    # Last fixes of an ambulance from the history, oldest first, for a cold trajectory buffer
+    conn = shard_map.connect(ambulance_id)
+    rows = conn.execute('''SELECT latitude, longitude, timestamp_ms FROM ambulance_locations
+                           WHERE ambulance_id = ? AND timestamp_ms IS NOT NULL
+                           ORDER BY timestamp_ms DESC LIMIT ?''', (ambulance_id, limit)).fetchall()
+    conn.close()
+    return [(latitude, longitude, timestamp_ms / 1000) for latitude, longitude, timestamp_ms in reversed(rows)]
+
+# Ring buffers of the latest fixes per ambulance, for speed and other hot-path calculations
+trajectories = TrajectoryStore(capacity=config.TRAJECTORY_CAPACITY, max_ambulances=config.TRAJECTORY_MAX_AMBULANCES,
+                               loader=load_trajectory)
+
+def trajectory_key(ambulance_id):
+    # Ids arrive as ints from routes and sockets but as strings from forms
+    try:
+        return int(ambulance_id)
+    except (TypeError, ValueError):
+        return ambulance_id
+
+def record_location(cursor, ambulance_id, latitude, longitude, status=None, timestamp_ms=None, schema='main'):
+    # Store the fix (history plus latest position) and keep the in-memory trajectory in step
+    timestamp_ms = locations.record(cursor, ambulance_id, latitude, longitude, status, timestamp_ms, schema)
+    if latitude is not None and longitude is not None:
+        trajectories.append(trajectory_key(ambulance_id), latitude, longitude, timestamp_ms / 1000)
+
+
 def reverse_geocode_for_address(address):
     open_cage_api_key  = os.getenv('OPENCAGE_API_KEY')  # Retrieve API key from environment
     if not open_cage_api_key :
@@ -189,7 +408,7 @@ def insert_ambulance_request(user_id, patient_name, contact, pickup_location, de
         flash("Destination coordinates are missing.", "danger")
         return redirect(url_for('some_route'))  # Redirect or handle error accordingly
 
-    conn = sqlite3.connect('users.db')
+    conn = shard_map.connect(shard=shard_map.shard_of_point(origin_lat, origin_lng))
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -257,6 +476,16 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Decorator to require any logged-in admin
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('logged_in'):
+            flash("Please log in to continue.", 'error')
+            return redirect(url_for('admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
 # Route to Add Admin
 @app.route('/add_admin', methods=['POST'])
 @admin_required
@@ -328,66 +557,119 @@ def reset_password():
     flash(f'Password for {admin_username} has been reset successfully!', 'success')
     return redirect(url_for('admin_dashboard'))
 
+# Rendered dashboard rows: single rows keyed by their content, blocks of rows by version
+dashboard_rows = FragmentCache()
+dashboard_blocks = FragmentCache()
+
+DASHBOARD_COLUMNS = 'id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time, estimated_completion_time'
+
+def render_request_row(req):
+    # A row's HTML depends only on its values, so the values are the cache key
+    return dashboard_rows.render(tuple(req), None, lambda: render_template('_request_row.html', req=req))
+
+def render_request_block(cursor, bucket, version):
+    def render():
+        cursor.execute(f'''SELECT {DASHBOARD_COLUMNS} FROM live_requests
+                          WHERE id >= ? AND id < ? ORDER BY id''',
+                       (bucket * DASHBOARD_BUCKET_SIZE, (bucket + 1) * DASHBOARD_BUCKET_SIZE))
+        return ''.join(render_request_row(req) for req in cursor.fetchall())
+    return dashboard_blocks.render(bucket, version, render)
+
 # Admin Dashboard Route
 @app.route('/admin_dashboard', methods=['GET', 'POST'])
 def admin_dashboard():
     search_query = request.args.get('search', '')  # Get search query, default to empty string
 
-    conn = sqlite3.connect('users.db')
+    # Rows and counts span every shard
+    conn = shard_map.connect_all()
     cursor = conn.cursor()
 
+    # Live updates continue from the last delta included in the rows below
+    dashboard_seq = dashboard_feed.current_seq(cursor)
+
     # If there's a search query, filter by patient_name using LIKE operator
     if search_query:
         search_query = '%' + search_query + '%'
-        cursor.execute('''SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time
-                          FROM ambulance_requests
-                          WHERE patient_name LIKE ? OR contact LIKE ?''', (search_query, search_query))
+        # Searches also cover archived requests
+        history = connect_history()
+        matches = history.execute(f'''SELECT {DASHBOARD_COLUMNS}
+                                      FROM all_requests
+                                      WHERE patient_name LIKE ? OR contact LIKE ?''', (search_query, search_query)).fetchall()
+        history.close()
+        request_rows = ''.join(render_request_row(req) for req in matches)
     else:
-        # Get all ambulance requests without any filter
-        cursor.execute('''SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time
-                          FROM ambulance_requests''')
-    
-    all_requests = cursor.fetchall()
-
-    # Get requests by status (new, on the way, etc.)
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "New"')
-    new_requests = cursor.fetchall()
+        # All requests, block by block; only blocks whose version moved are queried and re-rendered
+        cursor.execute('SELECT bucket, version FROM live_dashboard_versions ORDER BY bucket')
+        request_rows = ''.join(render_request_block(cursor, bucket, version) for bucket, version in cursor.fetchall())
 
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "Started"')
-    on_the_way = cursor.fetchall()
-
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "Patient Received"')
-    patient_received = cursor.fetchall()
-
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "Patient Reached"')
-    patient_reached = cursor.fetchall()
-
-    # Additional statuses, if needed
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "Assigned"')
-    assigned_requests = cursor.fetchall()
-
-    cursor.execute('SELECT id, patient_name, pickup_location, destination, status, contact, estimated_arrival_time FROM ambulance_requests WHERE status = "Rejected"')
-    rejected_requests = cursor.fetchall()
+    # Request counts per status for the summary boxes
+    status_counts = dashboard_feed.status_counts(cursor, 'live_requests')
+    total_requests = len(matches) if search_query else sum(status_counts.values())
 
     # Fetch the admin usernames for the delete modal
     cursor.execute('SELECT username FROM admins')
     admins = cursor.fetchall()
-    print(admins)
 
     conn.close()
 
-    # Render the dashboard template with all the categories and admins passed
+    # Render the dashboard template with the counts, rows and admins passed
     return render_template('admin_dashboard.html', title="Admin Dashboard", 
-                           all_requests=all_requests, new_requests=new_requests,
-                           on_the_way=on_the_way, patient_received=patient_received,
-                           patient_reached=patient_reached, assigned_requests=assigned_requests,
-                           rejected_requests=rejected_requests, search_query=search_query,
-                           admins=admins)
+                           request_rows=Markup(request_rows), status_counts=status_counts,
+                           total_requests=total_requests, search_query=search_query,
+                           admins=admins, dashboard_seq=dashboard_seq)
+
+def other_shard_counts(shard):
+    # Committed status totals of every shard but this one
+    counts = {}
+    for status, count in shard_map.query_each('SELECT status, COUNT(*) FROM ambulance_requests GROUP BY status',
+                                              exclude=shard):
+        counts[status] = counts.get(status, 0) + count
+    return counts
+
+def record_dashboard_event(cursor, kind, request_id, other_counts=None):
+    # Store a dashboard delta in the caller's transaction; publish it after the commit
+    html = None
+    if kind == dashboard_feed.CREATED and has_request_context():
+        cursor.execute(f'SELECT {DASHBOARD_COLUMNS} FROM ambulance_requests WHERE id = ?', (request_id,))
+        row = cursor.fetchone()
+        if row:
+            html = render_request_row(row)
+    counts = None
+    if shard_map.sharded:
+        # Totals over every shard: this one through the caller's transaction, the others as committed
+        counts = dashboard_feed.status_counts(cursor)
+        if other_counts is None:
+            other_counts = other_shard_counts(shard_map.shard_of_id(request_id))
+        for status, count in other_counts.items():
+            counts[status] = counts.get(status, 0) + count
+    return dashboard_feed.record(cursor, kind, request_id, html, counts)
+
+def publish_dashboard_events(*events):
+    # Sent through the message queue, so dashboards connected to any worker get them
+    for event in events:
+        if event:
+            socketio.emit('dashboard_delta', event, to='dashboard')
+
+@socketio.on('dashboard_subscribe')
+def dashboard_subscribe(data):
+    # A dashboard (re)connects: join the live feed and catch up from the last delta it applied
+    if not session.get('logged_in'):
+        return
+    join_room('dashboard')
+    conn = sqlite3.connect('users.db')
+    events = dashboard_feed.since(conn.cursor(), int((data or {}).get('since', 0)))
+    conn.close()
+    if events is None:
+        emit('dashboard_backlog', {'reload': True})
+    else:
+        emit('dashboard_backlog', {'events': events})
 
 def auto_update_status():
     while True:
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
+        # Only the elected leader runs the scheduled status updates
+        if not leader.is_leader:
+            time.sleep(60)
+            continue
 
         # Get the current time
         current_time = datetime.now()
@@ -395,38 +677,402 @@ def auto_update_status():
         # Debugging: Print the current time for comparison
         print(f"Current time: {current_time}")
 
-        # Check for requests where the estimated completion time has passed
-        cursor.execute('''SELECT id, estimated_completion_time FROM ambulance_requests 
-                          WHERE status = 'Patient Received' ''')
-        
-        rows = cursor.fetchall()
-        
-        for row in rows:
-            request_id, estimated_completion_time = row
+        for shard in range(len(shard_map.paths)):
+            conn = shard_map.connect(shard=shard)
+            cursor = conn.cursor()
+
+            # Requests whose estimated completion time has passed (an index range scan, no parsing)
+            cursor.execute('''SELECT id FROM ambulance_requests
+                              WHERE status = 'Patient Received' AND estimated_completion_ms <= ?''', (timeutil.to_ms(current_time),))
             
-            # Convert the estimated_completion_time to a datetime object
-            try:
-                estimated_time = datetime.fromisoformat(estimated_completion_time)
-                print(f"Request {request_id}: Estimated time = {estimated_time}")
-                
-                # If the estimated time has passed, update the status
-                if current_time >= estimated_time:
-                    print(f"Updating status for request {request_id}")
-                    cursor.execute('''UPDATE ambulance_requests
-                                      SET status = 'Patient Reached'
-                                      WHERE id = ?''', (request_id,))
-                    conn.commit()
-            except ValueError:
-                print(f"Error parsing estimated completion time for request {request_id}")
-        
+            rows = cursor.fetchall()
+            
+            for (request_id,) in rows:
+                print(f"Updating status for request {request_id}")
+                cursor.execute('''UPDATE ambulance_requests
+                                  SET status = 'Patient Reached'
+                                  WHERE id = ?''', (request_id,))
+                release_unit(cursor, request_id)
+                event = record_dashboard_event(cursor, dashboard_feed.STATUS, request_id)
+                conn.commit()
+                publish_dashboard_events(event)
+                geofences.unregister(request_id)
+            conn.close()
+
+        # Deltas older than the retained backlog make a reconnecting dashboard reload instead
+        conn = sqlite3.connect('users.db')
+        cursor = conn.cursor()
+        dashboard_feed.prune(cursor, config.DASHBOARD_EVENTS_KEEP)
+        conn.commit()
         conn.close()
 
         # Sleep for a minute before checking again
         time.sleep(60)
 
-# Start the background task
-status_update_thread = threading.Thread(target=auto_update_status, daemon=True)
-status_update_thread.start()
+def connect_history():
+    # Connection for reports and searches over every shard and the archive (views all_requests / all_locations)
+    return shard_map.connect_all(config.ARCHIVE_DB)
+
+def archive_loop():
+    while True:
+        # Only the leader moves finished requests to the archive
+        if leader.is_leader:
+            for shard, path in enumerate(shard_map.paths):
+                try:
+                    moved = archive.archive_requests(path, config.ARCHIVE_DB, config.ARCHIVE_AFTER_DAYS,
+                                                     core_path=shard_map.paths[0] if shard else None)
+                    if moved:
+                        print(f"Archived {moved} finished requests from {path}.")
+                except Exception as e:
+                    print(f"Error archiving requests from {path}: {e}")
+        time.sleep(config.ARCHIVE_INTERVAL_SECONDS)
+
+def backup_loop():
+    while True:
+        time.sleep(config.BACKUP_INTERVAL_SECONDS)
+        # Only the leader takes the scheduled snapshots
+        if leader.is_leader:
+            for name, path in zip(shard_map.names, shard_map.paths):
+                try:
+                    stats = backup.snapshot(path, config.BACKUP_DIR, config.BACKUP_KEEP, config.BACKUP_PAGES_PER_STEP,
+                                            config.BACKUP_STEP_PAUSE_SECONDS, config.BACKUP_MAX_RESTARTS, prefix=name)
+                    print(f"Snapshot {stats['path']} written in {stats['copy_seconds']} s "
+                          f"({stats['steps']} steps, {stats['restarts']} restarts).")
+                except Exception as e:
+                    print(f"Error taking snapshot of {path}: {e}")
+
+def collect_hospitals(bounds, sweep_m):
+    # Hospitals of the service area from Places searches centred on a grid covering it
+    min_lat, min_lng, max_lat, max_lng = bounds
+    # Circles of radius sweep_m cover squares of side sweep_m * sqrt(2); longitude steps widen away from the equator
+    lat_step = sweep_m * math.sqrt(2) / 1000 / 111.32
+    lng_step = lat_step / max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 0.01)
+    hospitals = {}
+    lat = min_lat + lat_step / 2
+    while lat - lat_step / 2 < max_lat:
+        lng = min_lng + lng_step / 2
+        while lng - lng_step / 2 < max_lng:
+            for name, address, _, hospital_lat, hospital_lng in find_nearest_hospitals(lat, lng, sweep_m):
+                hospitals[(name, round(hospital_lat, 6), round(hospital_lng, 6))] = (name, address, hospital_lat, hospital_lng)
+            lng += lng_step
+        lat += lat_step
+    return list(hospitals.values())
+
+def refresh_hospital_grid():
+    bounds = hospital_grid.parse_bounds(config.HOSPITAL_GRID_BOUNDS)
+    hospitals = collect_hospitals(bounds, config.HOSPITAL_GRID_SWEEP_M)
+    if not hospitals:
+        # A failed sweep must not empty a working grid
+        print("No hospitals found in the service area; keeping the current grid.")
+        return
+    conn = sqlite3.connect('users.db', timeout=30)
+    rebuilt = hospital_grid.refresh(conn.cursor(), hospitals, bounds, config.HOSPITAL_GRID_CELL_DEG,
+                                    config.HOSPITAL_GRID_RADII_M, config.HOSPITAL_GRID_CANDIDATES)
+    conn.commit()
+    conn.close()
+    if rebuilt:
+        print(f"Nearest-hospital grid rebuilt for {len(hospitals)} hospitals.")
+
+def hospital_grid_loop():
+    while True:
+        # Only the leader sweeps Places; every worker reads the grid from users.db
+        if leader.is_leader:
+            try:
+                refresh_hospital_grid()
+            except Exception as e:
+                print(f"Error refreshing the nearest-hospital grid: {e}")
+        time.sleep(config.HOSPITAL_GRID_REFRESH_SECONDS)
+
+# Dispatch engine: spatial index of the available ambulances
+dispatcher = DispatchEngine(cell_deg=config.DISPATCH_CELL_DEG, speed_kmh=config.AMBULANCE_SPEED_KMH,
+                            candidates=config.DISPATCH_CANDIDATES, max_km=config.DISPATCH_MAX_KM)
+
+def get_unit_position(cursor, unit_id):
+    # Units report into the default database, also on a region shard's connection
+    cursor.execute(f'SELECT latitude, longitude FROM {shards.core_schema(cursor)}.units WHERE unit_id = ?', (unit_id,))
+    return cursor.fetchone()
+
+# Last unit_locations row applied to the dispatch index
+dispatch_sync = {'location_id': 0}
+
+def load_dispatch_state():
+    conn = sqlite3.connect('users.db')
+    cursor = conn.cursor()
+
+    # Latest fix of every unit; those reporting 'Available' can be dispatched
+    cursor.execute('SELECT unit_id, latitude, longitude, status FROM units')
+    for unit_id, latitude, longitude, status in cursor.fetchall():
+        if status == 'Available':
+            dispatcher.update_unit(unit_id, latitude, longitude)
+
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM unit_locations')
+    dispatch_sync['location_id'] = cursor.fetchone()[0]
+
+    conn.close()
+    print(f"Dispatch engine loaded {len(dispatcher.units)} available units.")
+
+def sync_units(cursor):
+    # Apply unit fixes recorded since the last sync, by this or any other worker
+    cursor.execute('''SELECT id, unit_id, latitude, longitude, status FROM unit_locations
+                      WHERE id > ? ORDER BY id''', (dispatch_sync['location_id'],))
+    for row_id, unit_id, latitude, longitude, status in cursor.fetchall():
+        dispatch_sync['location_id'] = row_id
+        if status == 'Available':
+            dispatcher.update_unit(unit_id, latitude, longitude)
+        elif status is None:
+            dispatcher.move_unit(unit_id, latitude, longitude)
+        else:
+            dispatcher.remove_unit(unit_id)
+
+def record_unit_status(cursor, unit_id, status):
+    # A location row at the unit's last position tells every worker about the change
+    position = get_unit_position(cursor, unit_id)
+    if position:
+        locations.record_unit(cursor, unit_id, position[0], position[1], status, schema=shards.core_schema(cursor))
+        if status == 'Available':
+            dispatcher.update_unit(unit_id, *position)
+    return position
+
+def save_assignments(cursor, assignments):
+    # Returns the dashboard deltas to publish once the caller has committed
+    events = []
+    for request_id, (unit_id, eta_minutes) in assignments.items():
+        estimated_arrival_ms = timeutil.after_ms(eta_minutes)
+        cursor.execute('''UPDATE ambulance_requests
+                          SET status = 'Assigned', assigned_unit_id = ?, estimated_arrival_time = ?, estimated_arrival_ms = ?
+                          WHERE id = ? AND status IN ('Pending', 'New')''',
+                       (unit_id, timeutil.iso(estimated_arrival_ms), estimated_arrival_ms, request_id))
+        if cursor.rowcount == 0:
+            # The request was cancelled or handled by hand meanwhile; free the unit again
+            position = get_unit_position(cursor, unit_id)
+            if position:
+                dispatcher.update_unit(unit_id, *position)
+        else:
+            record_unit_status(cursor, unit_id, 'Assigned')
+            events.append(record_dashboard_event(cursor, dashboard_feed.STATUS, request_id))
+            print(f"Assigned ambulance {unit_id} to request {request_id} (ETA {eta_minutes:.1f} min)")
+    return events
+
+def release_unit(cursor, request_id):
+    # Put the ambulance that served this request back into the pool
+    cursor.execute('SELECT assigned_unit_id FROM ambulance_requests WHERE id = ?', (request_id,))
+    row = cursor.fetchone()
+    if row and row[0] is not None:
+        record_unit_status(cursor, row[0], 'Available')
+
+def dispatch_loop():
+    while True:
+        # Collect bookings for a short window so simultaneous requests are solved together
+        time.sleep(config.DISPATCH_BATCH_SECONDS)
+        try:
+            conn = sqlite3.connect('users.db')
+            cursor = conn.cursor()
+
+            # Every worker keeps its in-memory indexes in step with the database
+            sync_units(cursor)
+            sync_geofences()
+            conn.close()
+
+            # Only the leader assigns, from the requests still waiting in the database, shard by shard
+            events = []
+            if leader.is_leader:
+                for shard in range(len(shard_map.paths)):
+                    conn = shard_map.connect(shard=shard)
+                    cursor = conn.cursor()
+                    cursor.execute('''SELECT id, origin_lat, origin_lng FROM ambulance_requests
+                                      WHERE status IN ('Pending', 'New') AND assigned_unit_id IS NULL''')
+                    assignments = dispatcher.dispatch(cursor.fetchall())
+                    events += save_assignments(cursor, assignments) if assignments else []
+                    conn.commit()
+                    conn.close()
+            publish_dashboard_events(*events)
+        except Exception as e:
+            print(f"Error dispatching ambulances: {e}")
+
+# Geofences around the pickup and destination of every active trip
+geofences = GeofenceEngine(cell_deg=config.GEOFENCE_CELL_DEG, debounce=config.GEOFENCE_DEBOUNCE_FIXES)
+
+# Dead-band, duplicate and rate filter in front of GPS writes and broadcasts
+fix_filter = FixFilter(min_distance_m=config.GPS_MIN_DISTANCE_M, min_interval_s=config.GPS_MIN_INTERVAL_SECONDS,
+                       heartbeat_s=config.GPS_HEARTBEAT_SECONDS)
+
+def register_trip_fences(request_id, status, origin_lat, origin_lng, destination_lat, destination_lng):
+    # Trip fixes are keyed by the request id, so its own fixes drive the fences
+    # The pickup fence only matters until the patient is on board
+    if status not in ('Patient Received', 'Patient Reached', 'Rejected') and origin_lat is not None and origin_lng is not None:
+        geofences.register(request_id, PICKUP, origin_lat, origin_lng, config.GEOFENCE_PICKUP_RADIUS_M)
+    if status not in ('Patient Reached', 'Rejected') and destination_lat is not None and destination_lng is not None:
+        geofences.register(request_id, DESTINATION, destination_lat, destination_lng, config.GEOFENCE_DESTINATION_RADIUS_M)
+
+def sync_geofences():
+    # Register fences for active trips on every shard and drop those finished elsewhere
+    rows = shard_map.query_each('''SELECT id, status, origin_lat, origin_lng, destination_lat, destination_lng
+                                   FROM ambulance_requests
+                                   WHERE status IN ('Pending', 'New', 'Assigned', 'Started', 'Patient Received')''')
+
+    active = set()
+    for request_id, status, origin_lat, origin_lng, destination_lat, destination_lng in rows:
+        active.add(request_id)
+        if status == 'Patient Received' and geofences.center(request_id, PICKUP) is not None:
+            # Picked up through another worker: from now on the destination fence means arrival
+            geofences.unregister(request_id, PICKUP)
+            geofences.rearm(request_id, DESTINATION)
+        register_trip_fences(request_id, status, origin_lat, origin_lng, destination_lat, destination_lng)
+    for request_id in set(geofences.tracker) - active:
+        geofences.unregister(request_id)
+    for request_id in set(trip_etas) - active:
+        trip_etas.pop(request_id, None)
+    return len(rows)
+
+def load_geofences():
+    count = sync_geofences()
+    print(f"Registered geofences for {count} active requests.")
+
+def apply_geofence_event(request_id, kind, event):
+    # Geofence events drive the trip status; nothing is written for ordinary fixes
+    if event != 'enter':
+        return None
+
+    conn = shard_map.connect(request_id)
+    cursor = conn.cursor()
+    new_status = None
+    event = None
+
+    if kind == PICKUP:
+        new_status = 'Patient Received'
+        estimated_completion_ms = None
+        pickup = geofences.center(request_id, PICKUP)
+        destination = geofences.center(request_id, DESTINATION)
+        if pickup and destination:
+            eta_minutes = (haversine_km(*pickup, *destination) / config.AMBULANCE_SPEED_KMH) * 60
+            estimated_completion_ms = timeutil.after_ms(eta_minutes)
+        cursor.execute('''UPDATE ambulance_requests SET status = ?, estimated_completion_time = ?, estimated_completion_ms = ?
+                          WHERE id = ? AND status NOT IN ('Patient Received', 'Patient Reached')''',
+                       (new_status, timeutil.iso(estimated_completion_ms), estimated_completion_ms, request_id))
+        if cursor.rowcount:
+            analytics.record_transition(cursor, request_id, new_status, config.ANALYTICS_AREA_DEG)
+            event = record_dashboard_event(cursor, dashboard_feed.STATUS, request_id)
+        geofences.unregister(request_id, PICKUP)
+        # Passing the hospital on the way to the patient doesn't count: only an entry after pickup is the arrival
+        geofences.rearm(request_id, DESTINATION)
+    elif kind == DESTINATION:
+        new_status = 'Patient Reached'
+        cursor.execute('''UPDATE ambulance_requests SET status = ?
+                          WHERE id = ? AND status = 'Patient Received' ''',
+                       (new_status, request_id))
+        if cursor.rowcount:
+            # Stamps arrival_time as well
+            analytics.record_transition(cursor, request_id, new_status, config.ANALYTICS_AREA_DEG)
+            release_unit(cursor, request_id)
+            event = record_dashboard_event(cursor, dashboard_feed.STATUS, request_id)
+            geofences.unregister(request_id)
+        else:
+            # Patient not on board yet: keep the trip's fences
+            new_status = None
+
+    conn.commit()
+    conn.close()
+    publish_dashboard_events(event)
+    return new_status
+
+# request_id -> completion estimate last seen in the database, so fixes that don't move it cost no round trip
+trip_etas = {}
+
+def refresh_trip_eta(request_id, eta_minutes):
+    # Keep the completion estimate of a trip with the patient on board in line with its live ETA;
+    # only changes of at least DASHBOARD_ETA_STEP_MINUTES are written and pushed
+    estimated_completion_ms = timeutil.after_ms(eta_minutes)
+    step_ms = round(config.DASHBOARD_ETA_STEP_MINUTES * 60_000)
+    known = trip_etas.get(request_id)
+    if known is not None and abs(estimated_completion_ms - known) < step_ms:
+        return
+
+    conn = shard_map.connect(request_id)
+    cursor = conn.cursor()
+    cursor.execute('''UPDATE ambulance_requests SET estimated_completion_time = ?, estimated_completion_ms = ?
+                      WHERE id = ? AND status = 'Patient Received'
+                        AND COALESCE(ABS(estimated_completion_ms - ?), ?) >= ?''',
+                   (timeutil.iso(estimated_completion_ms), estimated_completion_ms, request_id,
+                    estimated_completion_ms, step_ms, step_ms))
+    event = None
+    if cursor.rowcount:
+        trip_etas[request_id] = estimated_completion_ms
+        event = record_dashboard_event(cursor, dashboard_feed.ETA, request_id)
+    else:
+        # Close to the stored estimate (possibly written by another worker): compare with that from now on
+        cursor.execute("SELECT estimated_completion_ms FROM ambulance_requests WHERE id = ? AND status = 'Patient Received'",
+                       (request_id,))
+        row = cursor.fetchone()
+        if row and row[0] is not None:
+            trip_etas[request_id] = row[0]
+    conn.commit()
+    conn.close()
+    publish_dashboard_events(event)
+
+# Elects the process that runs the scheduled jobs; created by start_background_services()
+leader = None
+
+def create_app():
+    """Prepare the app for serving: schema, Socket.IO, assets and in-memory indexes.
+
+    Importing this module only defines the routes; nothing touches the
+    database, the network or starts a thread until this is called.
+    """
+    if app.extensions.get('ambulance_ready'):
+        return app
+    init_db()
+    socketio.init_app(app, **socketio_options(config.SOCKETIO_MESSAGE_QUEUE, config.SOCKETIO_WEBSOCKET_ONLY))
+    # Fingerprinted, precompressed static files from build_assets.py
+    assets.init_app(app)
+    load_dispatch_state()
+    load_geofences()
+    app.extensions['ambulance_ready'] = True
+    return app
+
+def start_background_services():
+    # Leader election plus the scheduled status and dispatch threads; once per process
+    global leader
+    if leader is not None:
+        return
+    leader = LeaderLease('users.db', ttl=config.LEADER_LEASE_SECONDS)
+    leader.start()
+
+    status_update_thread = threading.Thread(target=auto_update_status, daemon=True)
+    status_update_thread.start()
+    dispatch_thread = threading.Thread(target=dispatch_loop, daemon=True)
+    dispatch_thread.start()
+    archive_thread = threading.Thread(target=archive_loop, daemon=True)
+    archive_thread.start()
+    if config.BACKUP_INTERVAL_SECONDS > 0:
+        backup_thread = threading.Thread(target=backup_loop, daemon=True)
+        backup_thread.start()
+    if config.GATEWAY_POLL_SECONDS > 0:
+        gateway_thread = threading.Thread(target=gateway_fix_loop, daemon=True)
+        gateway_thread.start()
+    if config.HOSPITAL_GRID_BOUNDS:
+        hospital_grid_thread = threading.Thread(target=hospital_grid_loop, daemon=True)
+        hospital_grid_thread.start()
+
+@app.route('/nearest_ambulances/<int:req_id>', methods=['GET'])
+def nearest_ambulances(req_id):
+    k = request.args.get('k', type=int, default=3)
+
+    conn = shard_map.connect(req_id)
+    cursor = conn.cursor()
+    cursor.execute('SELECT origin_lat, origin_lng FROM ambulance_requests WHERE id = ?', (req_id,))
+    origin = cursor.fetchone()
+    conn.close()
+
+    if not origin:
+        return jsonify({'error': 'Request not found'}), 404
+
+    return jsonify({
+        'request_id': req_id,
+        'ambulances': [
+            {'ambulance_id': unit_id, 'distance_km': round(distance_km, 2), 'eta_minutes': round(eta_minutes, 2)}
+            for unit_id, distance_km, eta_minutes in dispatcher.nearest_units(origin[0], origin[1], k)
+        ]
+    })
 
 def execute_query(query, params=()):
     # Connect to the SQLite database
@@ -455,54 +1101,205 @@ def get_coordinates(location):
             return lat, lng
     return None, None
 
-@socketio.on('update_location')
-def handle_location_update(data):
-    import math
-    ambulance_id = data['ambulance_id']
-    latitude = data['latitude']
-    longitude = data['longitude']
+# Decoded routes of active trips, and trips whose route lookup (stored or Directions) must wait before it is retried
+trip_routes = TTLCache(ttl=config.ROUTE_CACHE_SECONDS, max_entries=4096)
+route_fetch_backoff = TTLCache(ttl=config.ROUTE_RETRY_SECONDS, max_entries=4096)
 
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
+def load_trip_route(request_id):
+    # The route stored with the trip by this or any other worker
+    conn = shard_map.connect(request_id)
+    row = conn.execute('SELECT route_polyline, route_duration_seconds FROM ambulance_requests WHERE id = ?',
+                       (request_id,)).fetchone()
+    conn.close()
+    return routing.Route(*row) if row and row[0] else None
 
-    # Update the current location of the ambulance
-    cursor.execute('''UPDATE ambulance_locations
-                      SET latitude = ?, longitude = ?, last_updated = ?
-                      WHERE ambulance_id = ?''',
-                   (latitude, longitude, datetime.now(), ambulance_id))
+def fetch_trip_route(request_id, latitude, longitude, destination):
+    # Driving route from the vehicle's position; route_progress() makes this at most once per trip per ROUTE_RETRY_SECONDS
+    try:
+        parsed = routing.parse_directions(get_gmaps().directions(
+            f"{latitude},{longitude}", f"{destination[0]},{destination[1]}", mode='driving', departure_time='now'))
+    except Exception as e:
+        print(f"Error fetching the route for request {request_id}: {e}")
+        return None
+    if not parsed:
+        return None
+
+    route = routing.Route(*parsed)
+    conn = shard_map.connect(request_id)
+    conn.execute('UPDATE ambulance_requests SET route_polyline = ?, route_duration_seconds = ? WHERE id = ?',
+                 (route.polyline, route.duration_s, request_id))
     conn.commit()
+    conn.close()
+    return route
+
+def route_progress(request_id, latitude, longitude, destination):
+    """(remaining road km, ETA minutes) for a fix on the trip's route, or None when there is no route.
+
+    The cached route is tried first, then the one stored with the trip (another
+    worker may have re-routed), and only then is a new route fetched. The last
+    two happen at most once per trip per ROUTE_RETRY_SECONDS, so a trip off its
+    route or without one costs no database round trip per fix.
+    """
+    cached = trip_routes.get(request_id)
+    route = cached[0] if cached else None
+    if route:
+        progress = follow_route(route, latitude, longitude)
+        if progress:
+            return progress
+
+    if route_fetch_backoff.get(request_id):
+        return None
+    route_fetch_backoff.set(request_id, True)
 
-    # Fetch the destination coordinates from the request
-    cursor.execute('SELECT destination_lat, destination_lng FROM ambulance_requests WHERE ambulance_id = ?', (ambulance_id,))
-    destination = cursor.fetchone()
+    stored = load_trip_route(request_id)
+    if stored and (route is None or stored.polyline != route.polyline):
+        progress = follow_route(stored, latitude, longitude)
+        if progress:
+            trip_routes.set(request_id, stored)
+            return progress
 
-    if destination:
-        dest_lat, dest_lng = destination
+    route = fetch_trip_route(request_id, latitude, longitude, destination)
+    if route is None:
+        return None
+    trip_routes.set(request_id, route)
+    # A fresh route starts where the vehicle is, even if it is not on a road yet
+    return follow_route(route, latitude, longitude, max_offset_m=float('inf'))
+
+def follow_route(route, latitude, longitude, max_offset_m=None):
+    max_offset_m = config.ROUTE_DEVIATION_M if max_offset_m is None else max_offset_m
+    offset_m, remaining_km = route.project(latitude, longitude, config.ROUTE_DEVIATION_M)
+    if offset_m > max_offset_m:
+        return None
+    return remaining_km, route.eta_minutes(remaining_km, config.AMBULANCE_SPEED_KMH)
 
-        # Calculate the distance using the Haversine formula
-        distance_km = haversine(latitude, longitude, dest_lat, dest_lng)
+# Socket.IO clients receive location updates as JSON unless they ask for the binary layout in wire.py
+WIRE_ROOMS = {'json': 'wire_json', 'binary': 'wire_binary'}
 
-        # If the ambulance is close enough (200 meters), update the status to "Patient Reached"
-        if distance_km <= 0.2:
-            cursor.execute('UPDATE ambulance_requests SET status = "Patient Reached" WHERE ambulance_id = ?', (ambulance_id,))
-            conn.commit()
-            emit('status_update', {'ambulance_id': ambulance_id, 'status': 'Patient Reached'}, broadcast=True)
+@socketio.on('connect')
+def handle_connect():
+    join_room(WIRE_ROOMS['json'])
 
-        # Calculate the ETA (assuming an average speed of 80 km/h)
-        speed_kmh = 80
-        eta_minutes = (distance_km / speed_kmh) * 60
+@socketio.on('wire_format')
+def handle_wire_format(wire_format):
+    if wire_format not in WIRE_ROOMS:
+        return {'error': 'Unknown format'}
+    for name, room in WIRE_ROOMS.items():
+        (join_room if name == wire_format else leave_room)(room)
+    return {'format': wire_format}
 
-        # Broadcast the location update with distance and ETA
-        emit('location_update', {
+@socketio.on('update_location')
+def handle_location_update(data):
+    # Either a JSON dict or packed fixes (wire.FIX), possibly several buffered ones
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            fixes = list(wire.decode_fixes(data))
+        except ValueError:
+            return
+        for ambulance_id, latitude, longitude, age_s in fixes:
+            try:
+                fix = locations.validate_fix(ambulance_id, latitude, longitude)
+            except ValueError:
+                continue
+            ingest_location(*fix, age_s)
+    else:
+        try:
+            fix = locations.validate_fix(data.get('ambulance_id'), data.get('latitude'), data.get('longitude'))
+        except (AttributeError, ValueError):
+            return
+        ingest_location(*fix)
+
+def fix_timestamp(age_s):
+    # Buffered fixes keep the time they were taken
+    return timeutil.now_ms() - round(age_s * 1000) if age_s else None
+
+def ingest_location(ambulance_id, latitude, longitude, age_s=0):
+    # Fixes that add nothing new are neither stored nor broadcast
+    accepted = fix_filter.accept(ambulance_id, latitude, longitude, now=time.monotonic() - age_s)
+    if accepted:
+        conn = shard_map.connect(ambulance_id)
+        cursor = conn.cursor()
+
+        # Record the new position of the ambulance
+        record_location(cursor, ambulance_id, latitude, longitude, timestamp_ms=fix_timestamp(age_s))
+        conn.commit()
+        conn.close()
+    track_fix(ambulance_id, latitude, longitude, accepted)
+
+def track_fix(ambulance_id, latitude, longitude, accepted=True):
+    # Everything after storage; the fixes gateway.py stores go through it too (track_gateway_fixes)
+    # Arrival detection runs against the in-memory geofences, for every fix
+    for request_id, kind, event in geofences.evaluate(ambulance_id, latitude, longitude):
+        new_status = apply_geofence_event(request_id, kind, event)
+        if new_status:
+            socketio.emit('status_update', {'ambulance_id': ambulance_id, 'request_id': request_id, 'status': new_status})
+
+    trips = list(geofences.trips.get(ambulance_id, ()))
+    if not accepted:
+        fix_filter.suppressed_broadcasts(len(trips))
+        return
+
+    # Distance and ETA to the destination of the trip this ambulance is serving
+    for request_id in trips:
+        destination = geofences.center(request_id, DESTINATION)
+        if not destination:
+            continue
+
+        # Remaining distance and ETA along the trip's road route
+        progress = route_progress(request_id, latitude, longitude, destination)
+        if progress:
+            distance_km, eta_minutes = progress
+        else:
+            # No route available: straight line at the average speed
+            # (exact great-circle distance; the approximated haversine() breaks down at zero distance)
+            distance_km = haversine_km(latitude, longitude, *destination)
+            eta_minutes = (distance_km / config.AMBULANCE_SPEED_KMH) * 60
+
+        # Once the pickup fence is gone the patient is on board: the dashboard follows the live ETA
+        if geofences.center(request_id, PICKUP) is None:
+            refresh_trip_eta(request_id, eta_minutes)
+
+        # Broadcast the location update with distance and ETA, in each client's format
+        socketio.emit('location_update', {
             'ambulance_id': ambulance_id,
             'latitude': latitude,
             'longitude': longitude,
             'distance_km': round(distance_km, 2),
             'eta_minutes': round(eta_minutes, 2)
-        }, broadcast=True)
-
+        }, to=WIRE_ROOMS['json'])
+        socketio.emit('location_update', wire.encode_location_update(ambulance_id, latitude, longitude, distance_km, eta_minutes),
+                      to=WIRE_ROOMS['binary'])
+
+def track_gateway_fixes():
+    # Run the fixes gateway.py has stored since the last call through track_fix(); returns how many were taken
+    conn = sqlite3.connect('users.db', timeout=30)
+    fixes = locations.take_gateway_fixes(conn.cursor(), config.GATEWAY_BATCH_SIZE)
+    conn.commit()
     conn.close()
 
+    # Positions from before an outage would fire stale arrivals and ETAs; they are in the history regardless
+    oldest_ms = timeutil.now_ms() - config.GATEWAY_FIX_MAX_AGE_SECONDS * 1000
+    for ambulance_id, latitude, longitude, timestamp_ms in fixes:
+        # The batch is already off the queue: one fix that fails must not cost the others theirs
+        try:
+            trajectories.append(trajectory_key(ambulance_id), latitude, longitude, timestamp_ms / 1000)
+            if timestamp_ms >= oldest_ms:
+                track_fix(ambulance_id, latitude, longitude)
+        except Exception as e:
+            print(f"Error tracking gateway fix of ambulance {ambulance_id}: {e}")
+    return len(fixes)
+
+def gateway_fix_loop():
+    while True:
+        time.sleep(config.GATEWAY_POLL_SECONDS)
+        # Only the leader tracks them, so each fix is evaluated and broadcast once
+        if not leader.is_leader:
+            continue
+        try:
+            while track_gateway_fixes() == config.GATEWAY_BATCH_SIZE:
+                pass  # a backlog: keep going without waiting
+        except Exception as e:
+            print(f"Error tracking gateway fixes: {e}")
+
 
 # Convert degrees to radians
 def radians(deg):
@@ -565,11 +1362,11 @@ def haversine(lat1, lon1, lat2, lon2):
 @app.route('/get_eta/<int:ambulance_id>', methods=['GET'])
 def get_eta(ambulance_id):
     try:
-        conn = sqlite3.connect('users.db')
+        conn = shard_map.connect(ambulance_id)
         cursor = conn.cursor()
 
         # Fetch the current location of the ambulance
-        cursor.execute('SELECT latitude, longitude FROM ambulance_locations WHERE ambulance_id = ?', (ambulance_id,))
+        cursor.execute('SELECT latitude, longitude FROM ambulance_latest WHERE ambulance_id = ?', (ambulance_id,))
         current_location = cursor.fetchone()
 
         # Fetch the destination coordinates
@@ -590,8 +1387,18 @@ def get_eta(ambulance_id):
             flash("Invalid location data for ETA calculation.", "error")
             return redirect(url_for('admin_dashboard'))
 
-        # Use Google Maps Distance Matrix API to get travel time with traffic
-        response = gmaps.distance_matrix(
+        # Progress along the trip's cached road route, without an API call per request
+        progress = route_progress(ambulance_id, lat1, lon1, (lat2, lon2))
+        if progress:
+            distance_km, eta_minutes = progress
+            return jsonify({
+                'eta_minutes': round(eta_minutes, 2),
+                'distance_km': round(distance_km, 2),
+                'status': 'On The Way' if distance_km > 0.2 else 'Patient Reached'
+            })
+
+        # No route: use Google Maps Distance Matrix API to get travel time with traffic
+        response = get_gmaps().distance_matrix(
             origins=f"{lat1},{lon1}",
             destinations=f"{lat2},{lon2}",
             mode="driving",
@@ -636,209 +1443,167 @@ def calculate_speed(lat1, lon1, lat2, lon2, time1, time2):
     return 0
 
 
-# Route to update the status of a request
-@app.route('/update_status/<int:req_id>', methods=['POST'])
-def update_status(req_id):
-    new_status = request.form.get('status')
+def set_completion_eta(cursor, req_id):
+    # Estimated completion once the patient is on board; returns an error message or None
+    cursor.execute("SELECT origin_lat, origin_lng, destination_lat, destination_lng FROM ambulance_requests WHERE id = ?", (req_id,))
+    location_data = cursor.fetchone()
+    if not location_data:
+        return None
 
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
+    # Validate that latitude and longitude values are not None
+    if None in location_data:
+        return "Error: Invalid location data for ETA calculation."
+    lat1, lon1, lat2, lon2 = location_data
+    try:
+        # Calculate distance using the Haversine formula
+        distance = haversine(lat1, lon1, lat2, lon2)
+        speed_kmh = 80  # Average speed of the ambulance in km/h
+        eta_minutes = (distance / speed_kmh) * 60
+
+        # Calculate the estimated completion time
+        estimated_completion_ms = timeutil.after_ms(eta_minutes)
+
+        # Update the estimated completion time in the database
+        cursor.execute("UPDATE ambulance_requests SET estimated_completion_time = ?, estimated_completion_ms = ? WHERE id = ?",
+                       (timeutil.iso(estimated_completion_ms), estimated_completion_ms, req_id))
+    except Exception as e:
+        return f"Error calculating ETA: {str(e)}"
+    return None
 
-    # Update the status in the database
+def change_status(cursor, req_id, new_status):
+    # A status change and what follows from it, in the caller's transaction; returns an ETA error message or None
     cursor.execute("UPDATE ambulance_requests SET status = ? WHERE id = ?", (new_status, req_id))
-    conn.commit()
+    analytics.record_transition(cursor, req_id, new_status, config.ANALYTICS_AREA_DEG)
+
+    # A finished or rejected trip frees its ambulance for dispatch
+    if new_status in ("Patient Reached", "Rejected"):
+        release_unit(cursor, req_id)
 
     # If the status is set to "Patient Received," calculate the ETA
     if new_status == "Patient Received":
-        cursor.execute("SELECT origin_lat, origin_lng, destination_lat, destination_lng FROM ambulance_requests WHERE id = ?", (req_id,))
-        location_data = cursor.fetchone()
-
-        if location_data:
-            lat1, lon1, lat2, lon2 = location_data
-
-            # Validate that latitude and longitude values are not None
-            if None not in (lat1, lon1, lat2, lon2):
-                try:
-                    # Calculate distance using the Haversine formula
-                    distance = haversine(lat1, lon1, lat2, lon2)
-                    speed_kmh = 80  # Average speed of the ambulance in km/h
-                    eta_minutes = (distance / speed_kmh) * 60
+        return set_completion_eta(cursor, req_id)
+    return None
 
-                    # Calculate the estimated completion time
-                    estimated_completion_time = datetime.now() + timedelta(minutes=eta_minutes)
+def status_changed(req_id, new_status):
+    # Geofences that no longer apply, once the change is committed
+    if new_status in ("Patient Reached", "Rejected"):
+        geofences.unregister(req_id)
+    elif new_status == "Patient Received":
+        geofences.unregister(req_id, PICKUP)
+        geofences.rearm(req_id, DESTINATION)
 
-                    # Update the estimated completion time in the database
-                    cursor.execute("UPDATE ambulance_requests SET estimated_completion_time = ? WHERE id = ?", (estimated_completion_time, req_id))
-                    conn.commit()
+# Route to update the status of a request
+@app.route('/update_status/<int:req_id>', methods=['POST'])
+def update_status(req_id):
+    new_status = request.form.get('status')
 
-                except Exception as e:
-                    flash(f"Error calculating ETA: {str(e)}", "danger")
-            else:
-                flash("Error: Invalid location data for ETA calculation.", "danger")
+    conn = shard_map.connect(req_id)
+    cursor = conn.cursor()
+    problem = change_status(cursor, req_id, new_status)
+    if problem:
+        flash(problem, "danger")
 
+    event = record_dashboard_event(cursor, dashboard_feed.STATUS, req_id)
+    conn.commit()
     conn.close()
+    status_changed(req_id, new_status)
+    publish_dashboard_events(event)
     flash("Status updated successfully!", "success")
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/download_pdf/<int:req_id>')
-def download_pdf(req_id):
-    conn = sqlite3.connect('users.db')
+# Process pool that renders PDF reports away from the request threads
+report_pool = report_jobs.ReportJobs('users.db', workers=config.REPORT_WORKERS, max_pending=config.REPORT_QUEUE_DEPTH,
+                                     timeout=config.REPORT_JOB_TIMEOUT_SECONDS)
+
+def fetch_report(req_id):
+    # The request row reports.build_report_pdf() expects, live or archived
+    conn = connect_history()
     cursor = conn.cursor()
 
     cursor.execute('''SELECT r.patient_name, r.contact, r.pickup_location, r.destination, r.ambulance_type, 
                              r.origin_lat, r.origin_lng, r.destination_lat, r.destination_lng, r.status, 
                              r.estimated_arrival_time, r.estimated_completion_time, 
                              r.pickup_lat, r.pickup_lng
-                      FROM ambulance_requests r
+                      FROM all_requests r
                       WHERE r.id = ?''', (req_id,))
     report = cursor.fetchone()
     conn.close()
+    return report
 
-    if report:
-        # Unpack the report tuple
-        patient_name, contact, pickup_location, destination, ambulance_type, \
-        origin_lat, origin_lng, destination_lat, destination_lng, status, \
-        estimated_arrival_time, estimated_completion_time, pickup_lat, pickup_lng = report
-
-        # Format datetime fields
-        for time_field in [estimated_arrival_time, estimated_completion_time]:
-            if time_field and time_field != 'Not Available':
-                time_field = datetime.fromisoformat(time_field).strftime('%B %d, %Y %I:%M %p')
-
-        # Create PDF buffer
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=72
-        )
+def pdf_response(pdf_data):
+    return Response(
+        pdf_data,
+        mimetype='application/pdf',
+        headers={"Content-Disposition": "attachment;filename=ambulance_report.pdf"}
+    )
 
-        # Create styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            textColor=colors.HexColor('#1a365d')
-        )
-        
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#2d3748')
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#4a5568'),
-            spaceAfter=12
-        )
-
-        # Build the document content
-        elements = []
+@app.route('/download_pdf/<int:req_id>')
+def download_pdf(req_id):
+    report = fetch_report(req_id)
 
-        # Add logo and company info
-        elements.append(Paragraph("SwiftAid", title_style))
-        elements.append(Paragraph("Emergency Medical Services", header_style))
-        elements.append(Spacer(1, 0.2 * inch))
-        elements.append(Paragraph("Contact: +977 1 674 936 890 | support@swiftaid.com", normal_style))
-        
-        # Add horizontal line
-        elements.append(Spacer(1, 0.3 * inch))
-        elements.append(Table([['']], colWidths=[450], style=TableStyle([
-            ('LINEABOVE', (0, 0), (-1, 0), 1, colors.HexColor('#e2e8f0'))
-        ])))
-        elements.append(Spacer(1, 0.3 * inch))
-
-        # Create the main content table
-        data = [
-            ["Patient Information", ""],
-            ["Patient Name:", patient_name],
-            ["Contact:", contact],
-            ["", ""],
-            ["Transport Details", ""],
-            ["Pickup Location:", pickup_location],
-            ["Destination:", destination],
-            ["Ambulance Type:", ambulance_type],
-            ["Status:", status],
-            ["", ""],
-            ["Location Coordinates", ""],
-            ["Origin:", f"Lat: {origin_lat}, Long: {origin_lng}"],
-            ["Destination:", f"Lat: {destination_lat}, Long: {destination_lng}"],
-        ]
+    if report:
+        if config.REPORT_INLINE_WHEN_IDLE and report_pool.in_flight() == 0:
+            # A single one-page report is quicker to render here than to hand to the pool;
+            # reportlab is only loaded the first time a report is downloaded
+            import reports
+            return pdf_response(reports.build_report_pdf(report))
 
-        if estimated_completion_time != 'Not Available':
-            data.extend([
-                ["", ""],
-                ["Timing", ""],
-                ["Completion Time:", estimated_completion_time]
-            ])
-
-        # Style the table
-        table_style = TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#4a5568')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            # Style section headers
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2d3748')),
-            ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 4), (-1, 4), 12),
-            ('TEXTCOLOR', (0, 4), (-1, 4), colors.HexColor('#2d3748')),
-            ('FONTNAME', (0, 10), (-1, 10), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 10), (-1, 10), 12),
-            ('TEXTCOLOR', (0, 10), (-1, 10), colors.HexColor('#2d3748')),
-        ])
-
-        if estimated_completion_time != 'Not Available':
-            table_style.add('FONTNAME', (0, 14), (-1, 14), 'Helvetica-Bold')
-            table_style.add('FONTSIZE', (0, 14), (-1, 14), 12)
-            table_style.add('TEXTCOLOR', (0, 14), (-1, 14), colors.HexColor('#2d3748'))
-
-        table = Table(data, colWidths=[2*inch, 4*inch])
-        table.setStyle(table_style)
-        elements.append(table)
-
-        # Add footer
-        elements.append(Spacer(1, inch))
-        footer_text = """Thank you for trusting SwiftAid with your emergency care needs.
-        For more information, visit: www.swiftaid.com"""
-        elements.append(Paragraph(footer_text, ParagraphStyle(
-            'Footer',
-            parent=styles['Italic'],
-            fontSize=8,
-            textColor=colors.HexColor('#718096'),
-            alignment=1
-        )))
-
-        # Build and return the PDF
-        doc.build(elements)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-
-        return Response(
-            pdf_data,
-            mimetype='application/pdf',
-            headers={"Content-Disposition": "attachment;filename=ambulance_report.pdf"}
-        )
+        # Other reports are being rendered: queue this one with them and wait for it
+        try:
+            job_id = report_pool.submit(req_id, report)
+        except report_jobs.Unavailable:
+            flash("Reports can't be generated right now. Please try again in a moment.", "warning")
+            return redirect(url_for('admin_dashboard'))
+        state = report_pool.wait(job_id, config.REPORT_WAIT_SECONDS)
+        if state and state[0] == report_jobs.DONE:
+            return pdf_response(report_pool.result(job_id))
+        flash("The report could not be generated in time. Please try again.", "danger")
+        return redirect(url_for('admin_dashboard'))
     else:
         flash("No report found for this request.", "danger")
         return redirect(url_for('admin_dashboard'))
 
+@app.route('/reports/<int:req_id>/jobs', methods=['POST'])
+@login_required
+def submit_report_job(req_id):
+    # Start rendering a request's PDF in the background; poll the status URL, then download
+    report = fetch_report(req_id)
+    if not report:
+        return jsonify({'error': 'Request not found'}), 404
+    try:
+        job_id = report_pool.submit(req_id, report)
+    except report_jobs.QueueFull:
+        return jsonify({'error': 'Too many reports in progress, retry later'}), 503, {'Retry-After': '5'}
+    except report_jobs.PoolFailed:
+        return jsonify({'error': 'Report rendering is unavailable, retry later'}), 503, {'Retry-After': '5'}
+    return jsonify({'job_id': job_id, 'status': report_jobs.QUEUED,
+                    'status_url': url_for('report_job_status', job_id=job_id)}), 202
+
+@app.route('/reports/jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    state = report_pool.status(job_id)
+    if state is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    status, req_id, error = state
+    payload = {'job_id': job_id, 'request_id': req_id, 'status': status}
+    if status == report_jobs.DONE:
+        payload['download_url'] = url_for('report_job_pdf', job_id=job_id)
+    elif status == report_jobs.FAILED:
+        payload['error'] = error
+    return jsonify(payload)
+
+@app.route('/reports/jobs/<job_id>/pdf')
+@login_required
+def report_job_pdf(job_id):
+    pdf_data = report_pool.result(job_id)
+    if pdf_data is None:
+        return jsonify({'error': 'Report not ready'}), 404
+    return pdf_response(pdf_data)
+
 @app.route('/view_report/<int:req_id>')
 def view_report(req_id):
-    conn = sqlite3.connect('users.db')
+    conn = connect_history()
     cursor = conn.cursor()
 
     # Updated query to fetch all necessary fields
@@ -846,7 +1611,7 @@ def view_report(req_id):
                              r.origin_lat, r.origin_lng, r.destination_lat, r.destination_lng, r.status, 
                              r.estimated_arrival_time, r.estimated_completion_time, 
                              r.pickup_lat, r.pickup_lng
-                      FROM ambulance_requests r
+                      FROM all_requests r
                       WHERE r.id = ?''', (req_id,))
     report = cursor.fetchone()
     conn.close()
@@ -885,19 +1650,45 @@ def view_report(req_id):
         return redirect(url_for('admin_dashboard'))
 
 
+def remove_request(conn, cursor, req_id):
+    # Delete a request with its GPS history in the caller's transaction; returns True when it existed
+    cursor.execute("SELECT status FROM ambulance_requests WHERE id = ?", (req_id,))
+    row = cursor.fetchone()
+    if row and row[0] not in ("Patient Reached", "Rejected"):
+        # A trip cancelled under way frees its ambulance
+        release_unit(cursor, req_id)
+    cursor.execute("DELETE FROM ambulance_locations WHERE ambulance_id = ?", (req_id,))
+    cursor.execute("DELETE FROM ambulance_latest WHERE ambulance_id = ?", (req_id,))
+    cursor.execute("DELETE FROM ambulance_requests WHERE id = ?", (req_id,))
+    if row:
+        return True
+
+    # Not a live request: it may have been archived already
+    if not os.path.exists(config.ARCHIVE_DB):
+        return False
+    if not any(schema[1] == 'archive' for schema in conn.execute('PRAGMA database_list')):
+        archive.attach(conn, config.ARCHIVE_DB)
+    return archive.delete_archived_request(conn, req_id)
+
+def request_removed(req_id):
+    # In-memory state of a deleted request, once the deletion is committed
+    geofences.unregister(req_id)
+    trajectories.forget(req_id)
+
 @app.route('/delete_request/<int:req_id>', methods=['POST'])
 def delete_request(req_id):
     try:
-        # Connect to the database
-        conn = sqlite3.connect('users.db')
+        # Connect to the request's shard
+        conn = shard_map.connect(req_id)
         cursor = conn.cursor()
-
-        # SQL query to delete the request by ID
-        cursor.execute("DELETE FROM ambulance_requests WHERE id = ?", (req_id,))
+        deleted = remove_request(conn, cursor, req_id)
+        event = record_dashboard_event(cursor, dashboard_feed.DELETED, req_id) if deleted else None
 
         # Commit the changes and close the connection
         conn.commit()
         conn.close()
+        request_removed(req_id)
+        publish_dashboard_events(event)
 
         # Flash a success message
         flash('Request deleted successfully!', 'success')
@@ -910,6 +1701,190 @@ def delete_request(req_id):
     return redirect(url_for('admin_dashboard'))
 
 
+REQUEST_STATUSES = ('New', 'Pending', 'Assigned', 'Started', 'Patient Received', 'Patient Reached', 'Rejected')
+
+def bulk_request_ids():
+    # Ids from a JSON body {"ids": [...]} or repeated `ids` form fields, duplicates dropped; None if any is not a number
+    data = request.get_json(silent=True)
+    values = data.get('ids') if isinstance(data, dict) else request.form.getlist('ids')
+    if not isinstance(values, list):
+        return None
+    try:
+        return list(dict.fromkeys(int(value) for value in values))
+    except (TypeError, ValueError):
+        return None
+
+def bulk_apply(ids, apply):
+    """Run apply(conn, cursor, req_id, other_counts) for every id, in one transaction per shard.
+
+    apply returns (result, event, after_commit): the id's entry in the
+    summary, its dashboard delta (or None) and a callable for in-memory state
+    to update once the transaction is committed (or None). When anything in a
+    shard's transaction fails, none of its changes are kept and each of its
+    ids is reported as an error. Returns {req_id: result}.
+    """
+    by_shard = {}
+    for req_id in ids:
+        by_shard.setdefault(shard_map.shard_of_id(req_id), []).append(req_id)
+
+    results, events = {}, []
+    for shard, shard_ids in by_shard.items():
+        # The other shards' totals for this shard's dashboard deltas, read once
+        other_counts = other_shard_counts(shard) if shard_map.sharded else None
+        conn = shard_map.connect(shard=shard)
+        cursor = conn.cursor()
+        shard_results, shard_events, callbacks = {}, [], []
+        try:
+            for req_id in shard_ids:
+                result, event, after_commit = apply(conn, cursor, req_id, other_counts)
+                shard_results[req_id] = result
+                shard_events.append(event)
+                callbacks.append(after_commit)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Bulk operation failed on {shard_map.paths[shard]}: {e}")
+            shard_results = {req_id: {'result': 'error', 'error': str(e)} for req_id in shard_ids}
+            shard_events, callbacks = [], []
+        finally:
+            conn.close()
+
+        for after_commit in callbacks:
+            if after_commit:
+                after_commit()
+        results.update(shard_results)
+        events.extend(shard_events)
+
+    publish_dashboard_events(*events)
+    return results
+
+def bulk_response(ids, results):
+    # Per-id results in the order given, plus how many ended each way
+    summary = {}
+    for result in results.values():
+        summary[result['result']] = summary.get(result['result'], 0) + 1
+    return jsonify({'results': [dict(results[req_id], id=req_id) for req_id in ids], 'summary': summary})
+
+@app.route('/bulk/update_status', methods=['POST'])
+@login_required
+def bulk_update_status():
+    # Set one status on many requests: {"ids": [...], "status": "..."}
+    ids = bulk_request_ids()
+    data = request.get_json(silent=True)
+    new_status = data.get('status') if isinstance(data, dict) else request.form.get('status')
+    if not ids:
+        return jsonify({'error': 'ids must be a non-empty list of request ids'}), 400
+    if len(ids) > config.BULK_MAX_IDS:
+        return jsonify({'error': f'At most {config.BULK_MAX_IDS} ids per call'}), 400
+    if new_status not in REQUEST_STATUSES:
+        return jsonify({'error': f"status must be one of {', '.join(REQUEST_STATUSES)}"}), 400
+
+    def apply(conn, cursor, req_id, other_counts):
+        cursor.execute("SELECT 1 FROM ambulance_requests WHERE id = ?", (req_id,))
+        if cursor.fetchone() is None:
+            return {'result': 'not_found'}, None, None
+        result = {'result': 'updated'}
+        problem = change_status(cursor, req_id, new_status)
+        if problem:
+            result['warning'] = problem
+        event = record_dashboard_event(cursor, dashboard_feed.STATUS, req_id, other_counts)
+        return result, event, lambda: status_changed(req_id, new_status)
+
+    return bulk_response(ids, bulk_apply(ids, apply))
+
+@app.route('/bulk/delete_requests', methods=['POST'])
+@login_required
+def bulk_delete_requests():
+    # Delete many requests, live or archived, with their GPS history: {"ids": [...]}
+    ids = bulk_request_ids()
+    if not ids:
+        return jsonify({'error': 'ids must be a non-empty list of request ids'}), 400
+    if len(ids) > config.BULK_MAX_IDS:
+        return jsonify({'error': f'At most {config.BULK_MAX_IDS} ids per call'}), 400
+
+    def apply(conn, cursor, req_id, other_counts):
+        if not remove_request(conn, cursor, req_id):
+            return {'result': 'not_found'}, None, None
+        event = record_dashboard_event(cursor, dashboard_feed.DELETED, req_id, other_counts)
+        return {'result': 'deleted'}, event, lambda: request_removed(req_id)
+
+    return bulk_response(ids, bulk_apply(ids, apply))
+
+
+@app.route('/export/<dataset>.<fmt>')
+@login_required
+def export_data(dataset, fmt):
+    # Streams requests or GPS history for ?start=...&end=... (ISO timestamps) as CSV or Parquet
+    if dataset not in export.DATASETS or fmt not in export.FORMATS:
+        return jsonify({'error': 'Unknown export'}), 404
+    if fmt == 'parquet' and not export.parquet_available():
+        return jsonify({'error': 'Parquet export is not available on this server'}), 501
+
+    start = request.args.get('start')
+    end = request.args.get('end')
+    start_ms, end_ms = timeutil.to_ms(start), timeutil.to_ms(end)
+    if (start and start_ms is None) or (end and end_ms is None):
+        return jsonify({'error': 'start and end must be ISO timestamps'}), 400
+    filename = '_'.join(part for part in (dataset, start, end) if part).replace(':', '') + '.' + fmt
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    return Response(export.stream(connect_history(), dataset, fmt, start_ms, end_ms), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment;filename={filename}"})
+
+@app.route('/analytics')
+@login_required
+def analytics_summary():
+    # Response-time percentiles; ?by=all|ambulance_type|area and ?days=N for a rolling window
+    dimension = request.args.get('by', 'all')
+    days = request.args.get('days', type=int)
+    if dimension not in analytics.DIMENSIONS:
+        return jsonify({'error': f"by must be one of {', '.join(analytics.DIMENSIONS)}"}), 400
+    periods = None
+    if days:
+        today = datetime.now().date()
+        periods = [(today - timedelta(days=offset)).isoformat() for offset in range(min(days, 3660))]
+
+    conn = sqlite3.connect('users.db')
+    summary = analytics.report(conn.cursor(), dimension, periods)
+    conn.close()
+    return jsonify({'by': dimension, 'days': days, 'unit': 'minutes', 'metrics': summary})
+
+heatmap_tiles = TTLCache(ttl=config.HEATMAP_CACHE_SECONDS, max_entries=4096)
+
+@app.route('/heatmap/<period>/<int:zoom>/<int:x>/<int:y>.json')
+@login_required
+def heatmap_tile(period, zoom, x, y):
+    # Demand heatmap tile for period 'all', YYYY-MM or YYYY-MM-DD
+    if not heatmap.valid_period(period):
+        return jsonify({'error': 'period must be all, YYYY-MM or YYYY-MM-DD'}), 400
+    if not config.HEATMAP_MIN_ZOOM <= zoom <= config.HEATMAP_MAX_ZOOM or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        return jsonify({'error': f'zoom must be {config.HEATMAP_MIN_ZOOM}-{config.HEATMAP_MAX_ZOOM} with x, y inside it'}), 400
+
+    key = (period, zoom, x, y)
+    cached = heatmap_tiles.get(key)
+    if cached:
+        data, etag = cached[0]
+    else:
+        conn = sqlite3.connect('users.db')
+        data = heatmap.tile(conn.cursor(), period, zoom, x, y)
+        conn.close()
+        etag = make_etag(data)
+        heatmap_tiles.set(key, (data, etag))
+    return conditional_json(data, etag, max_age=config.HEATMAP_CACHE_SECONDS)
+
+@app.cli.command('export')
+@click.argument('dataset', type=click.Choice(list(export.DATASETS)))
+@click.option('--format', 'fmt', type=click.Choice(export.FORMATS), default='csv')
+@click.option('--start', help='Earliest timestamp (ISO format), inclusive.')
+@click.option('--end', help='Latest timestamp (ISO format), exclusive.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), required=True)
+def export_command(dataset, fmt, start, end, output):
+    """Export requests or GPS history, e.g. flask --app app export locations --format parquet -o gps.parquet"""
+    mode = 'w' if fmt == 'csv' else 'wb'
+    with open(output, mode, **({'newline': ''} if fmt == 'csv' else {})) as f:
+        for chunk in export.stream(connect_history(), dataset, fmt, timeutil.to_ms(start), timeutil.to_ms(end)):
+            f.write(chunk)
+    print(f"Exported {dataset} to {output}.")
+
 @app.route('/update_ambulance_location', methods=['POST'])
 def update_ambulance_location():
     try:
@@ -926,25 +1901,23 @@ def update_ambulance_location():
 
         # Convert latitude and longitude to float
         try:
-            latitude = float(latitude)
-            longitude = float(longitude)
+            _, latitude, longitude = locations.validate_fix(ambulance_id, latitude, longitude)
         except ValueError:
             flash("Invalid latitude or longitude values", "danger")
             return redirect(url_for('admin_dashboard'))
 
         # Check if the ambulance_id exists in ambulance_requests table
-        conn = sqlite3.connect('users.db')
+        conn = shard_map.connect(ambulance_id)
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM ambulance_requests WHERE id = ?', (ambulance_id,))
         if cursor.fetchone() is None:
             flash("Invalid ambulance ID", "danger")
             return redirect(url_for('admin_dashboard'))
 
-        # Insert new location into ambulance_locations table
-        cursor.execute('''INSERT INTO ambulance_locations (ambulance_id, latitude, longitude, status)
-                          VALUES (?, ?, ?, ?)''', (ambulance_id, latitude, longitude, status))
-
-        conn.commit()
+        # Insert new location into ambulance_locations table (status changes always pass the filter)
+        if fix_filter.accept(ambulance_id, latitude, longitude, status):
+            record_location(cursor, ambulance_id, latitude, longitude, status)
+            conn.commit()
         conn.close()
 
         flash("Ambulance location updated successfully.", "success")
@@ -954,6 +1927,28 @@ def update_ambulance_location():
         flash(f"Error updating ambulance location: {str(e)}", "danger")
         return redirect(url_for('admin_dashboard'))
 
+@app.route('/update_unit_location', methods=['POST'])
+def update_unit_location():
+    # A dispatch unit reports its position and, optionally, its availability ('Available' or anything else)
+    data = request.get_json(silent=True) or request.form
+    try:
+        unit_id, latitude, longitude = locations.validate_fix(data.get('unit_id'), data.get('latitude'), data.get('longitude'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    status = data.get('status') or None
+
+    conn = sqlite3.connect('users.db')
+    locations.record_unit(conn.cursor(), unit_id, latitude, longitude, status)
+    conn.commit()
+    conn.close()
+
+    # Keep this worker's dispatch index in step at once; the others catch up in sync_units()
+    if status is None:
+        dispatcher.move_unit(unit_id, latitude, longitude)
+    else:
+        dispatcher.update_unit(unit_id, latitude, longitude, available=(status == 'Available'))
+    return jsonify({'unit_id': unit_id, 'status': status})
+
 
 @app.route('/booking', methods=['GET'])
 def booking():
@@ -981,7 +1976,7 @@ def book_ambulance():
 
     # Attempt to find the nearest hospitals and extract destination coordinates
     try:
-        nearest_hospitals = find_nearest_hospitals(lat, lng, radius)  # Pass the radius parameter here
+        nearest_hospitals, _, _ = nearest_hospitals_for(lat, lng, radius)  # Pass the radius parameter here
         if nearest_hospitals and len(nearest_hospitals) > 0:
             # Prepare the hospital information
             hospital_info = [f"{h[0]} ({h[2]} km away) - {h[1]}" for h in nearest_hospitals]
@@ -1003,30 +1998,43 @@ def book_ambulance():
 
     # Calculate estimated time in minutes (based on distance and an average speed)
     distance_km = calculate_distance(lat, lng, destination_lat, destination_lng)
-    estimated_time_minutes = (distance_km / 80) * 60  # ETA in minutes at 80 km/h speed
+    estimated_time_minutes = (distance_km / config.AMBULANCE_SPEED_KMH) * 60  # ETA in minutes at 80 km/h speed
+
+    # Resolved once here and stored with the trip, so tracking never has to geocode
+    destination_address = reverse_geocode(destination_lat, destination_lng)
 
     # Save the booking request to the database
     try:
-        conn = sqlite3.connect('users.db')
+        # The request goes to the shard of the region it was made in
+        conn = shard_map.connect(shard=shard_map.shard_of_point(lat, lng))
         cursor = conn.cursor()
+        request_time_ms = timeutil.now_ms()
 
         # Insert the ambulance request with the additional columns
         cursor.execute(''' 
-            INSERT INTO ambulance_requests (patient_name, contact, pickup_location, destination, ambulance_type, origin_lat, origin_lng, destination_lat, destination_lng, request_time, estimated_time_minutes, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, contact, pickup_address, destination, ambulance_type, lat, lng, destination_lat, destination_lng, datetime.now().isoformat(), estimated_time_minutes, 'Pending'))
+            INSERT INTO ambulance_requests (patient_name, contact, pickup_location, destination, ambulance_type, origin_lat, origin_lng, destination_lat, destination_lng, request_time, estimated_time_minutes, status,
+                                            pickup_lat, pickup_lng, destination_address, route_distance_km, request_time_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name, contact, pickup_address, destination, ambulance_type, lat, lng, destination_lat, destination_lng, timeutil.iso(request_time_ms), estimated_time_minutes, 'Pending',
+              lat, lng, destination_address, distance_km, request_time_ms))
 
         # Get the last inserted ambulance request ID
         ambulance_id = cursor.lastrowid  # Get the last inserted ambulance request ID
+        request_id = ambulance_id
 
         # Insert the initial ambulance location into the ambulance_locations table
-        cursor.execute('''
-            INSERT INTO ambulance_locations (ambulance_id, latitude, longitude, timestamp, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (ambulance_id, lat, lng, datetime.now().isoformat(), 'Pending'))  # Set the status to 'Pending'
+        record_location(cursor, ambulance_id, lat, lng, 'Pending')  # Set the status to 'Pending'
+
+        # Count the pickup point in the demand heatmap
+        heatmap.record_origin(cursor, lat, lng, config.HEATMAP_MIN_ZOOM, config.HEATMAP_MAX_ZOOM, request_time_ms)
 
+        event = record_dashboard_event(cursor, dashboard_feed.CREATED, request_id)
         conn.commit()
         conn.close()
+        publish_dashboard_events(event)
+
+        # The next dispatch round picks the request up from the database
+        register_trip_fences(request_id, 'Pending', lat, lng, destination_lat, destination_lng)
 
         flash("Ambulance requested successfully!", "success")
     except Exception as e:
@@ -1038,6 +2046,41 @@ def book_ambulance():
 
 
 
+hospital_cache = TTLCache(ttl=config.HOSPITAL_CACHE_SECONDS)
+location_cache = TTLCache(ttl=config.LOCATION_CACHE_SECONDS, max_entries=4096)
+
+
+def cached_nearest_hospitals(lat, lng, radius):
+    # Searches from (almost) the same spot share one Places lookup; returns (hospitals, etag, fetched_at)
+    snap = config.HOSPITAL_CACHE_SNAP_DEG
+    key = (round(lat / snap), round(lng / snap), radius)
+    cached = hospital_cache.get(key)
+    if cached:
+        return cached[0]
+    hospitals = find_nearest_hospitals(key[0] * snap, key[1] * snap, radius)
+    version = (hospitals, make_etag(key, hospitals), time.time())
+    if hospitals:  # don't remember failed or empty lookups
+        hospital_cache.set(key, version)
+    return version
+
+
+def nearest_hospitals_for(lat, lng, radius):
+    # Inside the service area the precomputed grid answers; elsewhere, or before it is built, Places does
+    try:
+        radius_m = int(float(radius))
+    except (TypeError, ValueError):
+        radius_m = 10000
+    conn = sqlite3.connect('users.db')
+    try:
+        found = hospital_grid.lookup(conn.cursor(), lat, lng, radius_m, config.HOSPITAL_GRID_CANDIDATES)
+    finally:
+        conn.close()
+    if found is None:
+        return cached_nearest_hospitals(lat, lng, radius)
+    hospitals, built = found
+    return hospitals, make_etag(round(lat, 6), round(lng, 6), radius_m, built, hospitals), built
+
+
 @app.route('/find_nearest_hospitals', methods=['GET'])
 def ajax_find_nearest_hospitals():
     lat = request.args.get('lat', type=float)
@@ -1048,7 +2091,7 @@ def ajax_find_nearest_hospitals():
         return jsonify({'error': 'Invalid coordinates'}), 400
 
     try:
-        nearest_hospitals = find_nearest_hospitals(lat, lng, radius)
+        nearest_hospitals, etag, fetched_at = nearest_hospitals_for(lat, lng, radius)
         if nearest_hospitals:
             response_data = {
                 'hospitals': [
@@ -1062,7 +2105,7 @@ def ajax_find_nearest_hospitals():
                     for h in nearest_hospitals
                 ]
             }
-            return jsonify(response_data)
+            return conditional_json(response_data, etag, last_modified=fetched_at, max_age=60)
         else:
             return jsonify({'hospitals': []})
     except Exception as e:
@@ -1074,7 +2117,7 @@ def ajax_find_nearest_hospitals():
 def find_nearest_hospitals(lat, lng, radius):
     hospitals = []
     try:
-        places = gmaps.places_nearby(location=(lat, lng), radius=radius, type='hospital')
+        places = get_gmaps().places_nearby(location=(lat, lng), radius=radius, type='hospital')
         
         # Process the initial set of results
         if 'results' in places:
@@ -1090,7 +2133,7 @@ def find_nearest_hospitals(lat, lng, radius):
         # Check for next page of results
         while 'next_page_token' in places:
             time.sleep(2)  # Wait for the token to become valid
-            places = gmaps.places_nearby(page_token=places['next_page_token'])
+            places = get_gmaps().places_nearby(page_token=places['next_page_token'])
             if 'results' in places:
                 for place in places['results']:
                     name = place['name']
@@ -1107,93 +2150,59 @@ def find_nearest_hospitals(lat, lng, radius):
     return hospitals
 
 
-def has_arrived(current_lat, current_lng, destination_lat, destination_lng, arrival_threshold_km=0.1):
+def has_arrived(current_lat, current_lng, destination_lat, destination_lng, arrival_threshold_km=config.GEOFENCE_DESTINATION_RADIUS_M / 1000):
     # Calculate the distance from the current location to the destination
     distance_to_destination = haversine(current_lat, current_lng, destination_lat, destination_lng)
-    return distance_to_destination <= arrival_threshold_km  # Check if within 100 meters (0.1 km)
+    return distance_to_destination <= arrival_threshold_km  # Same radius as the destination geofence
 
 def check_if_arrived_on_time(ambulance_id):
+    """Return (arrived, on_time) for a request, using the arrival recorded by the destination geofence."""
+    conn = None
     try:
-        # Connect to the database
-        conn = sqlite3.connect('users.db')
+        # Connect to the request's shard
+        conn = shard_map.connect(ambulance_id)
         cursor = conn.cursor()
 
-        # Fetch request time, estimated time, and current status
+        # Fetch request time, estimated time and the geofence arrival time
         cursor.execute(''' 
-            SELECT request_time, estimated_time_minutes, status 
+            SELECT request_time_ms, estimated_time_minutes, arrival_time_ms 
             FROM ambulance_requests 
             WHERE id = ?
         ''', (ambulance_id,))
         result = cursor.fetchone()
+        if not result:
+            return False, False
 
-        if result:
-            request_time_str, estimated_time_minutes, current_status = result
+        request_time_ms, estimated_time_minutes, arrival_time_ms = result
+        if arrival_time_ms is None:
+            return False, False
+        if request_time_ms is None or estimated_time_minutes is None:
+            return True, False
 
-            # Parse request time
-            request_time = datetime.strptime(request_time_str, "%Y-%m-%d %H:%M:%S")
-
-            # Determine the reference start time for ETA calculation
-            if current_status == "Patient Received":
-                # Fetch the time when the status was last updated to "Patient Received"
-                cursor.execute(''' 
-                    SELECT timestamp 
-                    FROM status_updates 
-                    WHERE ambulance_id = ? AND new_status = ? 
-                    ORDER BY timestamp DESC LIMIT 1
-                ''', (ambulance_id, "Patient Received"))
-                status_update = cursor.fetchone()
-
-                if status_update:
-                    request_time = datetime.strptime(status_update[0], "%Y-%m-%d %H:%M:%S")
-
-            # Calculate the estimated arrival time
-            estimated_arrival_time = request_time + timedelta(minutes=estimated_time_minutes)
-
-            # Get the current real-time
-            current_time = datetime.now()
-
-            # Debugging: Print times to verify
-            print(f"Current Time: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"Estimated Arrival Time: {estimated_arrival_time.strftime('%Y-%m-%d %H:%M:%S')}")
-
-            # Determine the status
-            if current_time >= estimated_arrival_time:
-                status = "Arrived"
-                print("The ambulance has arrived at the destination.")
-
-                # Update status to 'Arrived'
-                cursor.execute(''' 
-                    UPDATE ambulance_requests 
-                    SET status = ?, arrival_time = ? 
-                    WHERE id = ? 
-                ''', (status, estimated_arrival_time.strftime("%Y-%m-%d %H:%M:%S"), ambulance_id))
-            else:
-                status = "In Transit"
-                print("The ambulance is still in transit.")
-
-                # Ensure 'Arrived' is not prematurely set
-                cursor.execute(''' 
-                    UPDATE ambulance_requests 
-                    SET status = ? 
-                    WHERE id = ? 
-                ''', (status, ambulance_id))
-            conn.commit()
+        # Compare with the estimated arrival time
+        return True, arrival_time_ms <= timeutil.after_ms(estimated_time_minutes, request_time_ms)
 
     except Exception as e:
         print(f"Error checking arrival time: {e}")
+        return False, False
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 
-# Initialize geocoder
-geolocator = Nominatim(user_agent="ambulance_tracker")
+# Geocoder, created on first use
+@lru_cache(maxsize=None)
+def get_geolocator():
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent="ambulance_tracker")
 
 def geocode_address(address, retries=3):
     """Geocode the given address to get latitude and longitude."""
+    from geopy.exc import GeocoderTimedOut
     for attempt in range(retries):
         try:
             print(f"Geocoding address: {address} (Attempt {attempt + 1})")
-            location = geolocator.geocode(address)
+            location = get_geolocator().geocode(address)
             if location:
                 print(f"Geocoded Address: {address} => Latitude: {location.latitude}, Longitude: {location.longitude}")
                 return location.latitude, location.longitude
@@ -1208,6 +2217,7 @@ def geocode_address(address, retries=3):
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     # Use geodesic from geopy to calculate the distance in kilometers
+    from geopy.distance import geodesic
     return geodesic((lat1, lon1), (lat2, lon2)).kilometers
 
 @app.route('/tracking', methods=['GET', 'POST'])
@@ -1222,20 +2232,20 @@ def tracking():
 
         # Establish database connection
         try:
-            conn = sqlite3.connect('users.db')
+            # A patient name can be on any shard
+            conn = shard_map.connect(ambulance_id) if ambulance_id else shard_map.connect_all()
             cursor = conn.cursor()
 
             # Add print statements before executing the query to check the SQL query and input values
             if ambulance_id:
                 print(f"Querying for ambulance with ID: {ambulance_id}")
                 query = '''
-                    SELECT al.latitude, al.longitude, al.timestamp, al.status, 
-                        ar.patient_name, ar.pickup_lat, ar.pickup_lng, 
-                        ar.destination_lat, ar.destination_lng, ar.request_time, ar.estimated_time_minutes
-                    FROM ambulance_locations al
-                    JOIN ambulance_requests ar ON al.ambulance_id = ar.id
-                    WHERE al.ambulance_id = ?
-                    ORDER BY al.timestamp DESC LIMIT 1
+                    SELECT latitude, longitude, timestamp_ms, status, 
+                        patient_name, pickup_lat, pickup_lng, 
+                        destination_lat, destination_lng, request_time_ms, estimated_time_minutes,
+                        pickup_address, destination_address, route_distance_km
+                    FROM ambulance_latest
+                    WHERE ambulance_id = ?
                 '''
                 print(f"Executing query: {query} with ambulance_id={ambulance_id}")
                 cursor.execute(query, (ambulance_id,))
@@ -1244,13 +2254,13 @@ def tracking():
                 print(f"Searching for ambulance with Patient Name: {patient_name}")
                 # If no ambulance_id, search by patient_name
                 cursor.execute(''' 
-                    SELECT al.latitude, al.longitude, al.timestamp, al.status, 
-                           ar.patient_name, ar.pickup_lat, ar.pickup_lng, 
-                           ar.destination_lat, ar.destination_lng, ar.request_time, ar.estimated_time_minutes
-                    FROM ambulance_locations al 
-                    JOIN ambulance_requests ar ON al.ambulance_id = ar.id 
-                    WHERE ar.patient_name = ? 
-                    ORDER BY al.timestamp DESC LIMIT 1
+                    SELECT latitude, longitude, timestamp_ms, status, 
+                           patient_name, pickup_lat, pickup_lng, 
+                           destination_lat, destination_lng, request_time_ms, estimated_time_minutes,
+                           pickup_address, destination_address, route_distance_km
+                    FROM live_latest 
+                    WHERE patient_name = ? 
+                    ORDER BY timestamp_ms DESC LIMIT 1
                 ''', (patient_name,))
             else:
                 flash("Please provide either an Ambulance ID or Patient Name.", "error")
@@ -1270,73 +2280,42 @@ def tracking():
 
         # Check if data was found
         if data:
-            latitude, longitude, timestamp, status, patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng, request_time_str, estimated_time_minutes = data
+            latitude, longitude, timestamp_ms, status, patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng, request_time_ms, estimated_time_minutes, \
+                pickup_address, stored_destination_address, distance_km = data
+            timestamp = timeutil.from_ms(timestamp_ms)
+
+            # Use the pickup point stored at booking, or the current ambulance location for older trips
+            if pickup_lat is None or pickup_lng is None:
+                pickup_lat = latitude
+                pickup_lng = longitude
 
-            # Handle timestamp parsing
-            try:
-                timestamp = datetime.fromisoformat(timestamp)  # Convert string to datetime object
-                if request_time_str:
-                    request_time = datetime.fromisoformat(request_time_str)  # Convert request_time to datetime object
-                else:
-                    request_time = None  # Set request_time to None if the string is empty or None
-            except ValueError as e:
-                print(f"Error parsing timestamp: {e}")
-                timestamp = None
-                request_time = None
-
-            # Debugging outputs for fetched data
-            print(f"Fetched location: lat={latitude}, lon={longitude}, timestamp={timestamp}")
-            print(f"Patient Name: {patient_name}, Status: {status}")
-            print(f"Pickup coordinates: lat={pickup_lat}, lng={pickup_lng}")
-            print(f"Destination coordinates: lat={destination_lat}, lng={destination_lng}")
-            print(f"Request Time: {request_time}, Estimated Time: {estimated_time_minutes}")
-
-            # If destination is not provided in the request, use the database values
             if destination_address:
                 # Geocode the destination address provided by the user
                 destination_lat, destination_lng = geocode_address(destination_address)
                 if destination_lat is None or destination_lng is None:
                     flash("Invalid destination address provided.", "error")
                     return redirect(url_for('tracking'))
-                else:
-                    print(f"User-provided destination: {destination_address} => lat: {destination_lat}, lng: {destination_lng}")
-            else:
-                # If destination is already in the database, we can use the stored lat/lng
-                print(f"Using destination from the database: lat={destination_lat}, lng={destination_lng}")
-
-            # Use reverse_geocode for the pickup location
-            if pickup_lat is None or pickup_lng is None:
-                pickup_lat = latitude  # Assume pickup is at the current ambulance location
-                pickup_lng = longitude
-
-            pickup_address = reverse_geocode(pickup_lat, pickup_lng) if pickup_lat and pickup_lng else "Pickup location not available"
-            if destination_lat and destination_lng:
-                destination_address = reverse_geocode(destination_lat, destination_lng)
+                distance_km = None
+                estimated_time_minutes = None
             else:
-                destination_address = "Destination not available"
-
+                # Everything else was stored with the trip at booking
+                destination_address = stored_destination_address or "Destination not available"
+            pickup_address = pickup_address or "Pickup location not available"
 
-            # Debugging the reverse geocode addresses
-            print(f"Pickup Address: {pickup_address}")
-            print(f"Destination Address: {destination_address}")
+            # Trips booked before the trip fields existed, or a user-provided destination
+            if distance_km is None and None not in (pickup_lat, pickup_lng, destination_lat, destination_lng):
+                distance_km = haversine_km(pickup_lat, pickup_lng, destination_lat, destination_lng)
+            if estimated_time_minutes is None and distance_km is not None:
+                estimated_time_minutes = (distance_km / config.AMBULANCE_SPEED_KMH) * 60
 
-            # Calculate the distance between pickup and destination
-            distance_km = calculate_distance(pickup_lat, pickup_lng, destination_lat, destination_lng)
-            print(f"Distance between Pickup and Destination: {distance_km} km")
-
-            # Calculate estimated arrival time at 80 km/h speed
-            estimated_time_minutes = (distance_km / 80) * 60  # ETA in minutes
-            print(f"Estimated Arrival Time: {estimated_time_minutes} minutes")
-
-            # Calculate the arrival time by subtracting estimated time from request time
-            if request_time:
-                arrival_time = request_time + timedelta(minutes=estimated_time_minutes)
-                print(f"Calculated Arrival Time: {arrival_time}")
+            # Calculate the arrival time by adding the estimated time to the request time
+            if request_time_ms is not None and estimated_time_minutes is not None:
+                arrival_ms = timeutil.after_ms(estimated_time_minutes, request_time_ms)
 
                 # Format the arrival time to match "YYYY-MM-DD HH:MM:SS"
-                formatted_arrival_time = arrival_time.strftime("%Y-%m-%d %H:%M:%S")
+                formatted_arrival_time = timeutil.from_ms(arrival_ms).strftime("%Y-%m-%d %H:%M:%S")
                 print(f"Formatted Arrival Time: {formatted_arrival_time}")
-                has_arrived = datetime.now() >= arrival_time
+                has_arrived = timeutil.now_ms() >= arrival_ms
             else:
                 formatted_arrival_time = None
                 has_arrived = False
@@ -1362,51 +2341,13 @@ def tracking():
 
 # Function to calculate real-time average speed
 def calculate_realtime_average_speed(ambulance_id):
-    # Fetch all location points for the given ambulance
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT latitude, longitude, timestamp
-        FROM ambulance_locations
-        WHERE ambulance_id = ?
-        ORDER BY timestamp
-    ''', (ambulance_id,))
-    locations = cursor.fetchall()
-    conn.close()
-
-    if len(locations) < 2:
+    # Over the recent fixes held in the ambulance's trajectory buffer
+    trajectory = trajectories.get(trajectory_key(ambulance_id))
+    speed_kmh = trajectory.speed_kmh() if trajectory else None
+    if speed_kmh is None:
         print("Not enough data to calculate average speed.")
         return None
-
-    total_distance = 0
-    total_time = 0
-
-    # Iterate over all location points to calculate total distance and time
-    for i in range(1, len(locations)):
-        lat1, lon1, timestamp1 = locations[i - 1]
-        lat2, lon2, timestamp2 = locations[i]
-
-        # Calculate distance between consecutive points using Haversine formula
-        distance_km = geodesic((lat1, lon1), (lat2, lon2)).kilometers
-
-        # Parse timestamps as datetime objects
-        timestamp1 = datetime.fromtimestamp(timestamp1)
-        timestamp2 = datetime.fromtimestamp(timestamp2)
-
-        # Calculate time difference in hours
-        time_diff_hours = (timestamp2 - timestamp1).total_seconds() / 3600
-
-        if time_diff_hours > 0:
-            total_distance += distance_km
-            total_time += time_diff_hours
-
-    # Calculate average speed in km/h
-    if total_time > 0:
-        average_speed_kmh = total_distance / total_time
-        return round(average_speed_kmh, 2)
-    else:
-        return None
+    return round(speed_kmh, 2)
 
 # SocketIO event to send real-time average speed
 @socketio.on('request_average_speed')
@@ -1416,35 +2357,10 @@ def handle_request(ambulance_id):
 
 
 def calculate_current_speed(ambulance_id):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''SELECT latitude, longitude, timestamp
-                      FROM ambulance_locations
-                      WHERE ambulance_id = ?
-                      ORDER BY timestamp DESC LIMIT 2''', (ambulance_id,))
-    locations = cursor.fetchall()
-    conn.close()
-
-    if len(locations) < 2:
-        return None
-
-    lat1, lon1, timestamp1 = locations[0]
-    lat2, lon2, timestamp2 = locations[1]
-
-    # Calculate distance between the last two points
-    distance_km = geodesic((lat1, lon1), (lat2, lon2)).kilometers
-
-    # Calculate time difference in hours
-    timestamp1 = datetime.fromtimestamp(timestamp1)
-    timestamp2 = datetime.fromtimestamp(timestamp2)
-    time_diff_hours = (timestamp2 - timestamp1).total_seconds() / 3600
-
-    if time_diff_hours > 0:
-        current_speed = distance_km / time_diff_hours
-        return round(current_speed, 2)
-    else:
-        return None
+    # Between the last two fixes
+    trajectory = trajectories.get(trajectory_key(ambulance_id))
+    speed_kmh = trajectory.speed_kmh(2) if trajectory else None
+    return round(speed_kmh, 2) if speed_kmh is not None else None
 
 # SocketIO event to request current speed
 @socketio.on('request_current_speed')
@@ -1454,26 +2370,35 @@ def handle_request_current_speed(ambulance_id):
 
 @app.route('/get_latest_location/<int:ambulance_id>', methods=['GET'])
 def get_latest_location(ambulance_id):
+    conn = None
     try:
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
+        # Concurrent pollers of the same ambulance share one lookup for a moment
+        cached = location_cache.get(ambulance_id)
+        if cached:
+            data = cached[0]
+        else:
+            conn = shard_map.connect(ambulance_id)
+            cursor = conn.cursor()
 
-        # Fetch the latest location, status, and additional data (pickup, destination)
-        cursor.execute('''
-            SELECT al.latitude, al.longitude, al.status, 
-                   ar.patient_name, ar.pickup_lat, ar.pickup_lng, 
-                   ar.destination_lat, ar.destination_lng
-            FROM ambulance_locations al
-            JOIN ambulance_requests ar ON al.ambulance_id = ar.id
-            WHERE al.ambulance_id = ?
-            ORDER BY al.timestamp DESC LIMIT 1
-        ''', (ambulance_id,))
+            # Fetch the latest location, status, and additional data (pickup, destination)
+            cursor.execute('''
+                SELECT latitude, longitude, status, 
+                       patient_name, pickup_lat, pickup_lng, 
+                       destination_lat, destination_lng, timestamp_ms
+                FROM ambulance_latest
+                WHERE ambulance_id = ?
+            ''', (ambulance_id,))
 
-        data = cursor.fetchone()
+            data = cursor.fetchone()
+            if data:
+                location_cache.set(ambulance_id, data)
 
         if data:
-            latitude, longitude, status, patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng = data
-            return jsonify({
+            latitude, longitude, status, patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng, timestamp_ms = data
+            # The row only changes with a new fix or status, so it is its own version
+            # As Unix time: a naive local datetime would be read as UTC and be off by the server's offset
+            last_modified = timestamp_ms / 1000 if timestamp_ms is not None else None
+            return conditional_json({
                 'latitude': latitude,
                 'longitude': longitude,
                 'status': status,
@@ -1482,7 +2407,7 @@ def get_latest_location(ambulance_id):
                 'pickup_lng': pickup_lng,
                 'destination_lat': destination_lat,
                 'destination_lng': destination_lng
-            })
+            }, make_etag(ambulance_id, data), last_modified=last_modified)
         else:
             return jsonify({'error': 'No location or status data available'}), 404
 
@@ -1490,48 +2415,54 @@ def get_latest_location(ambulance_id):
         return jsonify({'error': str(e)}), 500
 
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/gps_filter_stats')
+@login_required
+def gps_filter_stats():
+    # Fixes received, stored and dropped (and why) by this worker since it started
+    return jsonify(fix_filter.stats())
 
 
 @app.route('/update_location/<int:ambulance_id>', methods=['POST'])
 def update_location(ambulance_id):
     try:
-        # Connect to the database
-        conn = sqlite3.connect('users.db')
+        # Connect to the ambulance's shard
+        conn = shard_map.connect(ambulance_id)
         cursor = conn.cursor()
 
-        # Get latitude and longitude from the form and convert to float
-        latitude = float(request.form['latitude'])
-        longitude = float(request.form['longitude'])
-
-        # Check if the ambulance already has a recorded location
-        cursor.execute('SELECT * FROM ambulance_locations WHERE ambulance_id = ?', (ambulance_id,))
-        existing_location = cursor.fetchone()
-
-        # Update or insert the ambulance location
-        if existing_location:
-            cursor.execute('''
-                UPDATE ambulance_locations
-                SET latitude = ?, longitude = ?
-                WHERE ambulance_id = ?
-            ''', (latitude, longitude, ambulance_id))
+        # Packed fixes (wire.FIX, for this ambulance) or the latitude and longitude form fields
+        binary = request.mimetype == wire.MIMETYPE
+        if binary:
+            fixes = [locations.validate_fix(unit_id, lat, lng)[1:] + (age_s,)
+                     for unit_id, lat, lng, age_s in wire.decode_fixes(request.get_data())
+                     if unit_id == ambulance_id]
         else:
-            cursor.execute('''
-                INSERT INTO ambulance_locations (ambulance_id, latitude, longitude)
-                VALUES (?, ?, ?)
-            ''', (ambulance_id, latitude, longitude))
+            _, latitude, longitude = locations.validate_fix(ambulance_id, request.form['latitude'], request.form['longitude'])
+            fixes = [(latitude, longitude, 0)]
+
+        # Append to the history and refresh the latest position, unless the fix adds nothing new
+        for latitude, longitude, age_s in fixes:
+            if fix_filter.accept(ambulance_id, latitude, longitude, now=time.monotonic() - age_s):
+                record_location(cursor, ambulance_id, latitude, longitude, timestamp_ms=fix_timestamp(age_s))
 
         # Commit the transaction
         conn.commit()
+        if binary:
+            return '', 204
 
         # Flash success message and redirect to the appropriate page
         flash("Ambulance location updated", "success")
-        return redirect(url_for('home'))  # Update to the correct endpoint if necessary
+        return redirect(url_for('index'))
 
     except Exception as e:
+        if request.mimetype == wire.MIMETYPE:
+            return jsonify({'error': str(e)}), 400
         # Flash error message in case of failure
         flash(f"Error updating ambulance location: {str(e)}", "error")
-        return redirect(url_for('home'))  # Update to the correct endpoint if necessary
+        return redirect(url_for('index'))
 
     finally:
         # Ensure the connection is closed
@@ -1559,6 +2490,8 @@ def privacy_policy():
     return render_template('privacy_policy.html', title="Privacy Policy")
 
 if __name__ == '__main__':
+    create_app()
+    start_background_services()
     app.run(debug=True, host='0.0.0.0', port=5001, ssl_context=('ssl/server.crt', 'ssl/server.key.new'))
 
 # http request --> https 
\ No newline at end of file
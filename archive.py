@@ -0,0 +1,110 @@
+"""Hot/cold split of finished ambulance requests.
+
+Requests that reached a terminal state more than a threshold ago are moved,
+with their GPS history, from users.db into a separate archive database.
+The live tables that the dashboard, scheduler and dispatcher scan then only
+hold recent and active trips. Reports and searches that need old trips open
+their connection with shards.ShardMap.connect_all(), whose temporary views
+all_requests and all_locations span every shard and the archive.
+"""
+import sqlite3
+
+import timeutil
+
+TERMINAL_STATUSES = ('Patient Reached', 'Rejected')
+ARCHIVED_TABLES = ('ambulance_requests', 'ambulance_locations')
+
+
+def columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def attach(conn, archive_path):
+    """Attach the archive as schema `archive`, creating or widening its tables to match the live ones."""
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+    for table in ARCHIVED_TABLES:
+        create_sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table,)).fetchone()[0]
+        archived = columns(conn, 'archive', table)
+        if not archived:
+            # SQLite stores the statement normalised to "CREATE TABLE <name> (..."
+            conn.execute(create_sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE archive.{table}', 1))
+            archived = columns(conn, 'archive', table)
+        # Columns added to the live table since the archive was created
+        types = {row[1]: row[2] for row in conn.execute(f'PRAGMA main.table_info({table})')}
+        for column in columns(conn, 'main', table):
+            if column not in archived:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column} {types[column]}')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_patient_name ON ambulance_requests(patient_name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_locations ON ambulance_locations(ambulance_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_request_time ON ambulance_requests(request_time_ms)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_locations_time ON ambulance_locations(timestamp_ms)')
+
+
+def archive_requests(path, archive_path, older_than_days=30, batch_size=500, core_path=None):
+    """Move finished requests older than the threshold and their locations to the archive.
+
+    For a region shard (see shards.py), core_path is users.db, which keeps the
+    archived counts. Each batch is one transaction over both databases. With a rollback journal
+    the commit is atomic across them; in WAL mode a crash can at worst leave a
+    batch copied but not yet deleted, which the next run copies again (the
+    inserts replace by id) and then deletes. Returns the number of requests moved.
+    """
+    cutoff_ms = timeutil.after_ms(-older_than_days * 1440)
+    conn = sqlite3.connect(path, timeout=30)
+    if core_path:
+        conn.execute('ATTACH DATABASE ? AS core', (core_path,))
+    attach(conn, archive_path)
+    request_columns = ', '.join(columns(conn, 'main', 'ambulance_requests'))
+    location_columns = ', '.join(columns(conn, 'main', 'ambulance_locations'))
+    placeholders = ', '.join('?' for _ in TERMINAL_STATUSES)
+
+    moved = 0
+    try:
+        while True:
+            # Finished trips are dated by their arrival when it is known, otherwise by the booking
+            ids = [row[0] for row in conn.execute(f'''
+                SELECT id FROM main.ambulance_requests
+                WHERE status IN ({placeholders}) AND COALESCE(arrival_time_ms, request_time_ms) < ?
+                ORDER BY id LIMIT ?''', (*TERMINAL_STATUSES, cutoff_ms, batch_size))]
+            if not ids:
+                break
+
+            id_list = ', '.join(str(request_id) for request_id in ids)
+            with conn:
+                conn.execute(f'''INSERT OR REPLACE INTO archive.ambulance_requests ({request_columns})
+                                 SELECT {request_columns} FROM main.ambulance_requests WHERE id IN ({id_list})''')
+                conn.execute(f'''INSERT OR REPLACE INTO archive.ambulance_locations ({location_columns})
+                                 SELECT {location_columns} FROM main.ambulance_locations WHERE ambulance_id IN ({id_list})''')
+                # Keep the dashboard totals including archived requests
+                conn.execute(f'''INSERT INTO archived_counts (status, count)
+                                 SELECT status, COUNT(*) FROM main.ambulance_requests WHERE id IN ({id_list}) GROUP BY status
+                                 ON CONFLICT(status) DO UPDATE SET count = count + excluded.count''')
+                conn.execute(f'DELETE FROM main.ambulance_locations WHERE ambulance_id IN ({id_list})')
+                conn.execute(f'DELETE FROM main.ambulance_latest WHERE ambulance_id IN ({id_list})')
+                conn.execute(f'DELETE FROM main.ambulance_requests WHERE id IN ({id_list})')
+            moved += len(ids)
+    finally:
+        conn.close()
+    return moved
+
+
+def delete_archived_request(conn, request_id):
+    # Remove an archived request (conn must have the archive attached); returns True when one was found
+    row = conn.execute('SELECT status FROM archive.ambulance_requests WHERE id = ?', (request_id,)).fetchone()
+    if row is None:
+        return False
+    conn.execute('DELETE FROM archive.ambulance_locations WHERE ambulance_id = ?', (request_id,))
+    conn.execute('DELETE FROM archive.ambulance_requests WHERE id = ?', (request_id,))
+    conn.execute('UPDATE archived_counts SET count = count - 1 WHERE status IS ?', (row[0],))
+    return True
+
+
+if __name__ == '__main__':
+    # Archive by hand: python archive.py [days]
+    import sys
+
+    import config
+
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else config.ARCHIVE_AFTER_DAYS
+    print(f"Archived {archive_requests('users.db', config.ARCHIVE_DB, days)} requests older than {days:g} days.")
@@ -0,0 +1,86 @@
+"""Serve the optimized static files produced by build_assets.py.
+
+Templates keep calling url_for('static', filename=...); once static/dist has
+been built those URLs point at the fingerprinted copies under /assets/,
+which are served with far-future immutable caching and, for CSS/JS, the
+precompressed .br/.gz file the browser accepts. Without a build everything
+falls back to Flask's normal static handler.
+"""
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory, url_for
+
+DIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+manifest = {}
+
+
+def load_manifest(dist_dir=DIST_DIR):
+    path = os.path.join(dist_dir, 'manifest.json')
+    if not os.path.exists(path):
+        print("static/dist not built; serving unoptimized static files.")
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def preferred_format(entry):
+    # Modern browsers list image/avif and image/webp in their Accept header
+    accept = request.headers.get('Accept', '') if request else ''
+    for fmt in ('avif', 'webp'):
+        if fmt in entry.get('variants', {}) and f'image/{fmt}' in accept:
+            return fmt
+    return None
+
+
+def asset_url_for(endpoint, **values):
+    # Drop-in replacement for url_for that rewrites static files to their built version
+    if endpoint == 'static':
+        entry = manifest.get(values.get('filename'))
+        if entry:
+            fmt = preferred_format(entry)
+            if fmt:
+                sizes = entry['variants'][fmt]
+                values['filename'] = sizes[max(sizes, key=int)]
+            else:
+                values['filename'] = entry['file']
+            return url_for('assets', **values)
+    return url_for(endpoint, **values)
+
+
+def asset_srcset(filename):
+    # "url 200w, url 480w, ..." for responsive <img srcset>, empty when there is no build
+    entry = manifest.get(filename)
+    if not entry or 'variants' not in entry:
+        return ''
+    fmt = preferred_format(entry) or os.path.splitext(entry['file'])[1].lstrip('.').replace('jpg', 'jpeg')
+    sizes = entry['variants'][fmt]
+    return ', '.join(f"{url_for('assets', filename=path)} {width}w"
+                     for width, path in sorted(sizes.items(), key=lambda item: int(item[0])))
+
+
+def serve_asset(filename):
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(DIST_DIR, filename)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    manifest.clear()
+    manifest.update(load_manifest())
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    # Globals rather than a context processor so imported macros see them too
+    app.jinja_env.globals['url_for'] = asset_url_for
+    app.jinja_env.globals['asset_srcset'] = asset_srcset
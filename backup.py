@@ -0,0 +1,122 @@
+"""Online snapshots of users.db through SQLite's backup API.
+
+Copying the database file while request threads and the status thread write
+to it can give a torn copy. Snapshots are taken with the backup API instead,
+a bounded number of pages per step with a pause between steps, so the copy
+only holds a read lock for one short step at a time and writers carry on in
+between. A write through another connection makes SQLite restart the copy;
+when that happens more than max_restarts times (a steady write load on a
+large file) the rest is copied in one step, which in WAL mode is a single
+read transaction that writers do not wait for.
+
+Each snapshot is written under a temporary name, checked with PRAGMA
+integrity_check, and only then renamed into place; the oldest snapshots
+beyond `keep` are deleted.
+
+    python backup.py [directory]
+"""
+import glob
+import os
+import sqlite3
+import time
+
+PREFIX = 'users'
+
+
+class SnapshotFailed(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy(source, target, pages_per_step=256, pause=0.01, max_restarts=20):
+    """Copy source into target in steps; returns {'steps', 'restarts', 'single_step'}."""
+    stats = {'steps': 0, 'restarts': 0, 'single_step': False}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        # Remaining pages only go up when SQLite started the copy over
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+
+    try:
+        source.backup(target, pages=pages_per_step, progress=progress, sleep=pause)
+    except _TooManyRestarts:
+        source.backup(target, pages=-1)
+        stats['single_step'] = True
+    return stats
+
+
+def check(path):
+    # None when the file passes PRAGMA integrity_check, otherwise the first problems reported
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as e:
+        problems = [str(e)]
+    finally:
+        conn.close()
+    return None if problems == ['ok'] else '; '.join(problems[:5])
+
+
+def snapshots(directory, prefix=PREFIX):
+    # Finished snapshots, oldest first (the names sort by time)
+    return sorted(glob.glob(os.path.join(directory, f'{prefix}-*.db')))
+
+
+def rotate(directory, keep, prefix=PREFIX):
+    removed = snapshots(directory, prefix)[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def snapshot(path, directory, keep=7, pages_per_step=256, pause=0.01, max_restarts=20, prefix=PREFIX):
+    """Take a checked snapshot of the database at `path` into `directory` and rotate old ones.
+
+    Returns the snapshot's stats; raises SnapshotFailed (and keeps no file)
+    when the copy does not pass the integrity check.
+    """
+    os.makedirs(directory, exist_ok=True)
+    final = os.path.join(directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}.db")
+    partial = final + '.partial'
+    started = time.monotonic()
+
+    source = sqlite3.connect(path, timeout=30)
+    target = sqlite3.connect(partial)
+    try:
+        stats = copy(source, target, pages_per_step, pause, max_restarts)
+    finally:
+        target.close()
+        source.close()
+    copied = time.monotonic()
+
+    problem = check(partial)
+    if problem:
+        os.remove(partial)
+        raise SnapshotFailed(f"Snapshot of {path} failed the integrity check: {problem}")
+    os.replace(partial, final)
+
+    stats.update(path=final, bytes=os.path.getsize(final),
+                 copy_seconds=round(copied - started, 3),
+                 check_seconds=round(time.monotonic() - copied, 3),
+                 removed=len(rotate(directory, keep, prefix)))
+    return stats
+
+
+if __name__ == '__main__':
+    # Snapshot by hand: python backup.py [directory]
+    import sys
+
+    import config
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else config.BACKUP_DIR
+    print(snapshot('users.db', directory, config.BACKUP_KEEP, config.BACKUP_PAGES_PER_STEP,
+                   config.BACKUP_STEP_PAUSE_SECONDS, config.BACKUP_MAX_RESTARTS))
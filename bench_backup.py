@@ -0,0 +1,98 @@
+"""Measure what an online snapshot (backup.py) costs concurrent writers.
+
+    python bench_backup.py [rows]
+
+Builds a scratch WAL database with `rows` GPS fixes, then keeps a writer
+thread committing one fix at a time (like record_location) while nothing
+else runs, while a stepped snapshot is taken, and while the whole file is
+copied in a single step. Prints the writer's commit latency percentiles for
+each phase and how long the snapshot took.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import backup
+
+
+def build(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE ambulance_locations (id INTEGER PRIMARY KEY AUTOINCREMENT, ambulance_id INTEGER,
+                    latitude REAL, longitude REAL, timestamp TEXT, timestamp_ms INTEGER, status TEXT)''')
+    rng = random.Random(1)
+    conn.executemany('INSERT INTO ambulance_locations (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((rng.randrange(5000), 12.9 + rng.random(), 77.6 + rng.random(), '2024-01-01T00:00:00',
+                       1704067200000 + i, 'Pending') for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def write_latencies(path, stop):
+    # Commit one fix at a time until stopped; returns the commit latencies in ms
+    conn = sqlite3.connect(path, timeout=30)
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute('INSERT INTO ambulance_locations (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status) '
+                     "VALUES (1, 12.9, 77.6, '2024-01-01T00:00:00', 1704067200000, 'Pending')")
+        conn.commit()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.001)
+    conn.close()
+    return latencies
+
+
+def phase(path, action):
+    stop = threading.Event()
+    result = {}
+    writer = threading.Thread(target=lambda: result.update(latencies=write_latencies(path, stop)))
+    writer.start()
+    started = time.perf_counter()
+    detail = action()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+    return result['latencies'], elapsed, detail
+
+
+def single_step(path, directory):
+    source, target = sqlite3.connect(path), sqlite3.connect(os.path.join(directory, 'single.db'))
+    source.backup(target)
+    target.close()
+    source.close()
+    return ''
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        build(path, rows)
+        print(f"{rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        def stepped():
+            stats = backup.snapshot(path, os.path.join(directory, 'snapshots'))
+            return f"{stats['steps']} steps, {stats['restarts']} restarts, single step: {stats['single_step']}"
+
+        phases = {
+            'idle': lambda: time.sleep(2) or '',
+            'stepped snapshot': stepped,
+            'single-step copy': lambda: single_step(path, directory),
+        }
+        print(f"{'phase':<18}{'writes':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'took s':>9}")
+        for name, action in phases.items():
+            latencies, elapsed, detail = phase(path, action)
+            p99 = statistics.quantiles(latencies, n=100, method='inclusive')[98] if len(latencies) > 1 else latencies[0]
+            print(f"{name:<18}{len(latencies):>8}{statistics.median(latencies):>9.2f}{p99:>9.2f}"
+                  f"{max(latencies):>9.2f}{elapsed:>9.2f}  {detail}")
+
+
+if __name__ == '__main__':
+    main()
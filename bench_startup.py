@@ -0,0 +1,64 @@
+"""Measure how long a worker takes to boot.
+
+    python bench_startup.py [runs] [budget_ms]
+
+Each run is a fresh interpreter timing `import app` and `create_app()`
+separately; the median is compared against the budget (default 1000 ms) and
+the script exits non-zero when it is exceeded. The slowest imports of the
+last run are listed so regressions are easy to attribute.
+"""
+import statistics
+import subprocess
+import sys
+
+PROBE = r'''
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+ready = time.perf_counter()
+print(f"STARTUP {(imported - start) * 1000:.1f} {(ready - imported) * 1000:.1f}")
+'''
+
+
+def run_once():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE],
+                            capture_output=True, text=True, check=True)
+    line = next(l for l in result.stdout.splitlines() if l.startswith('STARTUP '))
+    import_ms, create_ms = map(float, line.split()[1:])
+
+    # -X importtime writes "import time: self | cumulative | module" to stderr
+    modules = []
+    for entry in result.stderr.splitlines():
+        if entry.startswith('import time:') and 'cumulative' not in entry:
+            _, cumulative, name = entry[len('import time:'):].split('|')
+            name = name[1:]  # drop the space after the separator; the rest is nesting
+            if name.startswith('  ') and not name.startswith('   '):  # modules imported by app itself
+                modules.append((int(cumulative) / 1000, name.strip()))
+    return import_ms, create_ms, sorted(modules, reverse=True)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    results = [run_once() for _ in range(runs)]
+    import_ms = statistics.median(r[0] for r in results)
+    create_ms = statistics.median(r[1] for r in results)
+    total_ms = import_ms + create_ms
+
+    print(f"import app:   {import_ms:7.1f} ms (median of {runs})")
+    print(f"create_app(): {create_ms:7.1f} ms")
+    print(f"total:        {total_ms:7.1f} ms (budget {budget_ms:.0f} ms)")
+    print("Slowest imports:")
+    for cumulative_ms, name in results[-1][2][:10]:
+        print(f"  {cumulative_ms:7.1f} ms  {name}")
+
+    if total_ms > budget_ms:
+        print("Startup is over budget.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Compare the JSON and binary (wire.py) encodings of GPS traffic.
+
+    python bench_wire.py [fixes]
+
+For uplink fixes and downlink location updates, prints the bytes per message
+and the microseconds to encode and decode one, for each format. JSON is
+measured the way Socket.IO carries it (json.dumps / json.loads of the dict).
+"""
+import json
+import random
+import sys
+import timeit
+
+import wire
+
+
+def sample(count):
+    rng = random.Random(1)
+    return [(rng.randrange(1, 5000), 12.9 + rng.uniform(-0.5, 0.5), 77.6 + rng.uniform(-0.5, 0.5),
+             rng.uniform(0, 40), rng.uniform(0, 60)) for _ in range(count)]
+
+
+def measure(encode, decode, items):
+    encoded = [encode(item) for item in items]
+    size = sum(len(message) for message in encoded) / len(items)
+    encode_us = timeit.timeit(lambda: [encode(item) for item in items], number=5) / 5 / len(items) * 1e6
+    decode_us = timeit.timeit(lambda: [decode(message) for message in encoded], number=5) / 5 / len(items) * 1e6
+    return size, encode_us, decode_us
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items = sample(count)
+
+    cases = {
+        'fix / json': (lambda f: json.dumps({'ambulance_id': f[0], 'latitude': f[1], 'longitude': f[2]}).encode(),
+                       json.loads),
+        'fix / binary': (lambda f: wire.encode_fix(f[0], f[1], f[2]),
+                         lambda m: next(wire.decode_fixes(m))),
+        'update / json': (lambda f: json.dumps({'ambulance_id': f[0], 'latitude': f[1], 'longitude': f[2],
+                                                'distance_km': round(f[3], 2), 'eta_minutes': round(f[4], 2)}).encode(),
+                          json.loads),
+        'update / binary': (lambda f: wire.encode_location_update(*f), wire.decode_location_update),
+    }
+
+    print(f"{'message / format':<18}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, (encode, decode) in cases.items():
+        size, encode_us, decode_us = measure(encode, decode, items)
+        print(f"{name:<18}{size:>8.1f}{encode_us:>12.2f}{decode_us:>12.2f}")
+
+    # Buffered fixes sent together amortise the per-message overhead further
+    batch = b''.join(wire.encode_fix(f[0], f[1], f[2], age_s=i) for i, f in enumerate(items[:10]))
+    print(f"10 buffered fixes in one binary message: {len(batch)} bytes")
+
+
+if __name__ == '__main__':
+    main()
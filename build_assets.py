@@ -0,0 +1,276 @@
+"""Build optimized static assets into static/dist.
+
+    python build_assets.py
+
+* images get resized variants plus WebP (and AVIF where Pillow supports it),
+* CSS and JS are minified; CSS backgrounds keep a plain url() to the
+  optimized file and add an image-set() of the AVIF/WebP variants, with
+  smaller widths under max-width media queries,
+* every output file name carries a content hash so it can be cached forever,
+* text files are precompressed with gzip (and brotli when installed).
+
+static/dist/manifest.json maps each source path to its outputs; assets.py
+reads it at runtime. Image variants need Pillow and .br files need brotli
+(pip install Pillow brotli); without them those steps are skipped.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+IMAGE_WIDTHS = (200, 480, 960, 1920)
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+TEXT_EXTENSIONS = {'.css', '.js'}
+IMAGE_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif'}
+CSS_URL = re.compile(r"url\((['\"]?)([^'\")]+)\1\)")
+CSS_RULE = re.compile(r'([^{};]+)\{([^{}]*)\}')
+CSS_IMAGE_DECLARATION = re.compile(r'([\w-]+)\s*:([^;{}]*url\([^)]*\)[^;{}]*)')
+
+try:
+    from PIL import Image, ImageSequence, features
+except ImportError:
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def fingerprint(relative_path, data):
+    # css/style.css -> css/style.3f2a9c1e.css
+    stem, ext = os.path.splitext(relative_path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:8]}{ext}"
+
+
+def write_output(relative_path, data, compress=False):
+    path = os.path.join(DIST_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if compress:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{}:;,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    # Conservative: drop comment-only lines, indentation and blank lines, nothing that could change semantics
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+    return '\n'.join(lines)
+
+
+def image_frames(image, width):
+    frames = [frame.convert('RGBA') for frame in ImageSequence.Iterator(image)]
+    if width != image.width:
+        height = round(image.height * width / image.width)
+        frames = [frame.resize((width, height), Image.LANCZOS) for frame in frames]
+    return frames
+
+
+def encode_image(frames, fmt, duration):
+    buffer = io.BytesIO()
+    options = {
+        'JPEG': {'quality': 80, 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'GIF': {'optimize': True},
+        'WEBP': {'quality': 78, 'method': 6},
+        'AVIF': {'quality': 60},
+    }[fmt]
+    first = frames[0].convert('RGB') if fmt == 'JPEG' else frames[0]
+    if len(frames) > 1:
+        if fmt == 'WEBP':
+            options['method'] = 4  # method 6 takes minutes on long animations
+        options.update(save_all=True, append_images=frames[1:], loop=0, duration=duration)
+    first.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def build_image(relative_path, manifest):
+    source = os.path.join(STATIC_DIR, relative_path)
+    with open(source, 'rb') as f:
+        original = f.read()
+
+    if Image is None:
+        # No Pillow: still fingerprint the original so it can be cached
+        output = fingerprint(relative_path, original)
+        write_output(output, original)
+        manifest[relative_path] = {'file': output}
+        return
+
+    image = Image.open(source)
+    animated = getattr(image, 'is_animated', False)
+    duration = image.info.get('duration', 100)
+    stem, ext = os.path.splitext(relative_path)
+    base_format = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}[ext.lower()]
+    formats = [base_format] + [fmt for fmt in ('WEBP', 'AVIF') if fmt != base_format]
+    if animated or not features.check('avif'):
+        formats = [fmt for fmt in formats if fmt != 'AVIF']
+
+    # Nothing is displayed wider than the largest width, so bigger originals are not kept
+    widths = [w for w in IMAGE_WIDTHS if w < image.width]
+    if image.width <= max(IMAGE_WIDTHS):
+        widths.append(image.width)
+    variants = {}
+    for width in widths:
+        frames = image_frames(image, width)
+        for fmt in formats:
+            data = encode_image(frames, fmt, duration)
+            if fmt == base_format and width == image.width and len(data) >= len(original):
+                data = original  # never ship a bigger file than the source
+            suffix = {'JPEG': ext, 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp', 'AVIF': '.avif'}[fmt]
+            output = fingerprint(f"{stem}-{width}{suffix}", data)
+            write_output(output, data)
+            variants.setdefault(fmt.lower(), {})[width] = output
+
+    manifest[relative_path] = {
+        'file': variants[base_format.lower()][max(widths)],
+        'width': image.width,
+        'variants': {fmt: {str(w): path for w, path in sorted(sizes.items())} for fmt, sizes in variants.items()},
+    }
+
+
+def css_url(path, base_dir):
+    return f"url({os.path.relpath(path, base_dir).replace(os.sep, '/')})"
+
+
+def image_set(entry, width, base_dir):
+    # AVIF, then WebP, then the base format at each resolution: the browser takes the first type it supports.
+    # 1x screens get the variant at least `width` wide, 2x screens one twice as wide (or the widest there is)
+    candidates = []
+    for fmt in sorted(entry['variants'], key=list(IMAGE_TYPES).index):
+        sizes = {int(w): path for w, path in entry['variants'][fmt].items()}
+        normal = min((w for w in sizes if w >= width), default=max(sizes))
+        hidpi = min((w for w in sizes if w >= 2 * width), default=max(sizes))
+        candidates.append(f'{css_url(sizes[normal], base_dir)} type("{IMAGE_TYPES[fmt]}") 1x')
+        if hidpi != normal:
+            candidates.append(f'{css_url(sizes[hidpi], base_dir)} type("{IMAGE_TYPES[fmt]}") 2x')
+    return f"image-set({','.join(candidates)})"
+
+
+def variant_widths(entry):
+    return sorted(int(w) for w in next(iter(entry['variants'].values())))
+
+
+def rewrite_css_images(text, relative_path, manifest):
+    base_dir = os.path.dirname(relative_path)
+
+    def image_entry(target):
+        if target.startswith(('data:', 'http:', 'https:', '//')):
+            return None
+        return manifest.get(os.path.normpath(os.path.join(base_dir, target)).replace(os.sep, '/'))
+
+    # Runs on minified CSS, so a rule's selector carries no comments or whitespace around it
+    def rewrite_rule(match):
+        selector, body = match.groups()
+        responsive = {}  # max-width -> declarations of the narrower variants
+
+        def rewrite_declaration(declaration):
+            prop, value = declaration.groups()
+            entries = [entry for entry in map(image_entry, (url.group(2) for url in CSS_URL.finditer(value)))
+                       if entry and 'variants' in entry]
+            if not entries:
+                return declaration.group(0)
+
+            def with_images(render, images_only=False):
+                def replace(url):
+                    entry = image_entry(url.group(2))
+                    if not entry:
+                        return url.group(0)
+                    return render(entry) if 'variants' in entry else css_url(entry['file'], base_dir)
+                if images_only:
+                    # Just the layers' images: the shorthand would reset the rule's later background-* properties
+                    return f"background-image:{','.join(map(replace, CSS_URL.finditer(value)))}"
+                return f"{prop}:{CSS_URL.sub(replace, value)}"
+
+            # The plain url() first, for browsers without image-set(); they drop the second declaration
+            widths = sorted({w for entry in entries for w in variant_widths(entry)})
+            rewritten = [with_images(lambda entry: css_url(entry['file'], base_dir)),
+                         with_images(lambda entry: image_set(entry, widths[-1], base_dir))]
+            for width in widths[:-1]:
+                responsive.setdefault(width, []).append(
+                    with_images(lambda entry: image_set(entry, width, base_dir), images_only=(prop == 'background')))
+            return ';'.join(rewritten)
+
+        body = CSS_IMAGE_DECLARATION.sub(rewrite_declaration, body)
+        # Widest first, so the narrowest matching query comes last and wins
+        media = ''.join(f"@media (max-width:{width}px){{{selector}{{{';'.join(declarations)}}}}}"
+                        for width, declarations in sorted(responsive.items(), reverse=True))
+        return f"{selector}{{{body}}}{media}"
+
+    text = CSS_RULE.sub(rewrite_rule, text)
+
+    # Any other reference (fonts, cursors, images outside a rule) just points at the optimized file
+    def replace_url(match):
+        entry = image_entry(match.group(2))
+        return css_url(entry['file'], base_dir) if entry else match.group(0)
+    return CSS_URL.sub(replace_url, text)
+
+
+def build_text(relative_path, manifest):
+    with open(os.path.join(STATIC_DIR, relative_path), encoding='utf-8') as f:
+        text = f.read()
+
+    if relative_path.endswith('.css'):
+        text = rewrite_css_images(minify_css(text), relative_path, manifest)
+    else:
+        text = minify_js(text)
+
+    data = text.encode('utf-8')
+    output = fingerprint(relative_path, data)
+    write_output(output, data, compress=True)
+    manifest[relative_path] = {'file': output}
+
+
+def main():
+    if os.path.exists(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    sources = []
+    for root, _, files in os.walk(STATIC_DIR):
+        for name in files:
+            relative_path = os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/')
+            sources.append(relative_path)
+
+    manifest = {}
+    # Images first so CSS can refer to their outputs
+    for relative_path in sorted(sources):
+        if os.path.splitext(relative_path)[1].lower() in IMAGE_EXTENSIONS:
+            build_image(relative_path, manifest)
+    for relative_path in sorted(sources):
+        if os.path.splitext(relative_path)[1].lower() in TEXT_EXTENSIONS:
+            build_text(relative_path, manifest)
+
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    before = sum(os.path.getsize(os.path.join(STATIC_DIR, p)) for p in manifest)
+    after = sum(os.path.getsize(os.path.join(DIST_DIR, e['file'])) for e in manifest.values())
+    print(f"Built {len(manifest)} assets: {before / 1024:.0f} KB -> {after / 1024:.0f} KB (before WebP/AVIF and compression)")
+    if Image is None:
+        print("Pillow is not installed; images were fingerprinted but not resized or converted.")
+    if brotli is None:
+        print("brotli is not installed; only gzip files were written.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Average ambulance speed used for straight-line ETA estimates
+AMBULANCE_SPEED_KMH = float(os.getenv('AMBULANCE_SPEED_KMH', 80))
+
+# Dispatch engine settings
+DISPATCH_CELL_DEG = float(os.getenv('DISPATCH_CELL_DEG', 0.01))  # ~1.1 km grid cells
+DISPATCH_CANDIDATES = int(os.getenv('DISPATCH_CANDIDATES', 8))  # nearest units considered per request
+DISPATCH_MAX_KM = float(os.getenv('DISPATCH_MAX_KM', 50))  # ignore units further away than this
+DISPATCH_BATCH_SECONDS = float(os.getenv('DISPATCH_BATCH_SECONDS', 5))  # how long bookings are collected before solving
+
+# Geofences around the pickup point and destination of active trips
+GEOFENCE_PICKUP_RADIUS_M = float(os.getenv('GEOFENCE_PICKUP_RADIUS_M', 100))
+GEOFENCE_DESTINATION_RADIUS_M = float(os.getenv('GEOFENCE_DESTINATION_RADIUS_M', 200))
+GEOFENCE_DEBOUNCE_FIXES = int(os.getenv('GEOFENCE_DEBOUNCE_FIXES', 2))  # consecutive fixes before enter/exit fires
+GEOFENCE_CELL_DEG = float(os.getenv('GEOFENCE_CELL_DEG', 0.01))  # must be wider than the largest fence
+
+# Multi-process deployment
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')  # e.g. redis://localhost:6379/0 or sqlite:///socketio_queue.db
+SOCKETIO_WEBSOCKET_ONLY = os.getenv('SOCKETIO_WEBSOCKET_ONLY', '0') == '1'  # no long-polling, so no sticky sessions needed
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', 30))
+
+# Response caching for polled JSON endpoints
+LOCATION_CACHE_SECONDS = float(os.getenv('LOCATION_CACHE_SECONDS', 1))  # latest fix, shared by concurrent pollers
+HOSPITAL_CACHE_SECONDS = float(os.getenv('HOSPITAL_CACHE_SECONDS', 600))  # Places results change rarely
+HOSPITAL_CACHE_SNAP_DEG = float(os.getenv('HOSPITAL_CACHE_SNAP_DEG', 0.001))  # ~110 m; nearby searches share an entry
+
+# Finished requests move to a separate archive database after a while
+ARCHIVE_DB = os.getenv('ARCHIVE_DB', 'archive.db')
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', 3600))
+
+# Response-time analytics are grouped by pickup area cells of this size
+ANALYTICS_AREA_DEG = float(os.getenv('ANALYTICS_AREA_DEG', 0.05))  # ~5 km
+
+# Demand heatmap of request origins
+HEATMAP_MIN_ZOOM = int(os.getenv('HEATMAP_MIN_ZOOM', 3))
+HEATMAP_MAX_ZOOM = int(os.getenv('HEATMAP_MAX_ZOOM', 16))
+HEATMAP_CACHE_SECONDS = float(os.getenv('HEATMAP_CACHE_SECONDS', 60))  # how stale a served tile may be
+
+# GPS ingestion: fixes that add nothing are neither stored nor broadcast
+GPS_MIN_DISTANCE_M = float(os.getenv('GPS_MIN_DISTANCE_M', 10))  # dead-band; smaller moves are noise or a parked unit
+GPS_MIN_INTERVAL_SECONDS = float(os.getenv('GPS_MIN_INTERVAL_SECONDS', 1))  # per-ambulance rate limit
+GPS_HEARTBEAT_SECONDS = float(os.getenv('GPS_HEARTBEAT_SECONDS', 60))  # a fix is stored at least this often
+
+# Recent fixes per ambulance kept in memory for speed and replay
+TRAJECTORY_CAPACITY = int(os.getenv('TRAJECTORY_CAPACITY', 128))  # points per ambulance
+TRAJECTORY_MAX_AMBULANCES = int(os.getenv('TRAJECTORY_MAX_AMBULANCES', 2048))  # least recently updated are dropped
+
+# Road routes of active trips, fetched once and followed locally for ETAs
+ROUTE_DEVIATION_M = float(os.getenv('ROUTE_DEVIATION_M', 75))  # further off the route than this means re-routing
+ROUTE_RETRY_SECONDS = float(os.getenv('ROUTE_RETRY_SECONDS', 60))  # at most one Directions call per trip per interval
+ROUTE_CACHE_SECONDS = float(os.getenv('ROUTE_CACHE_SECONDS', 3600))
+
+# Asyncio GPS ingestion gateway (gateway.py)
+GATEWAY_HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = int(os.getenv('GATEWAY_PORT', 8765))
+GATEWAY_QUEUE_SIZE = int(os.getenv('GATEWAY_QUEUE_SIZE', 50000))  # fixes buffered before vehicles are told to retry
+GATEWAY_BATCH_SIZE = int(os.getenv('GATEWAY_BATCH_SIZE', 500))  # fixes per write transaction
+GATEWAY_FLUSH_SECONDS = float(os.getenv('GATEWAY_FLUSH_SECONDS', 0.2))  # longest a fix waits for its batch
+GATEWAY_RETRY_SECONDS = float(os.getenv('GATEWAY_RETRY_SECONDS', 1))  # pause before rewriting a batch that failed
+GATEWAY_POLL_SECONDS = float(os.getenv('GATEWAY_POLL_SECONDS', 0.2))  # how often the app's leader takes the gateway's fixes; 0 turns it off
+GATEWAY_FIX_MAX_AGE_SECONDS = float(os.getenv('GATEWAY_FIX_MAX_AGE_SECONDS', 120))  # older ones are stored but not tracked
+
+# PDF reports are rendered in a process pool (report_jobs.py)
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))  # processes per web worker
+REPORT_QUEUE_DEPTH = int(os.getenv('REPORT_QUEUE_DEPTH', 8))  # jobs in flight per web worker before new ones are refused
+REPORT_WAIT_SECONDS = float(os.getenv('REPORT_WAIT_SECONDS', 30))  # how long /download_pdf waits for its job
+REPORT_JOB_TIMEOUT_SECONDS = float(os.getenv('REPORT_JOB_TIMEOUT_SECONDS', 120))
+REPORT_INLINE_WHEN_IDLE = os.getenv('REPORT_INLINE_WHEN_IDLE', '1') == '1'  # render a lone report in the request
+
+# Region shards for requests and GPS history (shards.py), e.g. north=shards/north.db@28.0,76.5,29.5,78.0;south=...
+SHARD_REGIONS = os.getenv('SHARD_REGIONS', '')  # regions may be appended, never reordered
+
+# Bulk status changes and deletions from the dashboard
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 1000))  # ids per call; each shard's part is one write transaction
+
+# Precomputed nearest hospitals per grid cell of the service area (hospital_grid.py)
+HOSPITAL_GRID_BOUNDS = os.getenv('HOSPITAL_GRID_BOUNDS', '')  # min_lat,min_lng,max_lat,max_lng; empty turns the grid off
+HOSPITAL_GRID_CELL_DEG = float(os.getenv('HOSPITAL_GRID_CELL_DEG', 0.01))  # ~1.1 km cells
+HOSPITAL_GRID_RADII_M = [int(radius) for radius in os.getenv('HOSPITAL_GRID_RADII_M', '5000,10000,20000').split(',')]
+HOSPITAL_GRID_CANDIDATES = int(os.getenv('HOSPITAL_GRID_CANDIDATES', 20))  # nearest hospitals answered per lookup
+HOSPITAL_GRID_REFRESH_SECONDS = float(os.getenv('HOSPITAL_GRID_REFRESH_SECONDS', 24 * 3600))  # hospital list re-fetched
+HOSPITAL_GRID_SWEEP_M = int(os.getenv('HOSPITAL_GRID_SWEEP_M', 5000))  # Places search radius when sweeping the area
+
+# Online snapshots of users.db (backup.py)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_SECONDS = float(os.getenv('BACKUP_INTERVAL_SECONDS', 6 * 3600))  # 0 turns scheduled snapshots off
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 7))  # snapshots kept; older ones are deleted
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', 256))  # pages copied per lock
+BACKUP_STEP_PAUSE_SECONDS = float(os.getenv('BACKUP_STEP_PAUSE_SECONDS', 0.01))  # writers get the database between steps
+BACKUP_MAX_RESTARTS = int(os.getenv('BACKUP_MAX_RESTARTS', 20))  # then the rest is copied in one step
+
+# Live dashboard updates
+DASHBOARD_EVENTS_KEEP = int(os.getenv('DASHBOARD_EVENTS_KEEP', 5000))  # deltas a reconnecting dashboard can catch up on
+DASHBOARD_ETA_STEP_MINUTES = float(os.getenv('DASHBOARD_ETA_STEP_MINUTES', 1))  # live ETA changes smaller than this are not pushed
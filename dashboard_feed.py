@@ -0,0 +1,87 @@
+"""Sequenced change feed behind the admin dashboard's live updates.
+
+Every change a dashboard shows (new request, status change, ETA update,
+deletion) is stored as a row with a global sequence number in the same
+transaction as the change itself, then pushed to connected dashboards. A
+client remembers the last sequence it applied; after a reconnect it asks for
+everything newer, and only reloads the page when that is older than the
+retained backlog.
+"""
+import json
+import time
+
+CREATED = 'created'
+STATUS = 'status'
+ETA = 'eta'
+DELETED = 'deleted'
+
+ROW_COLUMNS = ('id', 'patient_name', 'pickup_location', 'destination', 'status', 'contact',
+               'estimated_arrival_time', 'estimated_completion_time')
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dashboard_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        request_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+    ''')
+
+
+def current_seq(cursor):
+    cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM dashboard_events')
+    return cursor.fetchone()[0]
+
+
+def status_counts(cursor, requests='ambulance_requests'):
+    # `requests` is the table or cross-shard view to count (see shards.py)
+    cursor.execute(f'SELECT status, COUNT(*) FROM {requests} GROUP BY status')
+    counts = dict(cursor.fetchall())
+    cursor.execute('SELECT status, count FROM archived_counts')
+    for status, count in cursor.fetchall():
+        counts[status] = counts.get(status, 0) + count
+    return counts
+
+
+def record(cursor, kind, request_id, html=None, counts=None):
+    """Store one delta for request_id in the caller's transaction and return it as sent to clients.
+
+    The row's current values are included (nothing for deletions), plus the
+    status totals so the summary boxes update without a query of their own
+    (passed in as `counts` when the requests span several shards).
+    """
+    event = {'kind': kind, 'id': request_id}
+    if kind != DELETED:
+        cursor.execute(f"SELECT {', '.join(ROW_COLUMNS)} FROM ambulance_requests WHERE id = ?", (request_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        event['row'] = {column: value if value is None or isinstance(value, (int, float)) else str(value)
+                        for column, value in zip(ROW_COLUMNS, row)}
+        if html is not None:
+            event['html'] = html
+    event['counts'] = counts if counts is not None else status_counts(cursor)
+
+    cursor.execute('INSERT INTO dashboard_events (kind, request_id, payload, created) VALUES (?, ?, ?, ?)',
+                   (kind, request_id, json.dumps(event), time.time()))
+    event['seq'] = cursor.lastrowid
+    return event
+
+
+def since(cursor, seq, limit=1000):
+    """Events after seq, or None when some of them were already pruned (the client must reload)."""
+    cursor.execute('SELECT MIN(seq), MAX(seq) FROM dashboard_events')
+    oldest, newest = cursor.fetchone()
+    if newest is None or seq >= newest:
+        return []
+    if oldest > seq + 1 or newest - seq > limit:
+        return None
+    cursor.execute('SELECT seq, payload FROM dashboard_events WHERE seq > ? ORDER BY seq', (seq,))
+    return [dict(json.loads(payload), seq=event_seq) for event_seq, payload in cursor.fetchall()]
+
+
+def prune(cursor, keep=5000):
+    cursor.execute('DELETE FROM dashboard_events WHERE seq <= (SELECT MAX(seq) FROM dashboard_events) - ?', (keep,))
@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from spatial import GridIndex
+
+
+class DispatchEngine:
+    """Keeps the available ambulances in a grid index and assigns them to requests.
+
+    Requests that are waiting at the same time are solved as one batch so that
+    the total ETA over the batch is minimal rather than whatever a first-come
+    greedy pick would give.
+    """
+
+    def __init__(self, cell_deg=0.01, speed_kmh=80, candidates=8, max_km=50):
+        self.units = GridIndex(cell_deg)
+        self.speed_kmh = speed_kmh
+        self.candidates = candidates
+        self.max_km = max_km
+        self.lock = threading.Lock()
+
+    def eta_minutes(self, distance_km):
+        return distance_km / self.speed_kmh * 60
+
+    def update_unit(self, unit_id, lat, lng, available=True):
+        with self.lock:
+            if available:
+                self.units.insert(unit_id, lat, lng)
+            else:
+                self.units.remove(unit_id)
+
+    def move_unit(self, unit_id, lat, lng):
+        # Track a free unit's position without changing its availability
+        with self.lock:
+            if unit_id in self.units:
+                self.units.insert(unit_id, lat, lng)
+
+    def remove_unit(self, unit_id):
+        with self.lock:
+            self.units.remove(unit_id)
+
+    def nearest_units(self, lat, lng, k=3):
+        # k nearest available units as (unit_id, distance_km, eta_minutes)
+        with self.lock:
+            nearest = self.units.nearest(lat, lng, k, self.max_km)
+        return [(unit_id, distance, self.eta_minutes(distance)) for unit_id, distance in nearest]
+
+    def dispatch(self, requests):
+        """Assign units to a batch of (request_id, lat, lng) waiting requests.
+
+        Assigned units are taken out of the index; requests that could not be
+        served are simply left out. Returns {request_id: (unit_id, eta_minutes)}.
+        """
+        with self.lock:
+            return self.assign_batch(requests)
+
+    def assign_batch(self, requests):
+        # Caller must hold self.lock (or own the engine exclusively)
+        if not requests or not len(self.units):
+            return {}
+
+        # Candidate edges: only the nearest few units of each request are considered
+        costs = []
+        for _, lat, lng in requests:
+            nearest = self.units.nearest(lat, lng, self.candidates, self.max_km)
+            costs.append([(unit_id, self.eta_minutes(distance)) for unit_id, distance in nearest])
+
+        matched = min_cost_assignment(costs)
+
+        assignments = {}
+        for row, unit_id in matched.items():
+            assignments[requests[row][0]] = (unit_id, dict(costs[row])[unit_id])
+            self.units.remove(unit_id)
+        return assignments
+
+
+def min_cost_assignment(costs):
+    """Minimum total cost matching of rows to columns over sparse candidate lists.
+
+    `costs[row]` is a list of (column, cost). Every row may also stay unassigned
+    at a penalty larger than the costliest edges of all rows together, so
+    leaving one more row out always costs more than any rearrangement saves:
+    the matching serves as many rows as possible first and minimises the
+    summed cost second. Rows are added one
+    at a time with a Dijkstra shortest augmenting path over the candidate edges
+    (the sparse form of the Hungarian method), which stays exact while only
+    touching the few units each request can actually reach. Returns {row: column}.
+    """
+    # Bounds the real cost of any matching, which uses at most one edge per row
+    penalty = sum(max((cost for _, cost in row), default=0) for row in costs) + 1
+    # Each row gets a private "stay unassigned" column
+    edges = [dict(row) for row in costs]
+    for row, candidates in enumerate(edges):
+        candidates[('unassigned', row)] = penalty
+
+    prices = {}  # column potentials
+    owner = {}   # column -> row
+    match = [None] * len(edges)  # row -> column
+    counter = itertools.count()
+
+    for source, candidates in enumerate(edges):
+        # Reduced costs are kept non-negative by the column prices
+        base = min(cost - prices.get(col, 0) for col, cost in candidates.items())
+        dist = {}
+        parent = {}
+        heap = []
+        for col, cost in candidates.items():
+            d = cost - prices.get(col, 0) - base
+            if d < dist.get(col, math.inf):
+                dist[col] = d
+                parent[col] = source
+                heapq.heappush(heap, (d, next(counter), col))
+
+        finalized = []
+        closed = set()
+        target = None
+        while heap:
+            d, _, col = heapq.heappop(heap)
+            if col in closed:
+                continue
+            closed.add(col)
+            finalized.append(col)
+            row = owner.get(col)
+            if row is None:
+                target = col
+                break
+            # The matched edge has zero reduced cost, which fixes the row's potential
+            row_base = edges[row][col] - prices.get(col, 0)
+            for next_col, cost in edges[row].items():
+                if next_col in closed:
+                    continue
+                nd = d + cost - prices.get(next_col, 0) - row_base
+                if nd < dist.get(next_col, math.inf):
+                    dist[next_col] = nd
+                    parent[next_col] = row
+                    heapq.heappush(heap, (nd, next(counter), next_col))
+
+        shortest = dist[target]
+        for col in finalized:
+            prices[col] = prices.get(col, 0) - (shortest - dist[col])
+
+        # Flip the augmenting path
+        col = target
+        while True:
+            row = parent[col]
+            previous = match[row]
+            match[row] = col
+            owner[col] = row
+            if row == source:
+                break
+            col = previous
+
+    return {row: col for row, col in enumerate(match)
+            if not (isinstance(col, tuple) and col[0] == 'unassigned')}
+
+
+def greedy_assignment(costs):
+    # First-come nearest-unit baseline, used by the benchmark for comparison
+    taken = set()
+    matched = {}
+    for row, candidates in enumerate(costs):
+        for col, _ in sorted(candidates, key=lambda item: item[1]):
+            if col not in taken:
+                taken.add(col)
+                matched[row] = col
+                break
+    return matched
+
+
+if __name__ == '__main__':
+    # Benchmark: python dispatch.py [units] [requests]
+    import random
+    import sys
+
+    unit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    request_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+
+    def random_point():
+        # Clustered around a city centre like real demand
+        return 27.70 + rng.gauss(0, 0.15), 85.32 + rng.gauss(0, 0.15)
+
+    engine = DispatchEngine()
+    start = time.perf_counter()
+    for unit_id in range(unit_count):
+        engine.update_unit(unit_id, *random_point())
+    print(f"Indexed {unit_count} units in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    points = [random_point() for _ in range(request_count)]
+    start = time.perf_counter()
+    for lat, lng in points:
+        engine.nearest_units(lat, lng, k=5)
+    per_query_ms = (time.perf_counter() - start) * 1000 / request_count
+    print(f"k-nearest (k=5): {per_query_ms:.3f} ms per query")
+
+    requests = [(i, lat, lng) for i, (lat, lng) in enumerate(points)]
+    costs = [[(unit_id, engine.eta_minutes(distance))
+              for unit_id, distance in engine.units.nearest(lat, lng, engine.candidates, engine.max_km)]
+             for _, lat, lng in requests]
+
+    start = time.perf_counter()
+    greedy = greedy_assignment(costs)
+    greedy_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    batch = min_cost_assignment(costs)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    def total_minutes(matched):
+        return sum(dict(costs[row])[col] for row, col in matched.items())
+
+    print(f"Greedy: {len(greedy)} assigned, total ETA {total_minutes(greedy):.1f} min in {greedy_ms:.1f} ms")
+    print(f"Batch:  {len(batch)} assigned, total ETA {total_minutes(batch):.1f} min in {batch_ms:.1f} ms")
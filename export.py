@@ -0,0 +1,147 @@
+"""Streaming exports of requests and GPS history as CSV or Parquet.
+
+Rows are read with fetchmany() from a single SELECT and written out batch by
+batch, so memory use does not depend on the size of the export. The SELECT
+runs inside one read transaction, which gives the whole export a consistent
+snapshot; with the database in WAL mode that reader never blocks the app's
+writes. Exports cover every shard and archived rows too (see shards.ShardMap.connect_all).
+Parquet needs pyarrow (pip install pyarrow); CSV has no extra dependencies.
+pyarrow is only imported when a Parquet export starts, so it doesn't add to
+every worker's startup.
+"""
+import csv
+import importlib.util
+import io
+
+# Export name -> (view, epoch-ms column used for the time range; see timeutil.py)
+DATASETS = {
+    'requests': ('all_requests', 'request_time_ms'),
+    'locations': ('all_locations', 'timestamp_ms'),
+}
+FORMATS = ('csv', 'parquet')
+BATCH_SIZE = 5000
+
+
+def parquet_available():
+    # Looked up without importing pyarrow
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def query(conn, dataset, start=None, end=None):
+    """Open a snapshot and return a cursor over the dataset for [start, end), given in epoch ms."""
+    view, time_column = DATASETS[dataset]
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f'{time_column} >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append(f'{time_column} < ?')
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    conn.execute('BEGIN')  # one read transaction for the whole export
+    return conn.execute(f'SELECT * FROM {view} {where} ORDER BY {time_column}', params)
+
+
+def batches(cursor, batch_size=BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def stream_csv(conn, dataset, start=None, end=None):
+    # Generator of CSV text chunks; closes the connection when done
+    try:
+        cursor = query(conn, dataset, start, end)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column[0] for column in cursor.description])
+        for rows in batches(cursor):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        conn.close()
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_type(pa, declared):
+    # SQLite column affinity -> Arrow type
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+
+def column_values(pa, values, arrow):
+    # SQLite is dynamically typed; values that don't fit the column's type become nulls
+    if pa.types.is_integer(arrow):
+        return [v if isinstance(v, int) else None for v in values]
+    if pa.types.is_floating(arrow):
+        return [float(v) if isinstance(v, (int, float)) else None for v in values]
+    return [None if v is None else str(v) for v in values]
+
+
+def stream_parquet(conn, dataset, start=None, end=None):
+    # Generator of Parquet bytes, one row group per batch; closes the connection when done
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        conn.close()
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+    try:
+        view = DATASETS[dataset][0]
+        declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({view})')}
+        cursor = query(conn, dataset, start, end)
+        names = [column[0] for column in cursor.description]
+        schema = pa.schema([(name, arrow_type(pa, declared.get(name))) for name in names])
+
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        for rows in batches(cursor):
+            arrays = [pa.array(column_values(pa, values, field.type), type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+        writer.close()  # writes the footer
+        yield sink.drain()
+    finally:
+        conn.close()
+
+
+def stream(conn, dataset, fmt, start=None, end=None):
+    return stream_parquet(conn, dataset, start, end) if fmt == 'parquet' else stream_csv(conn, dataset, start, end)
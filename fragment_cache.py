@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """LRU cache of rendered HTML fragments.
+
+    Each entry remembers the version it was rendered for; asking with a
+    different version is a miss, so bumping a version invalidates exactly
+    the fragments that depend on it.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (version, html)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, html):
+        with self.lock:
+            self.entries[key] = (version, html)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def render(self, key, version, render):
+        # Cached fragment for (key, version), rendering it on a miss
+        html = self.get(key, version)
+        if html is None:
+            html = render()
+            self.set(key, version, html)
+        return html
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,255 @@
+"""Standalone asyncio ingestion gateway for ambulance GPS fixes.
+
+    python gateway.py [port]
+
+Vehicles can send their fixes here instead of to the Flask workers, whose
+synchronous handlers hold a thread for every slow request. One event loop
+holds all the connections and never waits on SQLite: fixes are validated and
+filtered exactly as in the app (locations.validate_fix, gps_filter), queued
+in memory, and written in batches, one transaction per batch, by a writer
+task running on its own thread.
+
+Accepted input, the same payloads the app takes:
+    Socket.IO   event `update_location` with a JSON dict or packed wire.FIX records
+    WebSocket   /ws, text frames with the JSON dict, binary frames with packed records
+    HTTP        POST /update_location/<ambulance_id>, form fields or packed records
+GET /stats reports connections and counters.
+
+The gateway stores each fix (history and latest position) and, in the same
+transaction, queues it in users.db's gateway_fixes table. The app's leader
+drains that queue and runs the fixes through the same arrival detection,
+trip ETA and location broadcasts as fixes sent to the app itself. So trips
+reported through the gateway change status and show up moving on dashboards
+and trackers, provided an app process is running. A batch that cannot be
+written is kept and retried; meanwhile new fixes wait in the queue, and
+vehicles are told to retry once it is full.
+
+Run it against a database the app has already created. Needs aiohttp
+(in requirements.txt); python-socketio comes with Flask-SocketIO.
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from aiohttp import WSMsgType, web
+
+import config
+import locations
+import shards
+import timeutil
+import wire
+from gps_filter import FixFilter
+
+DATABASE = 'users.db'
+
+
+class FixWriter:
+    """Bounded in-memory queue of fixes drained into SQLite (or its region shards) by one writer task."""
+
+    def __init__(self, shard_map, queue_size, batch_size, flush_seconds, retry_seconds=1):
+        self.shard_map = shard_map
+        self.queue = asyncio.Queue(queue_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retry_seconds = retry_seconds
+        self.executor = ThreadPoolExecutor(max_workers=1)  # the only thread that touches the connections
+        self.conns = {}  # per shard
+        self.pending = []  # taken off the queue but not written yet; only the writer thread changes it
+        self.counters = {'queued': 0, 'written': 0, 'batches': 0, 'rejected': 0, 'failed': 0, 'dropped': 0}
+
+    def submit(self, fix):
+        # False when the queue is full; the caller tells the vehicle to retry
+        try:
+            self.queue.put_nowait(fix)
+        except asyncio.QueueFull:
+            self.counters['rejected'] += 1
+            return False
+        self.counters['queued'] += 1
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                # Fixes left over from a failed write go first, on their own
+                if self.pending:
+                    await loop.run_in_executor(self.executor, self.write, batch)
+                    if self.pending:
+                        await asyncio.sleep(self.retry_seconds)
+                    continue
+                batch.append(await self.queue.get())
+                # Collect more for a moment so one transaction carries many fixes
+                deadline = loop.time() + self.flush_seconds
+                while len(batch) < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Shutting down: the fixes already taken off the queue are still written
+                if batch:
+                    await loop.run_in_executor(self.executor, self.write, batch)
+                raise
+            await loop.run_in_executor(self.executor, self.write, batch)
+
+    def write(self, batch):
+        # Runs on the writer thread: the batch plus earlier unwritten fixes, one transaction per shard;
+        # fixes whose transaction fails stay in self.pending for the next attempt
+        by_shard = {}
+        for fix in self.pending + batch:
+            by_shard.setdefault(self.shard_map.shard_of_id(fix[0]), []).append(fix)
+        self.pending = []
+        for shard, fixes in by_shard.items():
+            try:
+                if shard not in self.conns:
+                    # Region shards get users.db attached, which holds the gateway_fixes queue
+                    self.conns[shard] = self.shard_map.connect(shard=shard)
+                conn = self.conns[shard]
+                with conn:
+                    cursor = conn.cursor()
+                    for ambulance_id, latitude, longitude, timestamp_ms in fixes:
+                        locations.record(cursor, ambulance_id, latitude, longitude, timestamp_ms=timestamp_ms)
+                    locations.queue_gateway_fixes(cursor, fixes)
+                self.counters['written'] += len(fixes)
+                self.counters['batches'] += 1
+            except sqlite3.Error as e:
+                self.counters['failed'] += len(fixes)
+                self.pending.extend(fixes)
+                print(f"Error writing {len(fixes)} fixes to {self.shard_map.paths[shard]}, will retry: {e}")
+
+    async def flush(self):
+        # Write whatever is still queued or pending (on shutdown); one last attempt
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.write, batch)
+        if self.pending:
+            self.counters['dropped'] += len(self.pending)
+            print(f"Shutting down with {len(self.pending)} fixes that could not be written.")
+
+
+class Gateway:
+    def __init__(self, path=DATABASE):
+        self.writer = FixWriter(shards.ShardMap(path, config.SHARD_REGIONS), config.GATEWAY_QUEUE_SIZE,
+                                config.GATEWAY_BATCH_SIZE, config.GATEWAY_FLUSH_SECONDS, config.GATEWAY_RETRY_SECONDS)
+        self.fix_filter = FixFilter(min_distance_m=config.GPS_MIN_DISTANCE_M,
+                                    min_interval_s=config.GPS_MIN_INTERVAL_SECONDS,
+                                    heartbeat_s=config.GPS_HEARTBEAT_SECONDS)
+        self.invalid = 0
+        self.connections = {'websocket': 0, 'socketio': 0}
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+        self.sio.on('connect', self.on_socketio_connect)
+        self.sio.on('disconnect', self.on_socketio_disconnect)
+        self.sio.on('update_location', self.on_socketio_fix)
+        self.writer_task = None
+
+    def ingest(self, ambulance_id, latitude, longitude, age_s=0):
+        """Validate, filter and queue one fix; False only when the queue is full."""
+        try:
+            ambulance_id, latitude, longitude = locations.validate_fix(ambulance_id, latitude, longitude)
+        except ValueError:
+            self.invalid += 1
+            return True
+        if not self.fix_filter.accept(ambulance_id, latitude, longitude, now=time.monotonic() - age_s):
+            return True
+        timestamp_ms = timeutil.now_ms() - round(age_s * 1000)
+        return self.writer.submit((ambulance_id, latitude, longitude, timestamp_ms))
+
+    def ingest_payload(self, data):
+        # A JSON dict or packed fixes; False when any fix was turned away
+        if isinstance(data, (bytes, bytearray)):
+            try:
+                fixes = list(wire.decode_fixes(data))
+            except ValueError:
+                self.invalid += 1
+                return True
+            return all([self.ingest(*fix) for fix in fixes])
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                data = None
+        if not isinstance(data, dict):
+            self.invalid += 1
+            return True
+        return self.ingest(data.get('ambulance_id'), data.get('latitude'), data.get('longitude'))
+
+    async def on_socketio_connect(self, sid, environ):
+        self.connections['socketio'] += 1
+
+    async def on_socketio_disconnect(self, sid):
+        self.connections['socketio'] -= 1
+
+    async def on_socketio_fix(self, sid, data):
+        self.ingest_payload(data)
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30, max_msg_size=64 * 1024)
+        await ws.prepare(request)
+        self.connections['websocket'] += 1
+        try:
+            async for message in ws:
+                if message.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    if not self.ingest_payload(message.data):
+                        await ws.send_str('busy')
+        finally:
+            self.connections['websocket'] -= 1
+        return ws
+
+    async def http_fix(self, request):
+        ambulance_id = request.match_info['ambulance_id']
+        if request.content_type == wire.MIMETYPE:
+            try:
+                fixes = [fix for fix in wire.decode_fixes(await request.read()) if str(fix[0]) == ambulance_id]
+            except ValueError as e:
+                return web.json_response({'error': str(e)}, status=400)
+        else:
+            form = await request.post()
+            fixes = [(ambulance_id, form.get('latitude'), form.get('longitude'), 0)]
+        invalid = self.invalid
+        accepted = all([self.ingest(*fix) for fix in fixes])
+        if self.invalid > invalid:
+            return web.json_response({'error': 'Invalid fix'}, status=400)
+        if not accepted:
+            return web.json_response({'error': 'Busy, retry later'}, status=503)
+        return web.Response(status=204)
+
+    async def stats(self, request):
+        return web.json_response({
+            'connections': self.connections,
+            'queue': self.writer.queue.qsize(),
+            'invalid': self.invalid,
+            'writer': self.writer.counters,
+            'filter': self.fix_filter.stats(),
+        })
+
+    async def start_writer(self, app):
+        self.writer_task = asyncio.create_task(self.writer.run())
+
+    async def stop_writer(self, app):
+        self.writer_task.cancel()
+        await asyncio.gather(self.writer_task, return_exceptions=True)
+        await self.writer.flush()
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024)
+        self.sio.attach(app)
+        app.router.add_get('/ws', self.websocket)
+        app.router.add_post('/update_location/{ambulance_id:\\d+}', self.http_fix)
+        app.router.add_get('/stats', self.stats)
+        app.on_startup.append(self.start_writer)
+        app.on_cleanup.append(self.stop_writer)
+        return app
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else config.GATEWAY_PORT
+    web.run_app(Gateway().make_app(), host=config.GATEWAY_HOST, port=port)
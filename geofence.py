@@ -0,0 +1,103 @@
+import threading
+import time
+
+from spatial import GridIndex, haversine_km
+
+PICKUP = 'pickup'
+DESTINATION = 'destination'
+
+
+class GeofenceEngine:
+    """In-memory circular fences around the pickup and destination of active trips.
+
+    Fences live in a grid whose cells are at least as large as the biggest
+    fence, so a fix only has to be compared with the fences in the 3x3 block
+    of cells around it. A fence only changes state after `debounce`
+    consecutive fixes agree, which keeps GPS jitter at the boundary from
+    producing enter/exit storms.
+    """
+
+    def __init__(self, cell_deg=0.01, debounce=2):
+        self.fences = GridIndex(cell_deg)
+        self.debounce = debounce
+        self.radius_km = {}   # (request_id, kind) -> radius
+        self.tracker = {}     # request_id -> ambulance_id whose fixes are checked
+        self.trips = {}       # ambulance_id -> set of request_ids
+        self.inside = {}      # (request_id, kind) -> confirmed inside/outside
+        self.streak = {}      # (request_id, kind) -> fixes disagreeing with the confirmed state
+        self.entered_at = {}  # (request_id, kind) -> time of the last confirmed enter
+        self.lock = threading.Lock()
+
+    def register(self, request_id, kind, lat, lng, radius_m, ambulance_id=None):
+        key = (request_id, kind)
+        with self.lock:
+            self.fences.insert(key, lat, lng)
+            self.radius_km[key] = radius_m / 1000
+            self.inside.setdefault(key, False)
+            self._track(request_id, request_id if ambulance_id is None else ambulance_id)
+
+    def _track(self, request_id, ambulance_id):
+        previous = self.tracker.get(request_id)
+        if previous is not None and previous != ambulance_id:
+            self.trips.get(previous, set()).discard(request_id)
+        self.tracker[request_id] = ambulance_id
+        self.trips.setdefault(ambulance_id, set()).add(request_id)
+
+    def unregister(self, request_id, kind=None):
+        with self.lock:
+            for fence_kind in ((kind,) if kind else (PICKUP, DESTINATION)):
+                key = (request_id, fence_kind)
+                self.fences.remove(key)
+                for state in (self.radius_km, self.inside, self.streak, self.entered_at):
+                    state.pop(key, None)
+            if not any((request_id, k) in self.fences for k in (PICKUP, DESTINATION)):
+                ambulance_id = self.tracker.pop(request_id, None)
+                self.trips.get(ambulance_id, set()).discard(request_id)
+
+    def rearm(self, request_id, kind):
+        # Forget whether the fence was entered, so the next fixes inside it count as a fresh enter
+        key = (request_id, kind)
+        with self.lock:
+            if key in self.radius_km:
+                self.inside[key] = False
+                self.streak[key] = 0
+                self.entered_at.pop(key, None)
+
+    def center(self, request_id, kind):
+        return self.fences.get((request_id, kind))
+
+    def is_inside(self, request_id, kind):
+        return self.inside.get((request_id, kind), False)
+
+    def evaluate(self, ambulance_id, lat, lng, now=None):
+        """Check one fix; returns a list of (request_id, kind, 'enter' | 'exit') events."""
+        now = now or time.time()
+        events = []
+        with self.lock:
+            requests = self.trips.get(ambulance_id)
+            if not requests:
+                return events
+
+            # Only fences in the cells around the fix can contain it; the trip's
+            # other fences are known to be outside without computing a distance
+            nearby = {key for key, _ in self.fences.nearby(lat, lng) if key[0] in requests}
+            for request_id in requests:
+                for kind in (PICKUP, DESTINATION):
+                    key = (request_id, kind)
+                    if key not in self.radius_km:
+                        continue
+                    inside = False
+                    if key in nearby:
+                        fence_lat, fence_lng = self.fences.get(key)
+                        inside = haversine_km(lat, lng, fence_lat, fence_lng) <= self.radius_km[key]
+                    if inside == self.inside[key]:
+                        self.streak[key] = 0
+                        continue
+                    self.streak[key] = self.streak.get(key, 0) + 1
+                    if self.streak[key] >= self.debounce:
+                        self.inside[key] = inside
+                        self.streak[key] = 0
+                        if inside:
+                            self.entered_at[key] = now
+                        events.append((request_id, kind, 'enter' if inside else 'exit'))
+        return events
@@ -0,0 +1,77 @@
+"""Ingestion filter for ambulance GPS fixes.
+
+Parked or slow ambulances report nearly the same position every few seconds.
+A fix is only stored and broadcast when it says something new: the status
+changed, the ambulance moved more than a dead-band distance, or nothing was
+stored for a heartbeat interval (so a silent history still shows the unit
+is alive). Fixes arriving faster than a minimum interval are dropped as well.
+State is per process; with several workers an ambulance that switches worker
+costs at most one extra stored fix.
+"""
+import threading
+import time
+
+from spatial import haversine_km
+
+
+class FixFilter:
+    def __init__(self, min_distance_m=10, min_interval_s=1, heartbeat_s=60):
+        self.min_distance_m = min_distance_m
+        self.min_interval_s = min_interval_s
+        self.heartbeat_s = heartbeat_s
+        self.last = {}  # ambulance id -> (latitude, longitude, status, monotonic time) of the last stored fix
+        self.lock = threading.Lock()
+        self.counters = {'received': 0, 'stored': 0, 'heartbeats': 0, 'status_changes': 0,
+                         'duplicates': 0, 'dead_band': 0, 'rate_limited': 0, 'broadcasts_suppressed': 0}
+
+    def accept(self, ambulance_id, latitude, longitude, status=None, now=None):
+        """True when the fix should be stored and broadcast; False when it is dropped."""
+        now = time.monotonic() if now is None else now
+        key = str(ambulance_id)
+        with self.lock:
+            self.counters['received'] += 1
+            last = self.last.get(key)
+            reason = self._drop_reason(last, latitude, longitude, status, now)
+            if reason:
+                self.counters[reason] += 1
+                return False
+
+            if last is not None:
+                if status is not None and status != last[2]:
+                    self.counters['status_changes'] += 1
+                elif now - last[3] >= self.heartbeat_s and self._moved_m(last, latitude, longitude) < self.min_distance_m:
+                    self.counters['heartbeats'] += 1
+            self.counters['stored'] += 1
+            self.last[key] = (latitude, longitude, status if status is not None else (last[2] if last else None), now)
+            return True
+
+    def _drop_reason(self, last, latitude, longitude, status, now):
+        if last is None or (status is not None and status != last[2]):
+            return None  # first fix and status changes always go through
+        elapsed = now - last[3]
+        if elapsed < self.min_interval_s:
+            return 'rate_limited'
+        if elapsed >= self.heartbeat_s:
+            return None
+        if (latitude, longitude) == (last[0], last[1]):
+            return 'duplicates'
+        if self._moved_m(last, latitude, longitude) < self.min_distance_m:
+            return 'dead_band'
+        return None
+
+    @staticmethod
+    def _moved_m(last, latitude, longitude):
+        return haversine_km(last[0], last[1], latitude, longitude) * 1000
+
+    def suppressed_broadcasts(self, count=1):
+        with self.lock:
+            self.counters['broadcasts_suppressed'] += count
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        dropped = counters['received'] - counters['stored']
+        counters['dropped'] = dropped
+        counters['saved_ratio'] = round(dropped / counters['received'], 3) if counters['received'] else 0.0
+        counters['tracked_ambulances'] = len(self.last)
+        return counters
@@ -0,0 +1,114 @@
+"""Demand heatmap of request origins, kept as counts per map-tile cell.
+
+Each 256 px Web Mercator tile is divided into CELLS_PER_TILE x CELLS_PER_TILE
+cells, and every booking adds one to the cell holding its pickup point at
+every zoom level, for all time, its month and its day. Serving a tile is then
+a range read of at most CELLS_PER_TILE**2 rows, whatever the size of the
+history.
+"""
+import math
+from datetime import datetime
+
+import timeutil
+
+CELLS_PER_TILE = 16
+MAX_LATITUDE = 85.05112878  # Web Mercator limit
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS heatmap_cells (
+        period TEXT NOT NULL,   -- 'all', YYYY-MM or YYYY-MM-DD
+        zoom INTEGER NOT NULL,
+        x INTEGER NOT NULL,     -- cell column at this zoom
+        y INTEGER NOT NULL,     -- cell row at this zoom
+        count INTEGER NOT NULL,
+        PRIMARY KEY (period, zoom, x, y)
+    ) WITHOUT ROWID;
+    ''')
+
+
+def cell_of(lat, lng, zoom):
+    # Web Mercator position of (lat, lng) in cells at this zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    cells = (2 ** zoom) * CELLS_PER_TILE
+    x = (lng + 180) / 360 * cells
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * cells
+    return min(int(x), cells - 1), min(int(y), cells - 1)
+
+
+def periods_of(at_ms):
+    # Undated requests still count towards the all-time map
+    if at_ms is None:
+        return ('all',)
+    at = timeutil.from_ms(at_ms)
+    return ('all', at.strftime('%Y-%m'), at.strftime('%Y-%m-%d'))
+
+
+def record_origin(cursor, lat, lng, min_zoom, max_zoom, at_ms=None):
+    """Count one request origin, made at epoch-ms at_ms (now by default), in every zoom level and time window (caller commits)."""
+    if lat is None or lng is None:
+        return
+    periods = periods_of(at_ms or timeutil.now_ms())
+    rows = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        x, y = cell_of(lat, lng, zoom)
+        rows.extend((period, zoom, x, y) for period in periods)
+    cursor.executemany('''INSERT INTO heatmap_cells (period, zoom, x, y, count) VALUES (?, ?, ?, ?, 1)
+                          ON CONFLICT(period, zoom, x, y) DO UPDATE SET count = count + 1''', rows)
+
+
+def valid_period(period):
+    if period == 'all':
+        return True
+    for fmt in ('%Y-%m', '%Y-%m-%d'):
+        try:
+            datetime.strptime(period, fmt)
+            return True
+        except ValueError:
+            pass
+    return False
+
+
+def tile(cursor, period, zoom, tile_x, tile_y):
+    """JSON-ready tile: [column, row, count] per non-empty cell, relative to the tile's top-left cell."""
+    x0, y0 = tile_x * CELLS_PER_TILE, tile_y * CELLS_PER_TILE
+    cursor.execute('''SELECT x, y, count FROM heatmap_cells
+                      WHERE period = ? AND zoom = ? AND x >= ? AND x < ? AND y >= ? AND y < ?''',
+                   (period, zoom, x0, x0 + CELLS_PER_TILE, y0, y0 + CELLS_PER_TILE))
+    cells = [[x - x0, y - y0, count] for x, y, count in cursor.fetchall()]
+    return {
+        'zoom': zoom, 'x': tile_x, 'y': tile_y, 'period': period,
+        'cells_per_tile': CELLS_PER_TILE,
+        'max': max((cell[2] for cell in cells), default=0),
+        'cells': cells,
+    }
+
+
+def rebuild(conn, min_zoom, max_zoom, source='ambulance_requests'):
+    """Recount every origin from scratch (one full scan, for backfills)."""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM heatmap_cells')
+    rows = conn.execute(f'SELECT origin_lat, origin_lng, request_time_ms FROM {source}').fetchall()
+    for lat, lng, request_time_ms in rows:
+        if lat is None or lng is None:
+            continue
+        periods = periods_of(request_time_ms)
+        for zoom in range(min_zoom, max_zoom + 1):
+            x, y = cell_of(lat, lng, zoom)
+            cursor.executemany('''INSERT INTO heatmap_cells (period, zoom, x, y, count) VALUES (?, ?, ?, ?, 1)
+                                  ON CONFLICT(period, zoom, x, y) DO UPDATE SET count = count + 1''',
+                               [(period, zoom, x, y) for period in periods])
+    conn.commit()
+    return len(rows)
+
+
+if __name__ == '__main__':
+    # Backfill: python heatmap.py
+    import config
+    import shards
+
+    conn = shards.ShardMap('users.db', config.SHARD_REGIONS).connect_all(config.ARCHIVE_DB)
+    count = rebuild(conn, config.HEATMAP_MIN_ZOOM, config.HEATMAP_MAX_ZOOM, 'all_requests')
+    print(f"Rebuilt the heatmap from {count} requests.")
+    conn.close()
@@ -0,0 +1,170 @@
+"""Precomputed nearest-hospital candidates per grid cell of the service area.
+
+The hospital list lives in the hospitals table. For every cell of the
+service area and every configured radius, build() stores, ranked by distance
+from the cell centre, the hospitals that can be among the `candidates`
+nearest within that radius for some point of the cell: those no further
+from the centre than the radius plus half the cell diagonal, and no further
+than the centre's candidates-th nearest hospital plus the whole diagonal. A
+booking then reads its cell's few rows by primary key and re-ranks them by
+the exact distance from the pickup point, which gives the same answer as
+searching the whole list.
+
+refresh() stores a new hospital list and rebuilds the grid only when the
+list or the grid settings changed (their fingerprint is kept with the grid).
+
+    python hospital_grid.py hospitals.csv    (columns: name, address, latitude, longitude)
+"""
+import hashlib
+import math
+import time
+
+from spatial import KM_PER_DEG_LAT, haversine_km
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS hospitals (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        address TEXT,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL
+    );
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS hospital_cells (
+        radius_m INTEGER NOT NULL,
+        cell_row INTEGER NOT NULL,
+        cell_col INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        hospital_id INTEGER NOT NULL,
+        PRIMARY KEY (radius_m, cell_row, cell_col, rank)
+    ) WITHOUT ROWID;
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS hospital_grid (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        fingerprint TEXT NOT NULL,
+        min_lat REAL NOT NULL,
+        min_lng REAL NOT NULL,
+        max_lat REAL NOT NULL,
+        max_lng REAL NOT NULL,
+        cell_deg REAL NOT NULL,
+        radii TEXT NOT NULL,       -- metres, comma-separated, ascending
+        built REAL NOT NULL
+    );
+    ''')
+
+
+def parse_bounds(spec):
+    """(min_lat, min_lng, max_lat, max_lng) from 'min_lat,min_lng,max_lat,max_lng', or None when empty."""
+    if not spec:
+        return None
+    bounds = tuple(float(value) for value in spec.split(','))
+    if len(bounds) != 4 or bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+        raise ValueError(f"Bad service area {spec!r}, expected min_lat,min_lng,max_lat,max_lng")
+    return bounds
+
+
+def cell_of(lat, lng, cell_deg):
+    return math.floor(lat / cell_deg), math.floor(lng / cell_deg)
+
+
+def build(cursor, bounds, cell_deg, radii, candidates):
+    """Recompute every cell's ranked candidates from the hospitals table (caller commits); returns the row count."""
+    hospitals = cursor.execute('SELECT id, latitude, longitude FROM hospitals').fetchall()
+    first_row, first_col = cell_of(bounds[0], bounds[1], cell_deg)
+    last_row, last_col = cell_of(bounds[2], bounds[3], cell_deg)
+    # Half the cell diagonal bounds the distance from its centre to any point in it (a cell is widest at the equator)
+    half_diagonal_km = cell_deg * KM_PER_DEG_LAT * math.sqrt(2) / 2
+
+    rows = []
+    for cell_row in range(first_row, last_row + 1):
+        for cell_col in range(first_col, last_col + 1):
+            lat, lng = (cell_row + 0.5) * cell_deg, (cell_col + 0.5) * cell_deg
+            ranked = sorted((haversine_km(lat, lng, h_lat, h_lng), h_id) for h_id, h_lat, h_lng in hospitals)
+            if not ranked:
+                continue
+            reach_km = ranked[min(candidates, len(ranked)) - 1][0] + 2 * half_diagonal_km
+            for radius_m in radii:
+                limit_km = min(radius_m / 1000 + half_diagonal_km, reach_km)
+                rows.extend((radius_m, cell_row, cell_col, rank, h_id)
+                            for rank, (distance_km, h_id) in enumerate(ranked) if distance_km <= limit_km)
+
+    cursor.execute('DELETE FROM hospital_cells')
+    cursor.executemany('INSERT INTO hospital_cells (radius_m, cell_row, cell_col, rank, hospital_id) VALUES (?, ?, ?, ?, ?)',
+                       rows)
+    return len(rows)
+
+
+def refresh(cursor, hospitals, bounds, cell_deg, radii, candidates):
+    """Store (name, address, lat, lng) hospitals and rebuild the grid if anything changed; returns True when rebuilt."""
+    hospitals = sorted({(name, address or '', round(lat, 6), round(lng, 6)) for name, address, lat, lng in hospitals})
+    radii = sorted(int(radius) for radius in radii)
+    fingerprint = hashlib.sha1(repr((hospitals, bounds, cell_deg, radii, candidates)).encode('utf-8')).hexdigest()
+    current = cursor.execute('SELECT fingerprint FROM hospital_grid WHERE id = 1').fetchone()
+    if current and current[0] == fingerprint:
+        return False
+
+    cursor.execute('DELETE FROM hospitals')
+    cursor.executemany('INSERT INTO hospitals (name, address, latitude, longitude) VALUES (?, ?, ?, ?)', hospitals)
+    build(cursor, bounds, cell_deg, radii, candidates)
+    cursor.execute('''INSERT OR REPLACE INTO hospital_grid (id, fingerprint, min_lat, min_lng, max_lat, max_lng, cell_deg, radii, built)
+                      VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                   (fingerprint, *bounds, cell_deg, ','.join(map(str, radii)), time.time()))
+    return True
+
+
+def lookup(cursor, lat, lng, radius_m, limit):
+    """(hospitals, built) for a point, nearest first, like app.find_nearest_hospitals(); None when the grid can't answer.
+
+    Hospitals are (name, address, distance_km, lat, lng) tuples within radius_m.
+    Points outside the service area and radii above the largest precomputed
+    one are left to the caller.
+    """
+    grid = cursor.execute('SELECT min_lat, min_lng, max_lat, max_lng, cell_deg, radii, built FROM hospital_grid WHERE id = 1').fetchone()
+    if grid is None:
+        return None
+    min_lat, min_lng, max_lat, max_lng, cell_deg, radii, built = grid
+    if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+        return None
+    # The smallest precomputed radius at least as large; its candidates include those of any smaller radius
+    covering = [radius for radius in map(int, radii.split(',')) if radius >= radius_m]
+    if not covering:
+        return None
+
+    cell_row, cell_col = cell_of(lat, lng, cell_deg)
+    cursor.execute('''SELECT h.name, h.address, h.latitude, h.longitude
+                      FROM hospital_cells c JOIN hospitals h ON h.id = c.hospital_id
+                      WHERE c.radius_m = ? AND c.cell_row = ? AND c.cell_col = ?
+                      ORDER BY c.rank''', (covering[0], cell_row, cell_col))
+    found = []
+    for name, address, h_lat, h_lng in cursor.fetchall():
+        distance_km = haversine_km(lat, lng, h_lat, h_lng)
+        if distance_km <= radius_m / 1000:
+            found.append((name, address, distance_km, h_lat, h_lng))
+    found.sort(key=lambda hospital: hospital[2])
+    return found[:limit], built
+
+
+if __name__ == '__main__':
+    # Load a hospital list by hand: python hospital_grid.py hospitals.csv
+    import csv
+    import sqlite3
+    import sys
+
+    import config
+
+    bounds = parse_bounds(config.HOSPITAL_GRID_BOUNDS)
+    if bounds is None:
+        sys.exit("Set HOSPITAL_GRID_BOUNDS to the service area first.")
+    with open(sys.argv[1], newline='', encoding='utf-8') as f:
+        hospitals = [(row['name'], row.get('address'), float(row['latitude']), float(row['longitude']))
+                     for row in csv.DictReader(f)]
+    conn = sqlite3.connect('users.db')
+    rebuilt = refresh(conn.cursor(), hospitals, bounds, config.HOSPITAL_GRID_CELL_DEG,
+                      config.HOSPITAL_GRID_RADII_M, config.HOSPITAL_GRID_CANDIDATES)
+    conn.commit()
+    conn.close()
+    print(f"Grid rebuilt for {len(hospitals)} hospitals." if rebuilt else "Hospital list unchanged; grid kept.")
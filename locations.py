@@ -0,0 +1,127 @@
+"""Validation and storage of ambulance GPS fixes.
+
+Shared by the Flask app and the asyncio gateway (gateway.py), so a fix is
+checked and written the same way whichever process receives it.
+"""
+import math
+
+import timeutil
+
+
+def validate_fix(ambulance_id, latitude, longitude):
+    """(ambulance id, latitude, longitude) as int/float/float; raises ValueError for anything unusable."""
+    try:
+        ambulance_id, latitude, longitude = int(ambulance_id), float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError("Ambulance id, latitude and longitude must be numbers") from None
+    if ambulance_id < 0:
+        raise ValueError("Invalid ambulance id")
+    if not (math.isfinite(latitude) and -90 <= latitude <= 90 and math.isfinite(longitude) and -180 <= longitude <= 180):
+        raise ValueError("Latitude or longitude out of range")
+    return ambulance_id, latitude, longitude
+
+
+def create_tables(cursor):
+    # Fixes stored by gateway.py, waiting for the app's leader to run them through
+    # arrival detection, trip ETAs and the location broadcasts (app.track_gateway_fixes)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS gateway_fixes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ambulance_id INTEGER NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        timestamp_ms INTEGER NOT NULL
+    );
+    ''')
+
+    # Dispatch units report under their own ids, apart from the request-keyed trip fixes above:
+    # the newest position and status of every unit, and the history other workers sync from
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS units (
+        unit_id INTEGER PRIMARY KEY,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        status TEXT,
+        timestamp_ms INTEGER NOT NULL
+    );
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unit_locations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unit_id INTEGER NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        status TEXT,
+        timestamp_ms INTEGER NOT NULL
+    );
+    ''')
+
+
+def queue_gateway_fixes(cursor, fixes):
+    # (ambulance_id, latitude, longitude, timestamp_ms) fixes, in the transaction that stores them
+    cursor.executemany('INSERT INTO gateway_fixes (ambulance_id, latitude, longitude, timestamp_ms) VALUES (?, ?, ?, ?)',
+                       fixes)
+
+
+def take_gateway_fixes(cursor, limit):
+    """Up to `limit` of the oldest queued fixes, removed from the queue (caller commits)."""
+    rows = cursor.execute('''SELECT seq, ambulance_id, latitude, longitude, timestamp_ms FROM gateway_fixes
+                             ORDER BY seq LIMIT ?''', (limit,)).fetchall()
+    if rows:
+        cursor.execute('DELETE FROM gateway_fixes WHERE seq <= ?', (rows[-1][0],))
+    return [row[1:] for row in rows]
+
+
+def record(cursor, ambulance_id, latitude, longitude, status=None, timestamp_ms=None, schema='main'):
+    # Append the fix to the history and upsert the latest-position row in the same transaction; returns its time in ms.
+    # `schema` is where the tables are on this connection: 'core' for a vehicle's fix on a region shard (see shards.py)
+    timestamp_ms = timestamp_ms or timeutil.now_ms()
+    timestamp = timeutil.iso(timestamp_ms)
+    cursor.execute(f'''INSERT INTO {schema}.ambulance_locations (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status)
+                      VALUES (?, ?, ?, ?, ?, ?)''', (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status))
+    cursor.execute(f'''
+        INSERT INTO {schema}.ambulance_latest (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status,
+                                      patient_name, pickup_lat, pickup_lng, destination_lat, destination_lng,
+                                      request_time, request_time_ms, estimated_time_minutes,
+                                      pickup_address, destination_address, route_distance_km)
+        SELECT ?, ?, ?, ?, ?, ?,
+               ar.patient_name, ar.pickup_lat, ar.pickup_lng, ar.destination_lat, ar.destination_lng,
+               ar.request_time, ar.request_time_ms, ar.estimated_time_minutes,
+               ar.pickup_location, ar.destination_address, ar.route_distance_km
+        FROM (SELECT 1) LEFT JOIN {schema}.ambulance_requests ar ON ar.id = ?
+        WHERE true
+        ON CONFLICT(ambulance_id) DO UPDATE SET
+            latitude = excluded.latitude,
+            longitude = excluded.longitude,
+            timestamp = excluded.timestamp,
+            timestamp_ms = excluded.timestamp_ms,
+            status = COALESCE(excluded.status, ambulance_latest.status),
+            patient_name = excluded.patient_name,
+            pickup_lat = excluded.pickup_lat,
+            pickup_lng = excluded.pickup_lng,
+            destination_lat = excluded.destination_lat,
+            destination_lng = excluded.destination_lng,
+            request_time = excluded.request_time,
+            request_time_ms = excluded.request_time_ms,
+            estimated_time_minutes = excluded.estimated_time_minutes,
+            pickup_address = excluded.pickup_address,
+            destination_address = excluded.destination_address,
+            route_distance_km = excluded.route_distance_km
+    ''', (ambulance_id, latitude, longitude, timestamp, timestamp_ms, status, ambulance_id))
+    return timestamp_ms
+
+
+def record_unit(cursor, unit_id, latitude, longitude, status=None, timestamp_ms=None, schema='main'):
+    # A dispatch unit's position and, when given, its new status; returns the fix's time in ms
+    timestamp_ms = timestamp_ms or timeutil.now_ms()
+    cursor.execute(f'''INSERT INTO {schema}.unit_locations (unit_id, latitude, longitude, status, timestamp_ms)
+                       VALUES (?, ?, ?, ?, ?)''', (unit_id, latitude, longitude, status, timestamp_ms))
+    cursor.execute(f'''INSERT INTO {schema}.units (unit_id, latitude, longitude, status, timestamp_ms)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(unit_id) DO UPDATE SET
+                           latitude = excluded.latitude,
+                           longitude = excluded.longitude,
+                           status = COALESCE(excluded.status, units.status),
+                           timestamp_ms = excluded.timestamp_ms''',
+                   (unit_id, latitude, longitude, status, timestamp_ms))
+    return timestamp_ms
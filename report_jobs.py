@@ -0,0 +1,164 @@
+"""PDF report rendering in a process pool, behind a small job API.
+
+reportlab layout is CPU-bound; run in a request thread it holds the GIL and
+delays Socket.IO heartbeats and location handling in the same worker. Jobs are
+rendered in separate processes instead. Their state and finished PDFs live in
+the report_jobs table, so a job submitted to one worker can be polled and
+downloaded through any other. Each worker allows at most max_pending jobs in
+flight and turns further ones away (QueueFull) instead of queueing without
+bound. A pool whose worker process died is replaced by a new one on the next
+job; when even that can't take the job, submit() raises PoolFailed. Both are
+Unavailable, which callers report as "try again later".
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+
+QUEUED, DONE, FAILED = 'queued', 'done', 'failed'
+
+
+class Unavailable(Exception):
+    pass
+
+
+class QueueFull(Unavailable):
+    pass
+
+
+class PoolFailed(Unavailable):
+    pass
+
+
+def create_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        id TEXT PRIMARY KEY,
+        request_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        pdf BLOB,
+        error TEXT,
+        created REAL NOT NULL,
+        finished REAL
+    );
+    ''')
+
+
+def render(report):
+    # Runs in a pool process; reportlab is imported there, never in the web worker
+    import reports
+    return reports.build_report_pdf(report)
+
+
+class ReportJobs:
+    def __init__(self, path, workers=2, max_pending=8, timeout=120, keep_seconds=3600):
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout  # a job still queued after this long was lost with its worker
+        self.keep_seconds = keep_seconds
+        self.pool = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def _pool(self):
+        # Started on first use; spawned processes don't inherit the web worker's threads and sockets
+        with self.lock:
+            if self.pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def _discard(self, pool):
+        # A worker that died breaks its executor for good (it has already cleaned up); the next job starts a new one
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+
+    def _submit(self, report):
+        # (pool, future); a pool that broke since the last job is replaced once
+        pool = self._pool()
+        try:
+            return pool, pool.submit(render, report)
+        except BrokenProcessPool:
+            self._discard(pool)
+        pool = self._pool()
+        return pool, pool.submit(render, report)
+
+    def in_flight(self):
+        return self.pending
+
+    def submit(self, request_id, report):
+        """Queue a report row for rendering and return the job id; raises QueueFull when busy, PoolFailed when broken."""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull()
+            self.pending += 1
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('INSERT INTO report_jobs (id, request_id, status, created) VALUES (?, ?, ?, ?)',
+                     (job_id, request_id, QUEUED, now))
+        conn.execute('DELETE FROM report_jobs WHERE created < ?', (now - self.keep_seconds,))
+        conn.commit()
+        conn.close()
+        try:
+            pool, future = self._submit(report)
+        except Exception as e:
+            self._finish(job_id, None, e)
+            raise PoolFailed(str(e)) from e
+        future.add_done_callback(lambda done: self._done(job_id, pool, done))
+        return job_id
+
+    def _done(self, job_id, pool, future):
+        pdf, error = self._outcome(future)
+        if isinstance(error, BrokenProcessPool):
+            self._discard(pool)
+        self._finish(job_id, pdf, error)
+
+    @staticmethod
+    def _outcome(future):
+        error = future.exception()
+        return (None, error) if error else (future.result(), None)
+
+    def _finish(self, job_id, pdf, error):
+        with self.lock:
+            self.pending -= 1
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('UPDATE report_jobs SET status = ?, pdf = ?, error = ?, finished = ? WHERE id = ?',
+                     (FAILED if error else DONE, pdf, str(error) if error else None, time.time(), job_id))
+        conn.commit()
+        conn.close()
+        if error:
+            print(f"Report job {job_id} failed: {error}")
+
+    def status(self, job_id):
+        """(status, request_id, error) of a job, or None when it is unknown or expired."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        row = conn.execute('SELECT status, request_id, error, created FROM report_jobs WHERE id = ?',
+                           (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        status, request_id, error, created = row
+        if status == QUEUED and time.time() - created > self.timeout:
+            return FAILED, request_id, 'Timed out'
+        return status, request_id, error
+
+    def result(self, job_id):
+        conn = sqlite3.connect(self.path, timeout=30)
+        row = conn.execute('SELECT pdf FROM report_jobs WHERE id = ? AND status = ?', (job_id, DONE)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def wait(self, job_id, timeout):
+        # Poll until the job is finished (by any process); None when it is still running after `timeout`
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            state = self.status(job_id)
+            if state is None or state[0] != QUEUED:
+                return state
+            time.sleep(0.1)
+        return None
@@ -0,0 +1,149 @@
+"""PDF trip reports.
+
+Kept out of app.py so reportlab is only imported when a report is actually
+generated, not on every worker start.
+"""
+import io
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+
+
+def build_report_pdf(report):
+    """Render one ambulance_requests row (as selected by download_pdf) to PDF bytes."""
+    # Unpack the report tuple
+    patient_name, contact, pickup_location, destination, ambulance_type, \
+    origin_lat, origin_lng, destination_lat, destination_lng, status, \
+    estimated_arrival_time, estimated_completion_time, pickup_lat, pickup_lng = report
+
+    # Format datetime fields
+    for time_field in [estimated_arrival_time, estimated_completion_time]:
+        if time_field and time_field != 'Not Available':
+            time_field = datetime.fromisoformat(time_field).strftime('%B %d, %Y %I:%M %p')
+
+    # Create PDF buffer
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    # Create styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=colors.HexColor('#1a365d')
+    )
+    
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading2'],
+        fontSize=14,
+        textColor=colors.HexColor('#2d3748')
+    )
+    
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#4a5568'),
+        spaceAfter=12
+    )
+
+    # Build the document content
+    elements = []
+
+    # Add logo and company info
+    elements.append(Paragraph("SwiftAid", title_style))
+    elements.append(Paragraph("Emergency Medical Services", header_style))
+    elements.append(Spacer(1, 0.2 * inch))
+    elements.append(Paragraph("Contact: +977 1 674 936 890 | support@swiftaid.com", normal_style))
+    
+    # Add horizontal line
+    elements.append(Spacer(1, 0.3 * inch))
+    elements.append(Table([['']], colWidths=[450], style=TableStyle([
+        ('LINEABOVE', (0, 0), (-1, 0), 1, colors.HexColor('#e2e8f0'))
+    ])))
+    elements.append(Spacer(1, 0.3 * inch))
+
+    # Create the main content table
+    data = [
+        ["Patient Information", ""],
+        ["Patient Name:", patient_name],
+        ["Contact:", contact],
+        ["", ""],
+        ["Transport Details", ""],
+        ["Pickup Location:", pickup_location],
+        ["Destination:", destination],
+        ["Ambulance Type:", ambulance_type],
+        ["Status:", status],
+        ["", ""],
+        ["Location Coordinates", ""],
+        ["Origin:", f"Lat: {origin_lat}, Long: {origin_lng}"],
+        ["Destination:", f"Lat: {destination_lat}, Long: {destination_lng}"],
+    ]
+
+    if estimated_completion_time != 'Not Available':
+        data.extend([
+            ["", ""],
+            ["Timing", ""],
+            ["Completion Time:", estimated_completion_time]
+        ])
+
+    # Style the table
+    table_style = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#4a5568')),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        # Style section headers
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2d3748')),
+        ('FONTNAME', (0, 4), (-1, 4), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 4), (-1, 4), 12),
+        ('TEXTCOLOR', (0, 4), (-1, 4), colors.HexColor('#2d3748')),
+        ('FONTNAME', (0, 10), (-1, 10), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 10), (-1, 10), 12),
+        ('TEXTCOLOR', (0, 10), (-1, 10), colors.HexColor('#2d3748')),
+    ])
+
+    if estimated_completion_time != 'Not Available':
+        table_style.add('FONTNAME', (0, 14), (-1, 14), 'Helvetica-Bold')
+        table_style.add('FONTSIZE', (0, 14), (-1, 14), 12)
+        table_style.add('TEXTCOLOR', (0, 14), (-1, 14), colors.HexColor('#2d3748'))
+
+    table = Table(data, colWidths=[2*inch, 4*inch])
+    table.setStyle(table_style)
+    elements.append(table)
+
+    # Add footer
+    elements.append(Spacer(1, inch))
+    footer_text = """Thank you for trusting SwiftAid with your emergency care needs.
+    For more information, visit: www.swiftaid.com"""
+    elements.append(Paragraph(footer_text, ParagraphStyle(
+        'Footer',
+        parent=styles['Italic'],
+        fontSize=8,
+        textColor=colors.HexColor('#718096'),
+        alignment=1
+    )))
+
+    # Build and return the PDF
+    doc.build(elements)
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
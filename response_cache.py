@@ -0,0 +1,75 @@
+"""Conditional GET and short-lived in-process caching for polled JSON endpoints.
+
+Every cached response carries an ETag (and Last-Modified when the data has a
+timestamp), so a client polling an unchanged resource gets an empty 304. The
+TTLCache keeps recently computed results in memory, keyed on the request's
+normalized parameters, so repeated polls skip the expensive work entirely.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from flask import Response, request
+
+
+class TTLCache:
+    """Small thread-safe key/value cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}  # key -> (expires, stored_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (value, stored_at) or None when missing or expired
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < now:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2], entry[1]
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                # Drop expired entries first, then the oldest ones
+                self.entries = {k: e for k, e in self.entries.items() if e[0] >= now}
+                while len(self.entries) >= self.max_entries:
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (now + self.ttl, now, value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def conditional_json(payload, etag=None, last_modified=None, max_age=0):
+    """JSON response that turns into a 304 when the client already has this version.
+
+    `etag` identifies the data version; without one the body itself is hashed.
+    `last_modified` is a datetime or Unix time.
+    """
+    body = json.dumps(payload, separators=(',', ':'))
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag or make_etag(body))
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if max_age:
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True  # may be stored, but revalidate every time
+    return response.make_conditional(request)
+
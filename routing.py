@@ -0,0 +1,109 @@
+"""Road-route geometry for active trips and local progress-along-route ETAs.
+
+A trip's driving route is fetched once from the Directions API and kept as
+an encoded polyline. Each GPS fix is then projected onto the route to get the
+remaining road distance, and the ETA follows from the route's own average
+speed (its duration in traffic over its length). Only a fix further than the
+deviation threshold from the route calls for a new route.
+"""
+import math
+
+from spatial import KM_PER_DEG_LAT, haversine_km
+
+
+def decode_polyline(encoded):
+    # Google's encoded polyline algorithm: zig-zag varints of 1e-5 degree deltas
+    points, index, lat, lng = [], 0, 0, 0
+    while index < len(encoded):
+        for axis in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+            else:
+                lng += delta
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+
+def encode_polyline(points):
+    chunks, previous = [], (0, 0)
+    for lat, lng in points:
+        current = (round(lat * 1e5), round(lng * 1e5))
+        for value in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return ''.join(chunks)
+
+
+def parse_directions(result):
+    """(encoded polyline, duration in seconds) of the first route of a Directions API result, or None."""
+    if not result:
+        return None
+    route = result[0]
+    legs = route.get('legs') or [{}]
+    duration = legs[0].get('duration_in_traffic') or legs[0].get('duration') or {}
+    return route['overview_polyline']['points'], duration.get('value')
+
+
+class Route:
+    __slots__ = ('polyline', 'points', 'cumulative_km', 'length_km', 'duration_s', 'hint')
+
+    SEARCH_AHEAD = 40  # segments checked past the last match before a full scan
+
+    def __init__(self, polyline, duration_s=None):
+        self.polyline = polyline
+        self.points = decode_polyline(polyline)
+        self.cumulative_km = [0.0]
+        for (lat1, lng1), (lat2, lng2) in zip(self.points, self.points[1:]):
+            self.cumulative_km.append(self.cumulative_km[-1] + haversine_km(lat1, lng1, lat2, lng2))
+        self.length_km = self.cumulative_km[-1]
+        self.duration_s = duration_s
+        self.hint = 0  # segment of the last projection; vehicles mostly move forward from it
+
+    def _nearest(self, lat, lng, segments):
+        # (distance in km from the route, segment, fraction along it) of the closest point
+        scale = math.cos(math.radians(lat)) * KM_PER_DEG_LAT
+        best = (float('inf'), 0, 0.0)
+        for i in segments:
+            (lat1, lng1), (lat2, lng2) = self.points[i], self.points[i + 1]
+            # Local flat projection around the fix, in km
+            ax, ay = (lng1 - lng) * scale, (lat1 - lat) * KM_PER_DEG_LAT
+            dx, dy = (lng2 - lng1) * scale, (lat2 - lat1) * KM_PER_DEG_LAT
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / length2))
+            distance = math.hypot(ax + t * dx, ay + t * dy)
+            if distance < best[0]:
+                best = (distance, i, t)
+        return best
+
+    def project(self, lat, lng, max_offset_m):
+        """(offset from the route in metres, remaining route km) for a fix."""
+        segment_count = len(self.points) - 1
+        if segment_count < 1:
+            offset_m = haversine_km(lat, lng, *self.points[0]) * 1000 if self.points else float('inf')
+            return offset_m, 0.0
+        start = max(0, self.hint - 2)
+        distance, i, t = self._nearest(lat, lng, range(start, min(segment_count, self.hint + self.SEARCH_AHEAD)))
+        if distance * 1000 > max_offset_m:
+            distance, i, t = self._nearest(lat, lng, range(segment_count))
+        self.hint = i
+        travelled = self.cumulative_km[i] + t * (self.cumulative_km[i + 1] - self.cumulative_km[i])
+        return distance * 1000, self.length_km - travelled
+
+    def eta_minutes(self, remaining_km, fallback_kmh):
+        # At the route's own average speed when the Directions API gave a duration
+        if self.duration_s and self.length_km > 0:
+            return remaining_km / self.length_km * self.duration_s / 60
+        return remaining_km / fallback_kmh * 60
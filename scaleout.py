@@ -0,0 +1,149 @@
+"""Helpers for running the app in several worker processes.
+
+* Socket.IO emits go through a message queue so a broadcast made in one
+  worker reaches the clients connected to every other worker. Any URL
+  understood by Flask-SocketIO works (redis://, amqp://, ...); sqlite:///path
+  uses a small table in a shared SQLite file instead of an external broker,
+  which is enough for several workers on one machine and for local testing.
+* A lease row in the database elects one leader so the scheduled jobs run in
+  exactly one process.
+* With SOCKETIO_WEBSOCKET_ONLY the long-polling transport is disabled, so a
+  client never needs to hit the same worker twice and no sticky sessions are
+  required at the load balancer.
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from socketio import PubSubManager
+
+
+class SqliteQueueManager(PubSubManager):
+    """Socket.IO client manager that uses a SQLite table as its message queue."""
+    name = 'sqlite'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None, poll_interval=0.05, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS socketio_messages (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            channel TEXT NOT NULL,
+                            payload BLOB NOT NULL,
+                            created REAL NOT NULL
+                        )''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _publish(self, data):
+        conn = self._connect()
+        conn.execute('INSERT INTO socketio_messages (channel, payload, created) VALUES (?, ?, ?)',
+                     (self.channel, pickle.dumps(data), time.time()))
+        conn.commit()
+        conn.close()
+
+    def _listen(self):
+        conn = self._connect()
+        # Only messages published after this worker started are delivered
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_messages').fetchone()[0]
+        last_prune = time.time()
+        while True:
+            rows = conn.execute('SELECT id, payload FROM socketio_messages WHERE id > ? AND channel = ? ORDER BY id',
+                                (last_id, self.channel)).fetchall()
+            for message_id, payload in rows:
+                last_id = message_id
+                yield payload
+            if time.time() - last_prune > self.retention:
+                conn.execute('DELETE FROM socketio_messages WHERE created < ?', (time.time() - self.retention,))
+                conn.commit()
+                last_prune = time.time()
+            if not rows:
+                time.sleep(self.poll_interval)
+
+
+def socketio_options(message_queue=None, websocket_only=False):
+    # Keyword arguments for SocketIO(app, ...) matching the deployment mode
+    options = {}
+    if message_queue:
+        if message_queue.startswith('sqlite:///'):
+            options['client_manager'] = SqliteQueueManager(message_queue[len('sqlite:///'):])
+        else:
+            options['message_queue'] = message_queue
+    if websocket_only:
+        options['transports'] = ['websocket']
+    return options
+
+
+class LeaderLease:
+    """Database lease that makes exactly one process the leader.
+
+    Every process calls renew() periodically; the holder keeps the lease by
+    extending it, anyone else takes it over once it has expired.
+    """
+
+    def __init__(self, path, name='scheduler', ttl=30):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('''CREATE TABLE IF NOT EXISTS leader_lease (
+                            name TEXT PRIMARY KEY,
+                            holder TEXT NOT NULL,
+                            expires REAL NOT NULL
+                        )''')
+        conn.commit()
+        conn.close()
+
+    def renew(self):
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+            # Take the lease if it is free or expired, extend it if it is ours
+            conn.execute('''INSERT INTO leader_lease (name, holder, expires) VALUES (?, ?, ?)
+                            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires
+                            WHERE leader_lease.holder = excluded.holder OR leader_lease.expires < ?''',
+                         (self.name, self.holder, now + self.ttl, now))
+            conn.commit()
+            holder = conn.execute('SELECT holder FROM leader_lease WHERE name = ?', (self.name,)).fetchone()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error renewing leader lease: {e}")
+            holder = None
+
+        was_leader = self.is_leader
+        self.is_leader = bool(holder) and holder[0] == self.holder
+        if self.is_leader != was_leader:
+            print(f"{self.holder} {'became' if self.is_leader else 'is no longer'} the {self.name} leader.")
+        return self.is_leader
+
+    def release(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('DELETE FROM leader_lease WHERE name = ? AND holder = ?', (self.name, self.holder))
+        conn.commit()
+        conn.close()
+        self.is_leader = False
+
+    def run(self):
+        # Heartbeat loop; renews well before the lease runs out
+        while True:
+            self.renew()
+            time.sleep(self.ttl / 3)
+
+    def start(self):
+        self.renew()
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
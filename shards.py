@@ -0,0 +1,181 @@
+"""Region shards for the request and GPS tables.
+
+With SHARD_REGIONS set, ambulance_requests, ambulance_locations and
+ambulance_latest (with the dashboard block versions kept by triggers on the
+requests) are split across one SQLite file per region, so a busy city's
+writes no longer queue behind every other city's and each file can live on
+its own disk. users.db remains the default shard, for requests outside every
+region, for the vehicles' own fixes and for everything from before
+sharding, and keeps all other tables: admins, dashboard deltas, analytics,
+heatmap, report jobs, the leader lease.
+
+A request belongs to the first region whose box contains its origin. Each
+shard hands out request ids from its own block of ID_BLOCK, so the shard of a
+request, and of the fixes stored under its id, follows from the id alone.
+The blocks of all MAX_REGIONS + 1 shards fit in the uint32 ambulance id of
+the binary wire format (wire.py). Location rows get much larger blocks of
+their own, since only their uniqueness across shards and the archive
+matters. Regions can be appended to the list but never reordered or removed.
+
+connect(id) opens the shard holding that id with users.db attached as
+`core`. Tables that only exist there resolve to it, so code written against
+the single database runs unchanged and its writes stay in one transaction.
+connect_all() attaches every shard, and the archive, to users.db for
+cross-shard reads through temporary UNION ALL views. SQLite attaches at most
+10 databases by default: up to 8 regions besides the archive.
+
+    SHARD_REGIONS="north=shards/north.db@28.0,76.5,29.5,78.0;south=shards/south.db@12.5,77.2,13.3,78.0"
+"""
+import os
+import sqlite3
+
+import archive
+
+ID_BLOCK = 2 ** 28
+MAX_REGIONS = 8
+SHARDED_TABLES = ('ambulance_requests', 'ambulance_locations', 'ambulance_latest', 'dashboard_versions')
+# Table -> ids per shard
+ID_SEQUENCES = {'ambulance_requests': ID_BLOCK, 'ambulance_locations': 2 ** 48}
+
+# Cross-shard view -> (table, whether archived rows are included)
+VIEWS = {
+    'all_requests': ('ambulance_requests', True),
+    'all_locations': ('ambulance_locations', True),
+    'live_requests': ('ambulance_requests', False),
+    'live_latest': ('ambulance_latest', False),
+    'live_dashboard_versions': ('dashboard_versions', False),
+}
+
+
+def parse_regions(spec):
+    """[(name, path, (min_lat, min_lng, max_lat, max_lng))] from 'name=path@min_lat,min_lng,max_lat,max_lng;...'."""
+    regions = []
+    for entry in filter(None, (part.strip() for part in (spec or '').split(';'))):
+        try:
+            name, rest = entry.split('=', 1)
+            path, box = rest.rsplit('@', 1)
+            box = tuple(float(value) for value in box.split(','))
+        except ValueError:
+            box = ()
+        if len(box) != 4:
+            raise ValueError(f"Bad shard region {entry!r}, expected name=path@min_lat,min_lng,max_lat,max_lng")
+        regions.append((name.strip(), path.strip(), box))
+    if len(regions) > MAX_REGIONS:
+        raise ValueError(f"At most {MAX_REGIONS} shard regions are supported")
+    return regions
+
+
+def core_schema(cursor):
+    # Schema holding the default database's tables on this connection
+    return 'core' if any(row[1] == 'core' for row in cursor.execute('PRAGMA database_list').fetchall()) else 'main'
+
+
+class ShardMap:
+    """Maps coordinates and ids to shard files; shard 0 is the default database, region i is shard i."""
+
+    def __init__(self, default_path, spec=''):
+        regions = parse_regions(spec)
+        self.names = ['users'] + [name for name, _, _ in regions]
+        self.paths = [default_path] + [path for _, path, _ in regions]
+        self.boxes = [None] + [box for _, _, box in regions]
+
+    @property
+    def sharded(self):
+        return len(self.paths) > 1
+
+    def shard_of_point(self, lat, lng):
+        for index, box in enumerate(self.boxes):
+            if box and box[0] <= lat <= box[2] and box[1] <= lng <= box[3]:
+                return index
+        return 0
+
+    def shard_of_id(self, record_id):
+        try:
+            index = int(record_id) // ID_BLOCK
+        except (TypeError, ValueError):
+            return 0
+        return index if 0 <= index < len(self.paths) else 0
+
+    def path_of_id(self, record_id):
+        return self.paths[self.shard_of_id(record_id)]
+
+    def connect(self, record_id=None, shard=None):
+        """Connection to the shard holding record_id (or to shard number `shard`), with users.db attached as core."""
+        index = self.shard_of_id(record_id) if shard is None else shard
+        conn = sqlite3.connect(self.paths[index])
+        if index:
+            conn.execute('ATTACH DATABASE ? AS core', (self.paths[0],))
+        return conn
+
+    def query_each(self, sql, params=(), exclude=None):
+        # Rows of the same read query run on every shard (except shard `exclude`), concatenated
+        rows = []
+        for index, path in enumerate(self.paths):
+            if index != exclude:
+                conn = sqlite3.connect(path)
+                rows.extend(conn.execute(sql, params).fetchall())
+                conn.close()
+        return rows
+
+    def connect_all(self, archive_path=None):
+        """users.db with every shard, and the archive when it exists, attached; the VIEWS span them all."""
+        conn = sqlite3.connect(self.paths[0])
+        schemas = ['main']
+        for index in range(1, len(self.paths)):
+            conn.execute(f'ATTACH DATABASE ? AS shard_{index}', (self.paths[index],))
+            schemas.append(f'shard_{index}')
+        with_archive = bool(archive_path) and os.path.exists(archive_path)
+        if with_archive:
+            archive.attach(conn, archive_path)
+
+        for view, (table, archived) in VIEWS.items():
+            sources = schemas + ['archive'] if archived and with_archive else schemas
+            if len(sources) == 1:
+                conn.execute(f'CREATE TEMP VIEW {view} AS SELECT * FROM main.{table}')
+                continue
+            # The shards' tables are widened to the default's columns at startup
+            column_list = ', '.join(archive.columns(conn, 'main', table))
+            conn.execute(f'CREATE TEMP VIEW {view} AS ' +
+                         ' UNION ALL '.join(f'SELECT {column_list} FROM {schema}.{table}' for schema in sources))
+        return conn
+
+    def create_tables(self):
+        """Create or widen the sharded tables, their indexes and triggers in every region file, from users.db's schema."""
+        for index in range(1, len(self.paths)):
+            directory = os.path.dirname(self.paths[index])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self.connect(shard=index)
+            conn.execute('PRAGMA journal_mode=WAL')
+            placeholders = ', '.join('?' for _ in SHARDED_TABLES)
+            schema = conn.execute(f'''SELECT type, name, tbl_name, sql FROM core.sqlite_master
+                                      WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+                                      ORDER BY type = 'table' DESC''', SHARDED_TABLES).fetchall()
+            for kind, name, table, sql in schema:
+                if kind == 'table':
+                    existing = archive.columns(conn, 'main', table)
+                    if not existing:
+                        conn.execute(sql)
+                        continue
+                    # Columns added to the default's table since the shard was created
+                    for column, column_type in conn.execute('SELECT name, type FROM pragma_table_info(?, ?)',
+                                                            (table, 'core')).fetchall():
+                        if column not in existing:
+                            conn.execute(f'ALTER TABLE main.{table} ADD COLUMN {column} {column_type}')
+                elif kind == 'index':
+                    conn.execute(sql.replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+                elif kind == 'trigger':
+                    conn.execute(f'DROP TRIGGER IF EXISTS main.{name}')
+                    conn.execute(sql)
+            # This shard's ids start at its own block
+            for table, block in ID_SEQUENCES.items():
+                conn.execute('''INSERT INTO main.sqlite_sequence (name, seq) SELECT ?, ?
+                                WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = ?)''',
+                             (table, index * block, table))
+                seq = conn.execute('SELECT seq FROM main.sqlite_sequence WHERE name = ?', (table,)).fetchone()[0]
+                if not index * block <= seq < (index + 1) * block:
+                    conn.close()
+                    raise ValueError(f"{table} ids in {self.paths[index]} ({seq}) are outside the shard's block "
+                                     f"{index * block}-{(index + 1) * block - 1}")
+            conn.commit()
+            conn.close()
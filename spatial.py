@@ -0,0 +1,118 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    # Great-circle distance in kilometers
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Uniform lat/lng grid holding points keyed by id.
+
+    Inserts, moves and removals are O(1); nearest-neighbour queries only
+    look at the rings of cells around the query point.
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self.cells = {}   # (row, col) -> {key: (lat, lng)}
+        self.points = {}  # key -> (lat, lng, (row, col))
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def cell_of(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def insert(self, key, lat, lng):
+        cell = self.cell_of(lat, lng)
+        old = self.points.get(key)
+        if old is not None and old[2] != cell:
+            self._discard(key, old[2])
+        self.cells.setdefault(cell, {})[key] = (lat, lng)
+        self.points[key] = (lat, lng, cell)
+
+    def remove(self, key):
+        old = self.points.pop(key, None)
+        if old is not None:
+            self._discard(key, old[2])
+        return old is not None
+
+    def get(self, key):
+        point = self.points.get(key)
+        return (point[0], point[1]) if point else None
+
+    def _discard(self, key, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.cells[cell]
+
+    def ring(self, cell, radius):
+        # Cells exactly `radius` steps away from `cell` (the border of a square)
+        row, col = cell
+        if radius == 0:
+            yield cell
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield (row - radius, c)
+            yield (row + radius, c)
+        for r in range(row - radius + 1, row + radius):
+            yield (r, col - radius)
+            yield (r, col + radius)
+
+    def nearby(self, lat, lng, radius=1):
+        # All points in the block of cells around (lat, lng)
+        center = self.cell_of(lat, lng)
+        for step in range(radius + 1):
+            for cell in self.ring(center, step):
+                bucket = self.cells.get(cell)
+                if bucket:
+                    yield from bucket.items()
+
+    def nearest(self, lat, lng, k=1, max_km=None):
+        """Return up to k (key, distance_km) pairs sorted by distance."""
+        if not self.points or k <= 0:
+            return []
+
+        center = self.cell_of(lat, lng)
+        # Smallest side of a cell in km near the query point; after searching
+        # ring r every point closer than r * cell_km has been seen.
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * max(math.cos(math.radians(abs(lat) + self.cell_deg)), 0.01)
+
+        found = []
+        seen = 0
+        step = 0
+        while True:
+            for cell in self.ring(center, step):
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                seen += len(bucket)
+                for key, (p_lat, p_lng) in bucket.items():
+                    found.append((haversine_km(lat, lng, p_lat, p_lng), key))
+
+            covered_km = step * cell_km
+            if seen >= len(self.points):
+                break
+            if max_km is not None and covered_km >= max_km:
+                break
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= covered_km:
+                    break
+            step += 1
+
+        found.sort()
+        if max_km is not None:
+            found = [item for item in found if item[0] <= max_km]
+        return [(key, distance) for distance, key in found[:k]]
@@ -18,3 +18,88 @@ deleteModal.addEventListener('show.bs.modal', function (event) {
         deleteForm.submit();
     }
 });
+
+// Live updates: apply the deltas pushed by the server, in sequence order
+var requestRows = document.getElementById('request-rows');
+var lastSeq = parseInt(requestRows.getAttribute('data-seq'), 10) || 0;
+var filtered = requestRows.getAttribute('data-filtered') === '1';
+var socket = io();
+
+function setCounts(counts) {
+    var total = 0;
+    for (var status in counts) {
+        total += counts[status];
+    }
+    document.querySelectorAll('[data-count]').forEach(function (box) {
+        var key = box.getAttribute('data-count');
+        if (key === 'total') {
+            // A search shows its own number of matches
+            if (!filtered) box.textContent = total;
+        } else {
+            box.textContent = counts[key] || 0;
+        }
+    });
+}
+
+function setStatus(row, status) {
+    var cell = row.cells[4];
+    var select = cell.querySelector('select[name="status"]');
+    if (status === 'Patient Reached') {
+        cell.innerHTML = '<span class="text-success fw-bold">Completed</span>';
+    } else if (select) {
+        select.value = status;
+    }
+}
+
+function setEta(row, values) {
+    // Same rule as _request_row.html: completion estimate once the patient is on board, arrival estimate before
+    var eta = null;
+    if (values.status === 'Patient Received') {
+        eta = values.estimated_completion_time;
+    } else if (values.status !== 'Patient Reached' && values.status !== 'Rejected') {
+        eta = values.estimated_arrival_time;
+    }
+    row.cells[5].textContent = eta ? eta.substring(11, 16) : '-';
+}
+
+function applyDelta(event) {
+    if (event.seq <= lastSeq) {
+        return;  // already shown
+    }
+    lastSeq = event.seq;
+    var row = document.getElementById('request-' + event.id);
+
+    if (event.kind === 'deleted') {
+        if (row) row.remove();
+    } else if (event.kind === 'created') {
+        if (!row && !filtered && event.html) {
+            requestRows.insertAdjacentHTML('beforeend', event.html);
+        }
+    } else if (row && event.row) {
+        setStatus(row, event.row.status);
+        setEta(row, event.row);
+    }
+    setCounts(event.counts);
+}
+
+socket.on('connect', function () {
+    // Also sent after a reconnect, to catch up on everything missed meanwhile
+    socket.emit('dashboard_subscribe', {since: lastSeq});
+});
+
+socket.on('dashboard_backlog', function (data) {
+    if (data.reload) {
+        window.location.reload();  // too far behind to catch up with deltas
+        return;
+    }
+    data.events.forEach(applyDelta);
+});
+
+socket.on('dashboard_delta', function (event) {
+    if (event.seq > lastSeq + 1) {
+        // Missed one (they can arrive out of order from different workers): fetch the gap first
+        socket.emit('dashboard_subscribe', {since: lastSeq});
+        return;
+    }
+    applyDelta(event);
+});
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import backup
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'users.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE fixes (id INTEGER PRIMARY KEY, payload TEXT)')
+    conn.executemany('INSERT INTO fixes (payload) VALUES (?)', [('x' * 200,)] * 2000)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM fixes').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_a_checked_copy(database, tmp_path):
+    directory = str(tmp_path / 'backups')
+    stats = backup.snapshot(database, directory, pages_per_step=8, pause=0)
+
+    assert backup.snapshots(directory) == [stats['path']]
+    assert not [name for name in os.listdir(directory) if name.endswith('.partial')]
+    assert backup.check(stats['path']) is None
+    assert count(stats['path']) == 2000
+    assert stats['steps'] > 1 and stats['bytes'] == os.path.getsize(stats['path'])
+
+
+def test_snapshot_during_writes_stays_consistent(database, tmp_path):
+    stop = threading.Event()
+
+    def write():
+        conn = sqlite3.connect(database, timeout=30)
+        while not stop.is_set():
+            conn.execute('INSERT INTO fixes (payload) VALUES (?)', ('y' * 200,))
+            conn.commit()
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        stats = backup.snapshot(database, str(tmp_path / 'backups'), pages_per_step=4, pause=0.001, max_restarts=3)
+    finally:
+        stop.set()
+        writer.join()
+    assert backup.check(stats['path']) is None
+    assert 2000 <= count(stats['path']) <= count(database)
+
+
+def test_failed_integrity_check_keeps_no_file(database, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'backups')
+    monkeypatch.setattr(backup, 'check', lambda path: 'database disk image is malformed')
+    with pytest.raises(backup.SnapshotFailed):
+        backup.snapshot(database, directory)
+    assert os.listdir(directory) == []
+
+
+def test_check_reports_a_corrupt_file(tmp_path):
+    path = tmp_path / 'corrupt.db'
+    path.write_bytes(b'SQLite format 3\0' + os.urandom(4096))
+    assert backup.check(str(path))
+
+
+def test_rotation_keeps_the_newest(database, tmp_path):
+    directory = tmp_path / 'backups'
+    directory.mkdir()
+    old = [directory / f'users-2026010{day}-000000.db' for day in range(1, 5)]
+    for path in old:
+        path.write_bytes(b'')
+    (directory / 'other-20260101-000000.db').write_bytes(b'')
+
+    stats = backup.snapshot(database, str(directory), keep=2)
+    assert stats['removed'] == 3
+    assert backup.snapshots(str(directory)) == [str(old[-1]), stats['path']]
+    assert (directory / 'other-20260101-000000.db').exists()
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from dispatch import min_cost_assignment
+
+
+def brute_force(costs):
+    # (rows served, total cost) of the best matching, by trying every one
+    best = (0, 0.0)
+
+    def extend(row, used, served, total):
+        nonlocal best
+        if row == len(costs):
+            if served > best[0] or (served == best[0] and total < best[1]):
+                best = (served, total)
+            return
+        extend(row + 1, used, served, total)
+        for col, cost in costs[row]:
+            if col not in used:
+                extend(row + 1, used | {col}, served + 1, total + cost)
+
+    extend(0, frozenset(), 0, 0.0)
+    return best
+
+
+def summarize(costs, matched):
+    assert len(set(matched.values())) == len(matched)
+    return len(matched), sum(dict(costs[row])[col] for row, col in matched.items())
+
+
+def test_serves_every_row_that_can_be_served():
+    # Saving travel time must never leave a patient unserved
+    costs = [[(1, 7.18)],
+             [(5, 4.37), (3, 7.59)],
+             [(2, 8.37), (1, 0.78)],
+             [(3, 1.34), (0, 3.85), (5, 4.31), (2, 4.8)],
+             [(1, 9.97), (4, 8.25), (3, 6.72), (2, 0.26)]]
+    matched = min_cost_assignment(costs)
+    assert len(matched) == 5
+    assert summarize(costs, matched) == pytest.approx(brute_force(costs))
+
+
+def test_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(1000):
+        rows, cols = rng.randint(1, 6), rng.randint(1, 6)
+        costs = [[(col, round(rng.uniform(0, 10), 2)) for col in rng.sample(range(cols), rng.randint(0, cols))]
+                 for _ in range(rows)]
+        assert summarize(costs, min_cost_assignment(costs)) == pytest.approx(brute_force(costs))
+
+
+def test_empty():
+    assert min_cost_assignment([]) == {}
+    assert min_cost_assignment([[], []]) == {}
@@ -0,0 +1,58 @@
+import random
+import sqlite3
+
+import pytest
+
+import hospital_grid
+from spatial import haversine_km
+
+BOUNDS = (12.80, 77.45, 13.10, 77.75)
+RADII = (2000, 5000, 10000)
+CANDIDATES = 5
+
+
+@pytest.fixture
+def grid():
+    rng = random.Random(49)
+    # Scattered hospitals plus a dense cluster, some just outside the service area
+    hospitals = [(f'H{i}', None, rng.uniform(12.75, 13.15), rng.uniform(77.40, 77.80)) for i in range(150)]
+    hospitals += [(f'C{i}', None, rng.gauss(12.97, 0.01), rng.gauss(77.59, 0.01)) for i in range(50)]
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    hospital_grid.create_tables(cursor)
+    assert hospital_grid.refresh(cursor, hospitals, BOUNDS, 0.02, RADII, CANDIDATES)
+    yield cursor
+    conn.close()
+
+
+def brute_force(cursor, lat, lng, radius_m, limit):
+    found = []
+    for name, h_lat, h_lng in cursor.execute('SELECT name, latitude, longitude FROM hospitals'):
+        distance_km = haversine_km(lat, lng, h_lat, h_lng)
+        if distance_km <= radius_m / 1000:
+            found.append((distance_km, name))
+    return sorted(found)[:limit]
+
+
+def test_lookup_matches_brute_force_inside_the_bounds(grid):
+    rng = random.Random(7)
+    for _ in range(2000):
+        lat, lng = rng.uniform(BOUNDS[0], BOUNDS[2]), rng.uniform(BOUNDS[1], BOUNDS[3])
+        radius_m = rng.choice((500, 2000, 3500, 5000, 10000))
+        limit = rng.randint(1, CANDIDATES)
+        hospitals, _ = hospital_grid.lookup(grid, lat, lng, radius_m, limit)
+        expected = brute_force(grid, lat, lng, radius_m, limit)
+        assert [distance for _, _, distance, _, _ in hospitals] == pytest.approx([distance for distance, _ in expected])
+        assert [name for name, *_ in hospitals] == [name for _, name in expected]
+
+
+def test_lookup_leaves_what_it_cannot_answer_to_the_caller(grid):
+    assert hospital_grid.lookup(grid, 13.2, 77.6, 5000, 3) is None     # outside the service area
+    assert hospital_grid.lookup(grid, 12.97, 77.59, 20000, 3) is None  # radius above the largest precomputed one
+
+
+def test_refresh_skips_an_unchanged_list(grid):
+    hospitals = [(name, address, lat, lng) for name, address, lat, lng in
+                 grid.execute('SELECT name, address, latitude, longitude FROM hospitals')]
+    assert not hospital_grid.refresh(grid, hospitals, BOUNDS, 0.02, RADII, CANDIDATES)
+    assert hospital_grid.refresh(grid, hospitals[1:], BOUNDS, 0.02, RADII, CANDIDATES)
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import report_jobs
+
+pytest.importorskip('reportlab')
+
+REPORT = ('Patient', '555-0100', 'Pickup Rd', 'City Hospital', 'Basic', 12.97, 77.59, 12.93, 77.62,
+          'Pending', 'Not Available', 'Not Available', 12.97, 77.59)
+
+
+class Crash:
+    # Unpickling it in the pool process kills that process, like a segfault in reportlab would
+    def __reduce__(self):
+        return os._exit, (1,)
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(path)
+    report_jobs.create_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+    jobs = report_jobs.ReportJobs(path, workers=1)
+    yield jobs
+    if jobs.pool:
+        jobs.pool.shutdown()
+
+
+def test_concurrent_first_submits_share_one_pool(jobs):
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def first_use():
+        barrier.wait()
+        pools.append(jobs._pool())
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(pool) for pool in pools}) == 1
+
+
+def test_worker_crash_fails_the_job_and_the_next_job_gets_a_new_pool(jobs):
+    crashed = jobs.submit(1, Crash())
+    status, request_id, error = jobs.wait(crashed, 60)
+    assert (status, request_id) == (report_jobs.FAILED, 1) and error
+    assert jobs.pool is None and jobs.in_flight() == 0
+
+    job_id = jobs.submit(2, REPORT)
+    assert jobs.wait(job_id, 60)[0] == report_jobs.DONE
+    assert jobs.result(job_id).startswith(b'%PDF')
+
+
+def test_pool_broken_before_submit_is_replaced(jobs):
+    jobs.pool = BrokenPool()
+    job_id = jobs.submit(1, REPORT)
+    assert jobs.wait(job_id, 60)[0] == report_jobs.DONE
+
+
+def test_pool_that_cannot_take_jobs_raises_pool_failed(jobs, monkeypatch):
+    monkeypatch.setattr(jobs, '_pool', BrokenPool)
+    with pytest.raises(report_jobs.PoolFailed):
+        jobs.submit(1, REPORT)
+    assert jobs.in_flight() == 0
@@ -0,0 +1,99 @@
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+
+from scaleout import LeaderLease, SqliteQueueManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def listen(manager, count, received, ready):
+    # Collect `count` messages other than the pings that tell the test the listener is running
+    for payload in manager._listen():
+        message = pickle.loads(payload)
+        if message == 'ping':
+            ready.set()
+            continue
+        received.append(message)
+        if len(received) == count:
+            return
+
+
+def start_listener(manager, count, publisher):
+    received, ready = [], threading.Event()
+    thread = threading.Thread(target=listen, args=(manager, count, received, ready), daemon=True)
+    thread.start()
+    # Messages published before a listener starts are not delivered: ping until this one gets them
+    while not ready.wait(0.02):
+        publisher._publish('ping')
+    return thread, received
+
+
+def test_messages_from_another_process_arrive_in_order(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    first = SqliteQueueManager(path, poll_interval=0.01)
+    second = SqliteQueueManager(path, poll_interval=0.01)
+    listeners = [start_listener(manager, 20, first) for manager in (first, second)]
+
+    # A separate worker process publishes through its own manager
+    code = ('from scaleout import SqliteQueueManager\n'
+            f'manager = SqliteQueueManager({path!r})\n'
+            'for i in range(20):\n'
+            "    manager._publish({'seq': i})\n")
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+    for thread, received in listeners:
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+        assert received == [{'seq': i} for i in range(20)]
+
+
+def test_channels_are_separate(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    listener = SqliteQueueManager(path, channel='a', poll_interval=0.01)
+    other = SqliteQueueManager(path, channel='b')
+    thread, received = start_listener(listener, 1, listener)
+    other._publish('for b')
+    listener._publish('for a')
+    thread.join(timeout=10)
+    assert received == ['for a']
+
+
+def test_one_leader_at_a_time(tmp_path):
+    path = str(tmp_path / 'lease.db')
+    first, second = LeaderLease(path, ttl=30), LeaderLease(path, ttl=30)
+    assert first.renew()
+    assert not second.renew()
+    # The holder keeps it by renewing
+    assert first.renew()
+    assert not second.renew()
+
+
+def test_takeover_after_expiry(tmp_path):
+    path = str(tmp_path / 'lease.db')
+    first, second = LeaderLease(path, ttl=0.3), LeaderLease(path, ttl=0.3)
+    assert first.renew()
+
+    # Renewed in time, the lease stays with its holder past the original TTL
+    for _ in range(4):
+        time.sleep(0.1)
+        assert first.renew()
+        assert not second.renew()
+
+    # The holder stops renewing: once the TTL has passed the other process takes over, and only it leads
+    time.sleep(0.4)
+    assert second.renew()
+    assert not first.renew()
+    assert (first.is_leader, second.is_leader) == (False, True)
+
+
+def test_release_hands_over_immediately(tmp_path):
+    path = str(tmp_path / 'lease.db')
+    first, second = LeaderLease(path, ttl=30), LeaderLease(path, ttl=30)
+    assert first.renew()
+    first.release()
+    assert not first.is_leader
+    assert second.renew()
@@ -0,0 +1,61 @@
+import struct
+
+import pytest
+
+import shards
+import wire
+
+
+def test_fix_round_trip():
+    fixes = [(1, 12.9715987, 77.5945627, 0), (4294967295, -90, -180, 2.5), (7, 90, 180, 6553.5)]
+    payload = b''.join(wire.encode_fix(*fix) for fix in fixes)
+    assert len(payload) == len(fixes) * wire.FIX.size == len(fixes) * 14
+
+    for (ambulance_id, lat, lng, age_s), decoded in zip(fixes, wire.decode_fixes(payload)):
+        assert decoded[0] == ambulance_id
+        assert decoded[1] == pytest.approx(lat, abs=1e-7)
+        assert decoded[2] == pytest.approx(lng, abs=1e-7)
+        assert decoded[3] == age_s
+
+
+def test_fix_age_is_clamped():
+    # Older fixes still go out, with the largest age the field can hold
+    (_, _, _, age_s), = wire.decode_fixes(wire.encode_fix(1, 0, 0, age_s=1e6))
+    assert age_s == wire.MAX_AGE_DS / 10
+
+
+@pytest.mark.parametrize('payload', [b'', b'\0' * 13, b'\0' * 15])
+def test_decode_fixes_rejects_bad_lengths(payload):
+    with pytest.raises(ValueError):
+        list(wire.decode_fixes(payload))
+
+
+def test_location_update_round_trip():
+    payload = wire.encode_location_update(42, 28.6139391, 77.2090212, 12.3456, 17.891)
+    assert len(payload) == wire.LOCATION_UPDATE.size
+    ambulance_id, lat, lng, distance_km, eta_minutes = wire.decode_location_update(payload)
+    assert ambulance_id == 42
+    assert lat == pytest.approx(28.6139391, abs=1e-7)
+    assert lng == pytest.approx(77.2090212, abs=1e-7)
+    assert distance_km == pytest.approx(12.3456, abs=1e-3)
+    assert eta_minutes == pytest.approx(17.891, abs=1e-2)
+
+
+@pytest.mark.parametrize('ambulance_id', [-1, 2**32])
+def test_ids_outside_uint32_are_rejected(ambulance_id):
+    with pytest.raises(struct.error):
+        wire.encode_fix(ambulance_id, 0, 0)
+    with pytest.raises(struct.error):
+        wire.encode_location_update(ambulance_id, 0, 0, 1, 1)
+
+
+def test_negative_distance_is_rejected():
+    with pytest.raises(struct.error):
+        wire.encode_location_update(1, 0, 0, -0.5, 1)
+
+
+def test_every_shard_id_fits_the_wire():
+    # Ambulance ids are request ids; the last one the last region shard can hand out must still encode
+    last_id = (shards.MAX_REGIONS + 1) * shards.ID_BLOCK - 1
+    assert wire.decode_location_update(wire.encode_location_update(last_id, 0, 0, 1, 1))[0] == last_id
+    assert next(wire.decode_fixes(wire.encode_fix(last_id, 0, 0)))[0] == last_id
@@ -0,0 +1,57 @@
+"""The one place where timestamps are converted.
+
+Times are stored as integer milliseconds since the Unix epoch (the *_ms
+columns), so ordering, range scans and interval arithmetic are plain integer
+comparisons on indexed columns. The older text columns are still written for
+display and for anything reading them, but are never parsed on a hot path.
+
+to_ms() accepts every representation found in older rows: ISO strings with
+'T' or a space (as written by datetime.isoformat() and by str(datetime)),
+datetime objects, and epoch seconds or milliseconds. Naive values are local
+time, as datetime.now() produced them.
+"""
+import time
+from datetime import datetime
+
+# Epoch numbers above this are milliseconds, below it seconds (it is 2001-09-09 in ms, year 33658 in s)
+MS_THRESHOLD = 1_000_000_000_000
+
+
+def now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(value):
+    """Epoch milliseconds for a stored or submitted timestamp, or None when there is none / it can't be read."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return round(value.timestamp() * 1000)
+    if isinstance(value, (int, float)):
+        return int(value) if abs(value) >= MS_THRESHOLD else round(value * 1000)
+    try:
+        return round(datetime.fromisoformat(str(value).strip()).timestamp() * 1000)
+    except ValueError:
+        try:
+            return to_ms(float(value))
+        except ValueError:
+            return None
+
+
+def from_ms(ms):
+    return datetime.fromtimestamp(ms / 1000) if ms is not None else None
+
+
+def iso(ms):
+    # Text form written next to the _ms columns
+    return from_ms(ms).isoformat() if ms is not None else None
+
+
+def after_ms(minutes, start_ms=None):
+    return (now_ms() if start_ms is None else start_ms) + round(minutes * 60_000)
+
+
+def minutes_between(start_ms, end_ms):
+    if start_ms is None or end_ms is None:
+        return None
+    return (end_ms - start_ms) / 60_000
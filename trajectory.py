@@ -0,0 +1,108 @@
+"""In-memory recent trajectories of the ambulances.
+
+Each ambulance gets a fixed-capacity ring buffer of its last fixes, stored in
+typed arrays (latitude, longitude, epoch seconds) instead of lists of tuples.
+Every point is written twice, at i and i + capacity, so the last n points are
+always one contiguous slice and window() can hand out memoryviews without
+copying. The store holds at most max_ambulances buffers, dropping the least
+recently updated one, so its memory is bounded by
+max_ambulances * capacity * 3 arrays * 2 copies * 8 bytes.
+
+Buffers are per process and filled from the fixes this worker stores; an
+ambulance that is not in memory yet is loaded from SQLite on first use.
+"""
+import threading
+from array import array
+from collections import OrderedDict
+
+from spatial import haversine_km
+
+
+class Trajectory:
+    __slots__ = ('ambulance_id', 'capacity', 'lat', 'lng', 'ts', 'next', 'size')
+
+    def __init__(self, ambulance_id, capacity):
+        self.ambulance_id = ambulance_id
+        self.capacity = capacity
+        zeros = bytes(8 * 2 * capacity)
+        self.lat = array('d', zeros)
+        self.lng = array('d', zeros)
+        self.ts = array('d', zeros)
+        self.next = 0  # slot of the next point, 0 <= next < capacity
+        self.size = 0
+
+    def append(self, latitude, longitude, timestamp):
+        i, mirror = self.next, self.next + self.capacity
+        self.lat[i] = self.lat[mirror] = latitude
+        self.lng[i] = self.lng[mirror] = longitude
+        self.ts[i] = self.ts[mirror] = timestamp
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def window(self, n=None):
+        """(latitudes, longitudes, timestamps) of the last n points, oldest first, as memoryviews."""
+        n = self.size if n is None else min(n, self.size)
+        end = self.next + self.capacity
+        start = end - n
+        return (memoryview(self.lat)[start:end], memoryview(self.lng)[start:end],
+                memoryview(self.ts)[start:end])
+
+    def last(self):
+        if not self.size:
+            return None
+        i = self.next - 1 + self.capacity
+        return self.lat[i], self.lng[i], self.ts[i]
+
+    def speed_kmh(self, n=None):
+        # Distance over time across the last n points (all of them by default)
+        lat, lng, ts = self.window(n)
+        if len(ts) < 2 or ts[-1] <= ts[0]:
+            return None
+        distance_km = sum(haversine_km(lat[i - 1], lng[i - 1], lat[i], lng[i]) for i in range(1, len(ts)))
+        return distance_km / ((ts[-1] - ts[0]) / 3600)
+
+
+class TrajectoryStore:
+    def __init__(self, capacity=128, max_ambulances=2048, loader=None):
+        self.capacity = capacity
+        self.max_ambulances = max_ambulances
+        self.loader = loader  # ambulance id -> [(lat, lng, epoch seconds)] oldest first, for cold buffers
+        self.trajectories = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _create(self, ambulance_id):
+        trajectory = self.trajectories[ambulance_id] = Trajectory(ambulance_id, self.capacity)
+        while len(self.trajectories) > self.max_ambulances:
+            self.trajectories.popitem(last=False)
+        return trajectory
+
+    def append(self, ambulance_id, latitude, longitude, timestamp):
+        with self.lock:
+            trajectory = self.trajectories.get(ambulance_id)
+            if trajectory is None:
+                trajectory = self._create(ambulance_id)
+            else:
+                self.trajectories.move_to_end(ambulance_id)
+            trajectory.append(latitude, longitude, timestamp)
+
+    def get(self, ambulance_id):
+        """The ambulance's trajectory, loading it on first use; None when it has no fixes."""
+        with self.lock:
+            trajectory = self.trajectories.get(ambulance_id)
+        if trajectory is None and self.loader:
+            points = self.loader(ambulance_id, self.capacity)
+            if points:
+                with self.lock:
+                    trajectory = self.trajectories.get(ambulance_id)
+                    if trajectory is None:
+                        trajectory = self._create(ambulance_id)
+                        for point in points:
+                            trajectory.append(*point)
+        return trajectory
+
+    def forget(self, ambulance_id):
+        with self.lock:
+            self.trajectories.pop(ambulance_id, None)
+
+    def memory_bytes(self):
+        return len(self.trajectories) * self.capacity * 3 * 2 * 8
@@ -0,0 +1,56 @@
+"""Compact binary encoding of GPS fixes and location broadcasts.
+
+Clients on slow links can send `update_location` as bytes instead of a JSON
+dict, and ask (event `wire_format`, 'binary') to receive `location_update` as
+bytes too. Both are fixed-layout little-endian records with coordinates in
+1e-7 degrees (about 1 cm), so a fix costs 14 bytes instead of ~70 of JSON:
+
+    fix (uplink, one or more per message)
+        uint32  ambulance id
+        int32   latitude  * 1e7
+        int32   longitude * 1e7
+        uint16  age of the fix in 1/10 s when sent (0 = now), so a client can
+                batch buffered fixes and keep their times
+
+    location update (downlink, one per message)
+        uint32  ambulance id
+        int32   latitude  * 1e7
+        int32   longitude * 1e7
+        uint32  distance to the destination in metres
+        uint32  ETA in 1/100 minutes
+
+Decoding yields plain tuples straight from struct; no dict is built per fix.
+The same fix layout is accepted over HTTP with Content-Type MIMETYPE.
+"""
+import struct
+
+MIMETYPE = 'application/x-ambulance-fix'
+
+FIX = struct.Struct('<IiiH')
+LOCATION_UPDATE = struct.Struct('<IiiII')
+
+SCALE = 10_000_000
+MAX_AGE_DS = 0xFFFF
+
+
+def encode_fix(ambulance_id, latitude, longitude, age_s=0):
+    return FIX.pack(ambulance_id, round(latitude * SCALE), round(longitude * SCALE),
+                    min(round(age_s * 10), MAX_AGE_DS))
+
+
+def decode_fixes(payload):
+    """Yield (ambulance_id, latitude, longitude, age_seconds) for every fix in the payload."""
+    if not payload or len(payload) % FIX.size:
+        raise ValueError(f"Fix payload must be a non-empty multiple of {FIX.size} bytes")
+    for ambulance_id, latitude, longitude, age_ds in FIX.iter_unpack(payload):
+        yield ambulance_id, latitude / SCALE, longitude / SCALE, age_ds / 10
+
+
+def encode_location_update(ambulance_id, latitude, longitude, distance_km, eta_minutes):
+    return LOCATION_UPDATE.pack(int(ambulance_id), round(latitude * SCALE), round(longitude * SCALE),
+                                round(distance_km * 1000), round(eta_minutes * 100))
+
+
+def decode_location_update(payload):
+    ambulance_id, latitude, longitude, distance_m, eta_cmin = LOCATION_UPDATE.unpack(payload)
+    return ambulance_id, latitude / SCALE, longitude / SCALE, distance_m / 1000, eta_cmin / 100
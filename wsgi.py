@@ -0,0 +1,5 @@
+# Entry point for a WSGI server, e.g. gunicorn -k eventlet -w 1 wsgi:app
+from app import create_app, start_background_services
+
+app = create_app()
+start_background_services()